@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""rtr_bench"""
+
+import sys
+import os
+import io
+import getopt
+import time
+import json
+import random
+import platform
+import resource
+import tempfile
+import contextlib
+import ipaddress
+import multiprocessing
+
+try:
+	from rtr_protocol import rfc8210router
+	from rtr_routes import RoutingTable
+	from rtr_interval import IntervalIndex, RouteBatch, numpy
+	from rtr_mock import VRPGenerator
+	from rtr_snapshot import MappedTable
+	from rtr_journal import Journal
+	from rtr_client import dump_routes
+	from rtr_show import read_file
+	from __init__ import __version__
+except ImportError:
+	from .rtr_protocol import rfc8210router
+	from .rtr_routes import RoutingTable
+	from .rtr_interval import IntervalIndex, RouteBatch, numpy
+	from .rtr_mock import VRPGenerator
+	from .rtr_snapshot import MappedTable
+	from .rtr_journal import Journal
+	from .rtr_client import dump_routes
+	from .rtr_show import read_file
+	from .__init__ import __version__
+
+#
+# rtr_bench -S runs the suite - every hot path against generated tables of each size, one process
+# per size (so the peak RSS is that size's alone), written out as JSON to compare releases with.
+# Same seed, same VRPs.
+#
+
+DATASETS = [100000, 500000, 1000000]
+
+# the split of the real table, more or less
+IPV6_SHARE = 0.2
+
+def synthetic_cache_response(n_ipv4, n_ipv6, session_id=1, serial=1, seed=8210):
+	"""rtr_bench"""
+
+	# a Cache Response, n_ipv4 + n_ipv6 announced Prefix PDUs and an End of Data
+	rtr_session = rfc8210router()
+	return (rtr_session.cache_response(session_id)
+		+ rtr_session.prefix_pdus(VRPGenerator(seed).vrps(n_ipv4, n_ipv6))
+		+ rtr_session.end_of_data(session_id, serial))
+
+def bench_process(n_ipv4, n_ipv6, routingtable=True):
+	"""rtr_bench"""
+
+	packet_buffer = synthetic_cache_response(n_ipv4, n_ipv6)
+	# without a table it measures the decoder on its own
+	rtr_session = rfc8210router(routingtable=routingtable)
+	t = time.perf_counter()
+	rtr_session.process(packet_buffer)
+	elapsed = time.perf_counter() - t
+	n_pdus = n_ipv4 + n_ipv6 + 2
+	return {'pdus': n_pdus, 'seconds': elapsed, 'pdus_per_second': n_pdus / elapsed}
+
+def synthetic_routes(vrps, n_routes, seed=6811):
+	"""rtr_bench"""
+
+	# a mix of valid, too specific, wrong origin and uncovered (prefix, origin_asn) pairs
+	rnd = random.Random(seed)
+	routes = []
+	for _ in range(n_routes):
+		vrp = vrps[rnd.randrange(len(vrps))]
+		bits = 32 if vrp.version == 4 else 128
+		choice = rnd.randrange(4)
+		if choice == 0:
+			routes.append((vrp.network(), vrp.asn))
+		elif choice == 1:
+			prefixlen = min(bits, vrp.maxlen + 1)
+			routes.append((ipaddress.ip_network((vrp.prefix, prefixlen)), vrp.asn))
+		elif choice == 2:
+			routes.append((vrp.network(), vrp.asn + 1))
+		else:
+			routes.append((ipaddress.ip_network((rnd.randrange(0xe0000000, 0xf0000000) & 0xffffff00, 24)),
+					vrp.asn))
+	return routes
+
+def bench_validate(n_ipv4, n_ipv6, n_routes):
+	"""rtr_bench"""
+
+	rtr_session = rfc8210router()
+	rtr_session.process(synthetic_cache_response(n_ipv4, n_ipv6))
+	routingtable = rtr_session.routingtable()
+	routes = synthetic_routes(list(routingtable), n_routes)
+
+	results = {}
+	t = time.perf_counter()
+	routingtable.validate_many(routes)
+	elapsed = time.perf_counter() - t
+	results['validate_many'] = {'routes': n_routes, 'seconds': elapsed,
+			'routes_per_second': n_routes / elapsed}
+	t = time.perf_counter()
+	routingtable.validate_many(routes, details=True)
+	elapsed = time.perf_counter() - t
+	results['validate'] = {'routes': n_routes, 'seconds': elapsed,
+			'routes_per_second': n_routes / elapsed}
+	if numpy:
+		# the index is built once per End of Data and the
+		# batch once per RIB - so only the lookups are timed
+		index = IntervalIndex(routingtable)
+		batch = RouteBatch([cidr for cidr, origin_asn in routes],
+				[origin_asn for cidr, origin_asn in routes])
+		t = time.perf_counter()
+		index.validate_many(batch)
+		elapsed = time.perf_counter() - t
+		results['interval'] = {'routes': n_routes, 'seconds': elapsed,
+				'routes_per_second': n_routes / elapsed}
+	return results
+
+def _timed(f, *args, **kwargs):
+	"""rtr_bench"""
+
+	t = time.perf_counter()
+	result = f(*args, **kwargs)
+	return result, time.perf_counter() - t
+
+def peak_rss():
+	"""rtr_bench"""
+
+	# bytes - Linux reports KB, macOS bytes
+	maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def bench_table(vrps):
+	"""rtr_bench"""
+
+	# every VRP announced into an empty table and then withdrawn again
+	routingtable = RoutingTable()
+	results = {}
+	for name, f in [('announce', routingtable.announce), ('withdraw', routingtable.withdraw)]:
+		t = time.perf_counter()
+		for vrp in vrps:
+			f(vrp)
+		elapsed = time.perf_counter() - t
+		results[name] = {'ops': len(vrps), 'seconds': elapsed, 'ops_per_second': len(vrps) / elapsed}
+	return results
+
+def bench_files(rtr_session, directory):
+	"""rtr_bench"""
+
+	# a first sync as rtr_client sees it - the delta is
+	# the whole table (copied, dump_routes() clears it)
+	routes = {name: list(vrps) for name, vrps in rtr_session.routes().items()}
+	session_id, serial = rtr_session.get_session_id(), rtr_session.cache_serial_number()
+	routingtable = rtr_session.routingtable()
+	results = {'dump_routes': {}, 'save_routing_table': {}, 'show': {}}
+	cwd = os.getcwd()
+	os.chdir(directory)
+	try:
+		with contextlib.redirect_stderr(io.StringIO()):
+			# journal - after a reset the table becomes the journal's base
+			journal = Journal(os.path.join(directory, 'journal'))
+			_, elapsed = _timed(dump_routes, rtr_session, serial, session_id, journal, False, True, routes)
+			nbytes = os.path.getsize(journal.base_filename) + journal.size()
+			results['dump_routes']['journal'] = {'seconds': elapsed, 'bytes': nbytes}
+			# -j - the delta as JSON, under data/ in the current directory
+			_, elapsed = _timed(dump_routes, rtr_session, serial, session_id, None, True, False,
+					dict(routes))
+			nbytes = sum(os.path.getsize(os.path.join(path, filename))
+					for path, dirs, filenames in os.walk('data')
+					for filename in filenames if filename.endswith('.json'))
+			results['dump_routes']['json'] = {'seconds': elapsed, 'bytes': nbytes}
+	finally:
+		os.chdir(cwd)
+
+	snapshot_filename = os.path.join(directory, 'routingtable.bin')
+	json_filename = os.path.join(directory, 'routingtable.json')
+	nbytes, elapsed = _timed(routingtable.save_routing_table, snapshot_filename, session_id, serial)
+	results['save_routing_table']['snapshot'] = {'seconds': elapsed, 'bytes': nbytes}
+	nbytes, elapsed = _timed(routingtable.save_routing_table, json_filename)
+	results['save_routing_table']['json'] = {'seconds': elapsed, 'bytes': nbytes}
+
+	# rtr_show - from nothing to the answer for one prefix,
+	# a snapshot is mapped and a JSON file is loaded
+	vrps = list(routingtable)
+	cidr = str(vrps[len(vrps) // 2].network())
+
+	def show_snapshot():
+		"""rtr_bench"""
+		table = MappedTable(snapshot_filename)
+		try:
+			return table.show_vrps(cidr)
+		finally:
+			table.close()
+
+	def show_json():
+		"""rtr_bench"""
+		table = RoutingTable()
+		read_file(table, json_filename, 0)
+		return table.show_vrps(cidr)
+
+	for name, show in [('snapshot', show_snapshot), ('json', show_json)]:
+		answer, elapsed = _timed(show)
+		results['show'][name] = {'seconds': elapsed, 'vrps': len(answer)}
+	return results
+
+def bench_dataset(n_ipv4, n_ipv6, seed=8210):
+	"""rtr_bench"""
+
+	# runs in its own process - see suite()
+	results = {'vrps': n_ipv4 + n_ipv6, 'ipv4': n_ipv4, 'ipv6': n_ipv6}
+	results['process'] = {
+		'decode': bench_process(n_ipv4, n_ipv6, False),
+		'routingtable': bench_process(n_ipv4, n_ipv6, True),
+	}
+	results.update(bench_table(VRPGenerator(seed).vrps(n_ipv4, n_ipv6)))
+
+	rtr_session = rfc8210router(buffer_routes=True)
+	rtr_session.process(synthetic_cache_response(n_ipv4, n_ipv6, seed=seed))
+	with tempfile.TemporaryDirectory() as directory:
+		results.update(bench_files(rtr_session, directory))
+	results['peak_rss_bytes'] = peak_rss()
+	return results
+
+def suite(datasets=None, seed=8210):
+	"""rtr_bench"""
+
+	# spawned, not forked - a forked process starts with the parent's peak RSS
+	context = multiprocessing.get_context('spawn')
+	results = {
+		'version': __version__,
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'numpy': numpy is not None,
+		'seed': seed,
+		'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+		'datasets': [],
+	}
+	for n in datasets or DATASETS:
+		n_ipv6 = int(n * IPV6_SHARE)
+		with context.Pool(1) as pool:
+			results['datasets'].append(pool.apply(bench_dataset, (n - n_ipv6, n_ipv6, seed)))
+	return results
+
+def doit(args=None):
+	"""rtr_bench"""
+
+	n_ipv4 = 400000
+	n_ipv6 = 100000
+	n_routes = 1000000
+	run_suite = False
+	datasets = None
+	output = None
+
+	usage = ('usage: rtr_bench '
+		 + '[-H|--help] '
+		 + '[-V|--version] '
+		 + '[-4 COUNT|--ipv4=COUNT] '
+		 + '[-6 COUNT|--ipv6=COUNT] '
+		 + '[-r COUNT|--routes=COUNT] '
+		 + '[-S|--suite] '
+		 + '[-d COUNT[,COUNT...]|--datasets=COUNT[,COUNT...]] '
+		 + '[-o FILENAME|--output=FILENAME] '
+		 )
+
+	try:
+		opts, args = getopt.getopt(args, 'HV4:6:r:Sd:o:', [
+						'help',
+						'version',
+						'ipv4=',
+						'ipv6=',
+						'routes=',
+						'suite',
+						'datasets=',
+						'output='
+						])
+	except getopt.GetoptError:
+		sys.exit(usage)
+
+	for opt, arg in opts:
+		if opt in ('-H', '--help'):
+			sys.exit(usage)
+		if opt in ('-V', '--version'):
+			sys.exit('%s: version: %s' % (sys.argv[0], __version__))
+		elif opt in ('-4', '--ipv4'):
+			n_ipv4 = int(arg)
+		elif opt in ('-6', '--ipv6'):
+			n_ipv6 = int(arg)
+		elif opt in ('-r', '--routes'):
+			n_routes = int(arg)
+		elif opt in ('-S', '--suite'):
+			run_suite = True
+		elif opt in ('-d', '--datasets'):
+			try:
+				datasets = [int(n) for n in arg.split(',')]
+			except ValueError:
+				sys.exit(usage)
+		elif opt in ('-o', '--output'):
+			output = arg
+
+	if run_suite:
+		results = suite(datasets)
+		if output:
+			with open(output, 'w') as fd:
+				json.dump(results, fd, indent=2)
+				fd.write('\n')
+		else:
+			json.dump(results, sys.stdout, indent=2)
+			sys.stdout.write('\n')
+		sys.exit(0)
+
+	for routingtable in [False, True]:
+		r = bench_process(n_ipv4, n_ipv6, routingtable)
+		print('process(): %-13s %8d PDUs %8.3f secs %10.0f PDUs/sec' % (
+						'routingtable' if routingtable else 'decode only',
+								r['pdus'], r['seconds'], r['pdus_per_second']))
+	r = bench_validate(n_ipv4, n_ipv6, n_routes)
+	for name in [name for name in ['validate_many', 'validate', 'interval'] if name in r]:
+		print('%-24s %8d routes %8.3f secs %10.0f routes/sec' % (
+						name + '():', r[name]['routes'], r[name]['seconds'], r[name]['routes_per_second']))
+	sys.exit(0)
+
+def main(args=None):
+	"""rtr_bench"""
+
+	if args is None:
+		args = sys.argv[1:]
+	doit(args)
+
+if __name__ == '__main__':
+	main()
@@ -4,24 +4,30 @@
 import sys
 import os
 import getopt
-import socket
-import select
 import time
 import json
-import ipaddress
+import asyncio
 from datetime import datetime
-from random import randrange
-
-try:
-	import pytricia
-except:
-	pytricia = None
 
 try:
 	from rtr_protocol import rfc8210router
+	from rtr_vrp import VRP
+	from rtr_journal import Journal
+	from rtr_session import RTRSession
+	from rtr_group import CacheGroup
+	from rtr_query import QueryServer, parse_listen
+	from rtr_shared import SharedPublisher
+	from rtr_server import RTRServer
 	from __init__ import __version__
 except ImportError:
 	from .rtr_protocol import rfc8210router
+	from .rtr_vrp import VRP
+	from .rtr_journal import Journal
+	from .rtr_session import RTRSession
+	from .rtr_group import CacheGroup
+	from .rtr_query import QueryServer, parse_listen
+	from .rtr_shared import SharedPublisher
+	from .rtr_server import RTRServer
 	from .__init__ import __version__
 
 #
@@ -30,142 +36,6 @@ except ImportError:
 # rtr_protocol - port 8284 - tls - ?
 #
 
-class Connect(object):
-	"""RTR client"""
-
-	rtr_host = 'rtr.rpki.cloudflare.com'
-	rtr_port = 8282
-	fd = None
-	connect_timeout = 5 # this is about the socket connect timeout and not data timeout
-
-	def __init__(self, host=None, port=None):
-		"""RTR client"""
-		if host:
-			self.rtr_host = host
-		if port:
-			self.rtr_port = port
-		self.fd = self._connect()
-
-	def close(self):
-		"""RTR client"""
-		self.fd.close()
-		self.fd = None
-
-	def recv(self, n):
-		"""RTR client"""
-		try:
-			return self.fd.recv(n)
-		except Exception as e:
-			raise
-
-	def send(self, packet):
-		"""RTR client"""
-		try:
-			return self.fd.send(packet)
-		except BrokenPipeError as e:
-			# remote end closed connection
-			sys.stderr.write('send: Broken Pipe %s\n ' % (e))
-			sys.stderr.flush()
-			raise
-		except Exception as e:
-			sys.stderr.write('send: Error %s\n ' % (e))
-			sys.stderr.flush()
-			raise
-
-	def name(self):
-		"""RTR client"""
-
-		if self._sockaddr:
-			return '%s.%s' % socket.getnameinfo(self._sockaddr, 0)
-		raise ValueError
-
-	def _sleep(self, n):
-		"""RTR client"""
-		# simple back off for failed connect
-		time.sleep(n)
-
-	def _connect(self):
-		"""RTR client"""
-		try:
-			ginfo = socket.getaddrinfo(self.rtr_host, self.rtr_port, 0, 0, socket.SOL_TCP)
-		except socket.gaierror as e:
-			sys.stderr.write('socket: %s.%s: %s (%d)\n' % (self.rtr_host, self.rtr_port, str(e.strerror), int(e.errno)))
-			sys.stderr.flush()
-			sys.exit(1)
-
-		for ii in [1, 1, 2, 4, 8, 16, 32]:
-			for gthis in ginfo:
-				try:
-					afamily, socktype, proto, canonname, sockaddr = gthis
-					fd = socket.socket(afamily, socktype, proto)
-					fd.settimeout(self.connect_timeout)
-					fd.connect(sockaddr)
-					self._sockaddr = sockaddr
-					self.fd = fd
-					return fd
-				except socket.timeout:
-					sys.stderr.write('socket: %s.%s: connection timeout\n' % (sockaddr[0], sockaddr[1]))
-					sys.stderr.flush()
-					self._sleep(ii)
-					continue
-				except socket.error as e:
-					sys.stderr.write('socket: %s.%s: %s (%d)\n' % (sockaddr[0], sockaddr[1], str(e.strerror), int(e.errno)))
-					sys.stderr.flush()
-					self._sleep(ii)
-					continue
-
-		self._sockaddr = None
-		self.fd = None
-		return None
-
-class Process(object):
-	"""RTR client"""
-
-	class Buffer(object):
-		"""RTR client"""
-
-		def __init__(self):
-			"""RTR client"""
-			self.last_buffer = None
-
-		def clear(self):
-			"""RTR client"""
-			if self.last_buffer:
-				self.last_buffer = None
-		def read(self):
-			"""RTR client"""
-			b = self.last_buffer
-			if self.last_buffer:
-				self.last_buffer = None
-			return b
-
-		def write(self, b):
-			"""RTR client"""
-			self.last_buffer = b
-
-	def __init__(self):
-		"""RTR client"""
-		self.buf = self.Buffer()
-
-	def do_hunk(self, rtr_session, v):
-		"""RTR client"""
-		if not v or len(v) == 0:
-			# END OF FILE
-			return False
-
-		b = self.buf.read()
-		if b:
-			v = b + v
-		data_length = len(v)
-		data_left = rtr_session.process(v)
-		if data_left > 0:
-			self.buf.write(v[data_length - data_left:])
-		return True
-
-	def clear(self):
-		"""RTR client"""
-		self.buf.clear()
-
 def now_in_utc():
 	"""RTR client"""
 
@@ -186,34 +56,34 @@ def data_directory(now):
 	except FileExistsError:
 		pass
 
-def dump_routes(rtr_session, serial, session_id):
+def dump_routes(rtr_session, serial, session_id, journal=None, json_files=False, reset=False,
+		routes=None, save_schedule=None):
 	"""RTR client"""
 
-	# dump present routes into file based on serial number and session_id
-	routes = rtr_session.routes()
+	# dump present routes into the journal (and optionally
+	# a file) based on serial number and session_id
+	if routes is None:
+		routes = rtr_session.routes()
 	if len(routes['announce']) > 0 or len(routes['withdraw']) > 0:
-		now = now_in_utc()
-		data_directory(now)
-		j = {'serial': serial, 'session_id': session_id, 'routes': routes}
-		with open('data/%s/%s.routes.%08d.%08d.json' % (now[0:7], now, session_id, serial), 'w') as fd:
+		if journal and not reset and not journal.deferred():
+			journal.append(session_id, serial, routes['announce'], routes['withdraw'])
 
-			class IPAddressEncoder(json.JSONEncoder):
-				"""RTR client"""
+		if json_files:
+			now = now_in_utc()
+			data_directory(now)
+			j = {'serial': serial, 'session_id': session_id, 'routes': routes}
+			with open('data/%s/%s.routes.%08d.%08d.json' % (now[0:7], now, session_id, serial), 'w') as fd:
 
-				def default(self, obj):
+				class IPAddressEncoder(json.JSONEncoder):
 					"""RTR client"""
-					if pytricia and isinstance(obj, pytricia.PyTricia):
-						a = {}
-						for prefix in obj:
-							a[prefix] = obj[prefix]
-						return a
-					if isinstance(obj, ipaddress.IPv4Network):
-						return str(obj)
-					if isinstance(obj, ipaddress.IPv6Network):
-						return str(obj)
-					return json.JSONEncoder.default(self, obj)
-
-			fd.write(json.dumps(j, indent=2, cls=IPAddressEncoder))
+
+					def default(self, obj):
+						"""RTR client"""
+						if isinstance(obj, VRP):
+							return obj.to_json()
+						return json.JSONEncoder.default(self, obj)
+
+				json.dump(j, fd, indent=2, cls=IPAddressEncoder)
 
 		# clean up from this serial number
 		rtr_session.clear_routes()
@@ -221,161 +91,246 @@ def dump_routes(rtr_session, serial, session_id):
 						now_in_utc(), session_id, serial, len(routes['announce']), len(routes['withdraw'])))
 		sys.stderr.flush()
 
-		# dump the full routing table
-		rtr_session.save_routing_table()
+	# after a reset the table isn't a delta from the
+	# journal any more - so it has to become the new base
+	if journal and (reset or journal.deferred() or journal.needs_compaction()):
+		if rtr_session.in_cache_response():
+			# the next update arrived with this End of Data and has
+			# started on the table - so wait for its End of Data
+			journal.defer_compaction()
+			return
+		t = time.time()
+		snapshot = None
+		if save_schedule is not None:
+			# the table is saved anyway - bring that up to date
+			# and the journal's base is just another name for it
+			save_schedule.save(rtr_session, force=True)
+			snapshot = save_schedule.filename
+		journal.compact(rtr_session.routingtable(), session_id, serial, snapshot)
+		sys.stderr.write('%s: COMPACT JOURNAL: session_id=%d serial=%d %.3f secs\n' % (
+				now_in_utc(), session_id, serial, time.time() - t))
+		sys.stderr.flush()
+
+def restore_state(rtr_session, journal):
+	"""RTR client"""
+
+	# warm start - rebuild the table from the journal and carry on from its session_id and serial
+	routingtable = rtr_session.routingtable()
+	if routingtable is None:
+		return None, None
+	t = time.time()
+	try:
+		session_id, serial = journal.load(routingtable)
+	except Exception as e:
+		sys.stderr.write('%s: RESTORE FAILED: %s: %s\n' % (now_in_utc(), journal.directory, e))
+		sys.stderr.flush()
+		routingtable.clear()
+		return None, None
+	if session_id is None or serial is None:
+		# nothing saved yet
+		return None, None
+	rtr_session.set_session_id(session_id)
+	rtr_session.set_cache_serial_number(serial)
+	rtr_session.set_latest_serial_number(serial)
+	sys.stderr.write('%s: RESTORED session_id=%d serial=%d routes=%d %.3f secs\n' % (
+					now_in_utc(), session_id, serial, len(routingtable), time.time() - t))
+	sys.stderr.flush()
+	return session_id, serial
+
+class SaveSchedule(object):
+	"""RTR client"""
+
+	# the full routing table is written at most every interval seconds - and only if it changed
+
+	def __init__(self, filename='data/routingtable.bin', interval=300):
+		"""RTR client"""
+		self.filename = filename
+		self.interval = interval
+		self._last_save = 0
+		self._generation = None
+
+	def save(self, rtr_session, force=False):
+		"""RTR client"""
+		routingtable = rtr_session.routingtable()
+		# a cache switch swaps tables - so the generation alone isn't enough
+		if routingtable is None or (id(routingtable), routingtable.generation()) == self._generation:
+			# nothing new to save
+			return
+		if rtr_session.in_cache_response() or rtr_session.cache_serial_number() == 0:
+			# half way through an update (or before the first End of Data) - the table isn't complete
+			return
+		if not force and time.time() - self._last_save < self.interval:
+			return
+		if self.filename.startswith('data/'):
+			data_directory(now_in_utc())
+		t = time.time()
+		nbytes = rtr_session.save_routing_table(self.filename)
+		self._last_save = time.time()
+		self._generation = (id(routingtable), routingtable.generation())
+		sys.stderr.write('%s: SAVE ROUTING TABLE: %s routes=%d bytes=%d %.3f secs\n' % (
+						now_in_utc(), self.filename, len(routingtable), nbytes, self._last_save - t))
+		sys.stderr.flush()
 
-def rtr_client(host=None, port=None, serial=None, session_id=None, timeout=None, dump=False, debug=0):
+def rtr_client(host=None, port=None, serial=None, session_id=None, timeout=None, dump=False,
+		debug=0, filename='data/routingtable.bin', save_interval=300, journal_directory='data/journal',
+		json_files=False, caches=None, query_socket=None, query_http=None, shared_directory=None,
+		listen=None):
 	"""RTR client"""
 
-	rtr_session = rfc8210router(serial=serial, session_id=session_id, debug=debug)
+	# caches is a list of (host, port, preference) - without it there's just the one cache
+	if not caches:
+		caches = [(host, port, 1)]
 
+	save_schedule = SaveSchedule(filename, save_interval)
 	if dump:
 		data_directory(now_in_utc())
-		dump_fd = open('data/__________-raw-data.bin', 'w')
+		dump_fd = open('data/__________-raw-data.bin', 'wb')
+	else:
+		dump_fd = None
+
+	group = CacheGroup()
+	for cache_host, cache_port, preference in caches:
+		rtr_session = rfc8210router(serial=serial, session_id=session_id, debug=debug)
+		group.add(RTRSession(cache_host, cache_port, router=rtr_session, timeout=timeout,
+				dump_fd=dump_fd), preference)
+		# raw data from more than one cache would be an unreadable mix - only the first one is dumped
+		dump_fd = None
+
+	if journal_directory:
+		journal = Journal(journal_directory)
+		if session_id is None and serial is None:
+			# the journal doesn't say which cache it came from -
+			# the most preferred one gets it, any other would reset
+			session_id, serial = restore_state(group.sessions()[0].router, journal)
+	else:
+		journal = None
+
+	last = {'session_id': session_id, 'serial': serial}
+
+	if shared_directory:
+		# other processes on the box read the VRPs from here - see rtr_shared
+		shared = SharedPublisher(shared_directory)
+		if serial is not None:
+			shared.publish(group.sessions()[0].router.routingtable(), session_id, serial)
+		group.add_callback('delta', shared.delta)
+
+	if listen:
+		# routers sync from us - see rtr_server
+		rtr_server = RTRServer(group.routingtable)
+		if serial is not None:
+			# a warm start - serve the restored table straight away
+			rtr_server.update([], [], reset=True)
+		group.add_callback('delta', rtr_server.delta)
+	else:
+		rtr_server = None
+
+	def connected(session, peername):
+		"""RTR client"""
+		sys.stderr.write('%s: CONNECT %s.%s\n' % (now_in_utc(), peername[0], peername[1]))
+		sys.stderr.flush()
 
-	p = Process()
+	def disconnected(session, e):
+		"""RTR client"""
+		# e is None for a clean close by the cache
+		sys.stderr.write('%s: DISCONNECT %s: %s\n' % (now_in_utc(), session.name(), e or 'closed'))
+		sys.stderr.flush()
 
-	have_session_id = False
+	def reset(session):
+		"""RTR client"""
+		sys.stderr.write('%s: CACHE RESET\n' % (now_in_utc()))
+		sys.stderr.flush()
 
-	connection = None
-	while True:
-		if not connection:
-			try:
-				connection = Connect(host, port)
-			except KeyboardInterrupt:
-				# no need to print anything - just exit!
-				sys.exit(1)
-
-		if not connection.fd:
-			connection = None
-			sys.stderr.write('%s: NO NETWORK CONNECTION\n' % (now_in_utc()))
-			sys.stderr.flush()
-			# sys.exit(1)
-			continue
-
-		p.clear()
-		have_session_id = False
-		sys.stderr.write('%s: CONNECT %s\n' % (now_in_utc(), connection.name()))
+	def stale(session):
+		"""RTR client"""
+		sys.stderr.write('%s: STALE %s: no End of Data within the expire interval\n' % (
+				now_in_utc(), session.name()))
+		sys.stderr.flush()
+
+	def switch(session, previous):
+		"""RTR client"""
+		sys.stderr.write('%s: SWITCH CACHE %s->%s\n' % (
+				now_in_utc(), previous.name() if previous else None, session.name()))
 		sys.stderr.flush()
 
-		if session_id is None or session_id == 0 or serial is None or serial == 0:
-			# starting from scratch!
-			packet = rtr_session.reset_query()
-			serial = 0
-			have_session_id = False
-			session_id = 0
-		else:
-			# packet = rtr_session.serial_query(serial)
-			packet = rtr_session.serial_query()
-
-		# send the first packet on the connection -- kicking things off!
+	def delta(session, delta):
+		"""RTR client"""
+		if last['session_id'] and delta.session_id != last['session_id']:
+			sys.stderr.write('%s: REFRESHED SESSION ID %d->%d\n' % (
+					now_in_utc(), last['session_id'], delta.session_id))
+		sys.stderr.write('%s: SESSION %d NEW SERIAL %s->%d\n' % (
+				now_in_utc(), delta.session_id, last['serial'], delta.serial))
+		sys.stderr.flush()
+		# dump present routes into the journal based on serial number
+		dump_routes(session.router, delta.serial, delta.session_id, journal, json_files, delta.reset,
+				routes={'announce': delta.announce, 'withdraw': delta.withdraw}, save_schedule=save_schedule)
+		last['session_id'] = delta.session_id
+		last['serial'] = delta.serial
+		# the full table - if it's time
+		save_schedule.save(session.router)
+
+	group.add_callback('connect', connected)
+	group.add_callback('disconnect', disconnected)
+	group.add_callback('reset', reset)
+	group.add_callback('stale', stale)
+	group.add_callback('switch', switch)
+	group.add_callback('delta', delta)
+
+	def save(force=False):
+		"""RTR client"""
+		if group.active() is not None:
+			save_schedule.save(group.active().router, force)
+
+	async def run():
+		"""RTR client"""
+		server = None
+		if query_socket or query_http:
+			# lookups against the live table - see rtr_query
+			server = QueryServer(group.routingtable)
+			group.add_callback('delta', server.delta)
 		try:
-			sys.stderr.write('+')
-			sys.stderr.flush()
-			connection.send(packet)
-		except Exception as e:
-			sys.stderr.write('send: %s\n' % (e))
-			sys.stderr.flush()
-			connection.close()
-			connection = None
-			# this will open up a fresh connection and try all over again
-			continue
-
-		while True:
-			# At every oppertunity, see if we have a new session_id number
-			try:
-				new_session_id = rtr_session.get_session_id()
-				if have_session_id:
-					if new_session_id != session_id:
-						sys.stderr.write('\n%s: REFRESHED SESSION ID %d->%d\n' % (now_in_utc(), session_id, new_session_id))
-						sys.stderr.flush()
-						# consider a reset here - once we handle 0
-				else:
-					sys.stderr.write('\n%s: NEW SESSION ID %d\n' % (now_in_utc(), new_session_id))
-					sys.stderr.flush()
-				# update session_id number
-				session_id = new_session_id
-				have_session_id = True
-			except ValueError:
-				# no session_id number known yet - should only happen once
-				sys.stderr.write('%s: NO SESSION ID\n' % (now_in_utc()))
-				sys.stderr.flush()
-				pass
-
-			# At every oppertunity, see if we have a new serial number
-			new_serial = rtr_session.cache_serial_number()
-			if new_serial != serial:
-				try:
-					new_session_id = rtr_session.get_session_id()
-				except ValueError:
-					new_session_id = 0
-				sys.stderr.write('\n%s: SESSION %d NEW SERIAL %s->%d\n' % (now_in_utc(), new_session_id, serial, new_serial))
-				sys.stderr.flush()
-				# dump present routes into file based on serial number
-				dump_routes(rtr_session, new_serial, new_session_id)
-				# update serial number
-				serial = new_serial
-				# update session_id
-				session_id = new_session_id
+			if query_socket:
+				await server.start_unix(query_socket)
+			if query_http:
+				await server.start_http(*query_http)
+			if rtr_server:
+				await rtr_server.start(*listen)
+		except OSError as e:
+			# an address already in use - or a socket path that can't be created
+			if server:
+				server.close()
+			if rtr_server:
+				rtr_server.close()
+			sys.exit('%s' % (e))
+		task = group.start()
+		while not task.done():
+			await asyncio.wait([task], timeout=save_schedule.interval)
+			# a quiet cache still gets the last update saved once the interval is up
+			save()
+		if server:
+			server.close()
+		if rtr_server:
+			rtr_server.close()
+		task.result()
 
-			try:
-				# because random timers are your friend! but keep above one second - just because
-				delta = 0.2
-				this_timeout = max(1.0, float(randrange(timeout * (1-delta), timeout * (1+delta), 1)))
-				ready = select.select([connection.fd], [], [], this_timeout)
-			except KeyboardInterrupt:
-				sys.stderr.write('\nselect wait: ^C\n')
-				sys.stderr.flush()
-				sys.exit(1)
-			except Exception as e:
-				sys.stderr.write('\nselect wait: %s\n' % (e))
-				sys.stderr.flush()
-				break
-
-			if not ready[0]:
-				# Timeout
-				sys.stderr.write('T')
-				sys.stderr.flush()
-
-				if rtr_session.time_remaining():
-					sys.stderr.write('-')
-					sys.stderr.flush()
-					continue
-
-				# timed out - go ask for more data!
-				packet = rtr_session.serial_query()
-				## rtr_session.process(packet)
-				try:
-					sys.stderr.write('s')
-					sys.stderr.flush()
-					connection.send(packet)
-					continue
-				except Exception as e:
-					sys.stderr.write('send: %s\n' % (e))
-					sys.stderr.flush()
-					connection.close()
-					connection = None
-					break
+	try:
+		asyncio.run(run())
+	except KeyboardInterrupt:
+		# no need to print anything - just save and exit!
+		save(force=True)
+		sys.exit(1)
 
-			try:
-				sys.stderr.write('.')
-				sys.stderr.flush()
-				v = connection.recv(64*1024)
-			except Exception as e:
-				sys.stderr.write('recv: %s\n' % (e))
-				sys.stderr.flush()
-				v = None
-				connection.close()
-				connection = None
-				break
-
-			if dump:
-				# save raw data away
-				dump_fd.buffer.write(v)
-				dump_fd.flush()
-
-			if not p.do_hunk(rtr_session, v):
-				break
+def parse_cache(arg, preference):
+	"""RTR client"""
+
+	# HOST[,PORT[,PREFERENCE]] - commas because IPv6 addresses are full of colons
+	fields = arg.split(',')
+	if len(fields) > 3 or not fields[0]:
+		raise ValueError('%s: bad cache' % (arg))
+	host = fields[0]
+	port = int(fields[1]) if len(fields) > 1 and fields[1] else None
+	if len(fields) > 2:
+		preference = int(fields[2])
+	return (host, port, preference)
 
 def doit(args=None):
 	"""RTR client"""
@@ -386,7 +341,16 @@ def doit(args=None):
 	port = None
 	serial = None
 	session_id = None
-	timeout = 300 # five minutes for some random reason
+	timeout = None # the cache's refresh interval - this is only used if it doesn't send one
+	filename = 'data/routingtable.bin'
+	save_interval = 300
+	journal_directory = 'data/journal'
+	json_files = False
+	caches = []
+	query_socket = None
+	query_http = None
+	shared_directory = None
+	listen = None
 
 	usage = (
 					'usage: rtr_client '
@@ -399,10 +363,19 @@ def doit(args=None):
 					+ '[-S SESSIONID|--session=SESSIONID] '
 					+ '[-t SECONDS|--timeout=SECONDS] '
 					+ '[-d|--dump] '
+					+ '[-f FILENAME|--file=FILENAME] '
+					+ '[-i SECONDS|--save-interval=SECONDS] '
+					+ '[-J DIRECTORY|--journal=DIRECTORY] '
+					+ '[-j|--json] '
+					+ '[-c HOST[,PORT[,PREFERENCE]]|--cache=HOST[,PORT[,PREFERENCE]] ...] '
+					+ '[-q PATH|--query-socket=PATH] '
+					+ '[-Q [HOST:]PORT|--query-http=[HOST:]PORT] '
+					+ '[-m DIRECTORY|--shared=DIRECTORY] '
+					+ '[-l [HOST:]PORT|--listen=[HOST:]PORT] '
 		)
 
 	try:
-		opts, args = getopt.getopt(args, 'HVvh:p:s:S:t:d', [
+		opts, args = getopt.getopt(args, 'HVvh:p:s:S:t:df:i:J:jc:q:Q:m:l:', [
 						'help',
 						'version',
 						'verbose',
@@ -410,7 +383,16 @@ def doit(args=None):
 						'serial=',
 						'session=',
 						'timeout=',
-						'debug'
+						'dump',
+						'file=',
+						'save-interval=',
+						'journal=',
+						'json',
+						'cache=',
+						'query-socket=',
+						'query-http=',
+						'shared=',
+						'listen='
 						])
 	except getopt.GetoptError:
 		sys.exit(usage)
@@ -434,8 +416,39 @@ def doit(args=None):
 			timeout = int(arg)
 		elif opt in ('-d', '--dump'):
 			dump = True
+		elif opt in ('-f', '--file'):
+			filename = arg
+		elif opt in ('-i', '--save-interval'):
+			save_interval = int(arg)
+		elif opt in ('-J', '--journal'):
+			journal_directory = arg
+		elif opt in ('-j', '--json'):
+			json_files = True
+		elif opt in ('-c', '--cache'):
+			try:
+				caches.append(parse_cache(arg, len(caches) + 1))
+			except ValueError:
+				sys.exit(usage)
+		elif opt in ('-q', '--query-socket'):
+			query_socket = arg
+		elif opt in ('-Q', '--query-http'):
+			try:
+				query_http = parse_listen(arg)
+			except ValueError:
+				sys.exit(usage)
+		elif opt in ('-m', '--shared'):
+			shared_directory = arg
+		elif opt in ('-l', '--listen'):
+			try:
+				# routers are usually elsewhere - so any address unless a host is given
+				listen = parse_listen(arg, None)
+			except ValueError:
+				sys.exit(usage)
 
-	rtr_client(host=host, port=port, serial=serial, session_id=session_id, timeout=timeout, dump=dump, debug=debug)
+	rtr_client(host=host, port=port, serial=serial, session_id=session_id, timeout=timeout, dump=dump,
+			debug=debug, filename=filename, save_interval=save_interval, journal_directory=journal_directory,
+			json_files=json_files, caches=caches, query_socket=query_socket, query_http=query_http,
+			shared_directory=shared_directory, listen=listen)
 	sys.exit(0)
 
 def main(args=None):
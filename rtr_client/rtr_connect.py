@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""RTR connect"""
+
+import time
+import random
+import socket
+import asyncio
+
+#
+# RFC 8305 Happy Eyeballs - connect to each address in turn, a short delay apart, interleaving
+# IPv6 and IPv4 - first one to connect wins and the rest are dropped. A broken path costs one delay
+# rather than a full connect timeout. Addresses are cached so a reconnect doesn't wait on DNS.
+#
+
+connection_attempt_delay = 0.25 # RFC 8305 section 5 recommends 250ms
+
+class Resolver(object):
+	"""RTR connect"""
+
+	# getaddrinfo() doesn't tell us the DNS TTL - so cached answers live for a fixed time
+	ttl = 300
+
+	def __init__(self, ttl=None):
+		"""RTR connect"""
+
+		if ttl is not None:
+			self.ttl = ttl
+		self._cache = {}
+
+	async def resolve(self, host, port):
+		"""RTR connect"""
+
+		# [(family, type, proto, canonname, sockaddr), ...] in RFC 8305 order - raises socket.gaierror
+		key = (host, port)
+		now = time.monotonic()
+		if key in self._cache and self._cache[key][0] > now:
+			return self._cache[key][1]
+		loop = asyncio.get_running_loop()
+		addrinfos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP)
+		addrinfos = self._interleave(addrinfos)
+		self._cache[key] = (now + self.ttl, addrinfos)
+		return addrinfos
+
+	def invalidate(self, host, port):
+		"""RTR connect"""
+
+		self._cache.pop((host, port), None)
+
+	def _interleave(self, addrinfos):
+		"""RTR connect"""
+
+		# RFC 8305 section 4 - keep the resolver's preferred family first, then alternate families
+		families = {}
+		for addrinfo in addrinfos:
+			families.setdefault(addrinfo[0], []).append(addrinfo)
+		lists = list(families.values())
+		interleaved = []
+		for ii in range(max([len(l) for l in lists] or [0])):
+			for l in lists:
+				if ii < len(l):
+					interleaved.append(l[ii])
+		return interleaved
+
+# shared by every session in the process
+shared_resolver = Resolver()
+
+def backoff(attempt, base=1, cap=32):
+	"""RTR connect"""
+
+	# exponential backoff with jitter - so a group of clients doesn't reconnect in lock step
+	return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+async def _attempt(addrinfo, timeout):
+	"""RTR connect"""
+
+	family, socktype, proto, _, sockaddr = addrinfo
+	sock = socket.socket(family, socktype, proto)
+	try:
+		sock.setblocking(False)
+		await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, sockaddr), timeout)
+	except:
+		sock.close()
+		raise
+	return sock
+
+async def connect(host, port, timeout=5, delay=None, resolver=shared_resolver):
+	"""RTR connect"""
+
+	# a connected non-blocking socket - or the last error if every address failed
+	if delay is None:
+		delay = connection_attempt_delay
+	addrinfos = list(await resolver.resolve(host, port))
+	pending = set()
+	winner = None
+	error = None
+	try:
+		while (addrinfos or pending) and winner is None:
+			if addrinfos:
+				pending.add(asyncio.ensure_future(_attempt(addrinfos.pop(0), timeout)))
+				wait = delay
+			else:
+				wait = None
+			# the next address starts after delay - or straight away if an attempt fails first
+			done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+			for task in done:
+				if task.exception() is not None:
+					error = task.exception()
+				elif winner is None:
+					winner = task.result()
+				else:
+					task.result().close()
+	finally:
+		for task in pending:
+			task.cancel()
+
+	if winner is None:
+		# maybe the addresses have changed
+		resolver.invalidate(host, port)
+		raise error or OSError('%s.%s: no addresses' % (host, port))
+	return winner
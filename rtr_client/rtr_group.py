@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""RTR cache group"""
+
+import asyncio
+import logging
+
+try:
+	from rtr_vrp import VRP
+	from rtr_session import Delta
+except ImportError:
+	from .rtr_vrp import VRP
+	from .rtr_session import Delta
+
+#
+# RFC 8210 section 10 - a router can talk to several caches at once, each with a preference (lower
+# is better). Every cache keeps its own session and its own routing table all the time, so when the
+# preferred one fails the next one is already synced and switching is just a diff of two tables.
+#
+
+logger = logging.getLogger('RFC8210').getChild('group')
+
+def table_diff(old, new):
+	"""RTR cache group"""
+
+	# (announce, withdraw) that turns routing table old into new - either can be None (empty)
+	announce = []
+	withdraw = []
+	for version in [4, 6]:
+		old_entries = set(old.entries(version)) if old is not None else set()
+		new_entries = set(new.entries(version)) if new is not None else set()
+		for vrps, entries in [
+				(announce, new_entries - old_entries), (withdraw, old_entries - new_entries)]:
+			for packed, prefixlen, maxlen, asn in sorted(entries):
+				vrps.append(VRP(version, int.from_bytes(packed, 'big'), prefixlen, maxlen, asn))
+	return announce, withdraw
+
+class CacheGroup(object):
+	"""RTR cache group"""
+
+	_events = ('connect', 'disconnect', 'reset', 'stale', 'delta', 'switch')
+
+	def __init__(self, sessions=None):
+		"""RTR cache group"""
+
+		# sessions is a list of (preference, RTRSession)
+		self._sessions = []
+		self._callbacks = dict((event, []) for event in self._events)
+		self._queues = []
+		self._active = None
+		self._started = False
+		for preference, session in sessions or []:
+			self.add(session, preference)
+
+	def add(self, session, preference=None):
+		"""RTR cache group"""
+
+		if preference is None:
+			preference = len(self._sessions) + 1
+		# sorted() is stable - so equal preferences keep the order they were added in
+		self._sessions = sorted(self._sessions + [(preference, session)], key=lambda ps: ps[0])
+		session.add_callback('delta', self._delta)
+		session.add_callback('sync', self._select)
+		session.add_callback('reset', self._select)
+		session.add_callback('disconnect', self._select)
+		session.add_callback('stale', self._select)
+		for event in ['connect', 'disconnect', 'reset', 'stale']:
+			for callback in self._callbacks[event]:
+				session.add_callback(event, callback)
+		if self._started:
+			session.start()
+
+	def sessions(self):
+		"""RTR cache group"""
+
+		return [session for preference, session in self._sessions]
+
+	def add_callback(self, event, callback):
+		"""RTR cache group"""
+
+		# callback(session, ...) - connect/disconnect/reset/stale are passed through from every session,
+		# delta: Delta (only for the active session), switch: the previously active session (or None)
+		if event not in self._callbacks:
+			raise ValueError('%s: unknown event' % (event))
+		self._callbacks[event].append(callback)
+		if event in ['connect', 'disconnect', 'reset', 'stale']:
+			for session in self.sessions():
+				session.add_callback(event, callback)
+
+	def active(self):
+		"""RTR cache group"""
+
+		# the session whose VRPs are being served
+		return self._active
+
+	def routingtable(self):
+		"""RTR cache group"""
+
+		if self._active is None:
+			return None
+		return self._active.router.routingtable()
+
+	async def wait_for_serial(self, serial=None):
+		"""RTR cache group"""
+
+		# wait for any cache to sync - the first one to do so is served until something better turns up
+		while self._active is None:
+			waiters = [asyncio.ensure_future(session.wait_for_serial()) for session in self.sessions()]
+			try:
+				await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+			finally:
+				for waiter in waiters:
+					waiter.cancel()
+		return await self._active.wait_for_serial(serial)
+
+	async def deltas(self):
+		"""RTR cache group"""
+
+		# async for delta in group.deltas(): ... - the changes to the served VRP set, including switches
+		queue = asyncio.Queue()
+		self._queues.append(queue)
+		try:
+			while True:
+				delta = await queue.get()
+				if delta is None:
+					return
+				yield delta
+		finally:
+			self._queues.remove(queue)
+
+	async def run(self):
+		"""RTR cache group"""
+
+		if self._active is None:
+			# a warm start - serve the restored table straight away rather than waiting for a cache
+			for session in self.sessions():
+				if session.router.cache_serial_number() != 0:
+					self._active = session
+					break
+		self._started = True
+		await asyncio.gather(*[session.run() for session in self.sessions()])
+
+	def start(self):
+		"""RTR cache group"""
+
+		return asyncio.ensure_future(self.run())
+
+	def close(self):
+		"""RTR cache group"""
+
+		for session in self.sessions():
+			session.close()
+		for queue in self._queues:
+			queue.put_nowait(None)
+
+	async def __aenter__(self):
+		"""RTR cache group"""
+
+		self._task = self.start()
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		"""RTR cache group"""
+
+		self.close()
+		await self._task
+
+	def _delta(self, session, delta):
+		"""RTR cache group"""
+
+		if session is self._active:
+			self._emit(session, delta)
+		# any other cache's changes only matter if it becomes the active one - _select() diffs then
+
+	def _select(self, session, *args):
+		"""RTR cache group"""
+
+		# the most preferred cache that's connected, synced
+		# and not expired - else stay put, stale beats nothing
+		for _, candidate in self._sessions:
+			if candidate.connected() and candidate.synced() and not candidate.stale():
+				break
+		else:
+			return
+		if candidate is self._active:
+			return
+
+		previous = self._active
+		old = previous.router.routingtable() if previous is not None else None
+		announce, withdraw = table_diff(old, candidate.router.routingtable())
+		self._active = candidate
+		logger.info('switch %s -> %s: announce=%d withdraw=%d', previous.name() if previous else None,
+				candidate.name(), len(announce), len(withdraw))
+		self._fire('switch', candidate, previous)
+		try:
+			session_id = candidate.router.get_session_id()
+		except ValueError:
+			session_id = 0
+		# nothing served before means this is the complete set
+		self._emit(candidate, Delta(session_id, candidate.serial(), announce, withdraw, previous is None))
+
+	def _emit(self, session, delta):
+		"""RTR cache group"""
+
+		self._fire('delta', session, delta)
+		for queue in self._queues:
+			queue.put_nowait(delta)
+
+	def _fire(self, event, session, *args):
+		"""RTR cache group"""
+
+		for callback in list(self._callbacks[event]):
+			try:
+				callback(session, *args)
+			except Exception:
+				# a broken callback shouldn't take the group down with it
+				logger.exception('%s: %s callback failed', session.name(), event)
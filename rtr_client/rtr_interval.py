@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""RTR interval index"""
+
+import copy
+
+try:
+	import numpy
+except:
+	numpy = None
+
+try:
+	from rtr_vrp import VRP
+	from rtr_routes import RoutingTable, route_key, VALID, INVALID, NOT_FOUND
+	from rtr_subscriber import Subscriber
+except ImportError:
+	from .rtr_vrp import VRP
+	from .rtr_routes import RoutingTable, route_key, VALID, INVALID, NOT_FOUND
+	from .rtr_subscriber import Subscriber
+
+#
+# Bulk route origin validation with numpy. VRP prefixes nest, so per address family they cut the
+# address space into segments where every address is covered by the same chain of VRPs. A route's
+# covering VRPs are the ones in the chain of its first address that are no more specific than the
+# route - so a whole batch is one searchsorted() for the segments and one for (segment, origin ASN).
+# Addresses are the top 64 bits (IPv4 is shifted up); the rare IPv6 VRPs longer than a /64 are left
+# to a small RoutingTable.
+#
+
+# state codes - ordered so that combining two answers is just the larger one
+_NOT_FOUND = 0
+_INVALID = 1
+_VALID = 2
+
+_STATES = [NOT_FOUND, INVALID, VALID]
+
+def _top64(version, packeds):
+	"""RTR interval index"""
+
+	# the top 64 bits of each packed address as a uint64 array
+	if len(packeds) == 0:
+		return numpy.zeros(0, dtype=numpy.uint64)
+	if version == 4:
+		return numpy.frombuffer(b''.join(packeds), dtype='>u4').astype(numpy.uint64) << numpy.uint64(32)
+	return numpy.frombuffer(b''.join(packeds), dtype='>u8')[0::2].astype(numpy.uint64)
+
+class RouteBatch(object):
+	"""RTR interval index"""
+
+	# (prefix, origin_asn) pairs parsed once into arrays -
+	# so the same RIB can be validated after every serial
+	def __init__(self, prefixes, asns):
+		"""RTR interval index"""
+
+		if not numpy:
+			raise Exception("numpy not installed")
+		columns = {4: ([], [], [], []), 6: ([], [], [], [])}
+		self._long = []
+		n = 0
+		for cidr, asn in zip(prefixes, asns):
+			version, key = route_key(cidr)
+			positions, packeds, prefixlens, origin_asns = columns[version]
+			positions.append(n)
+			packeds.append(key[0])
+			prefixlens.append(key[1])
+			origin_asns.append(asn)
+			if version == 6 and key[1] > 64:
+				self._long.append((n, key, asn))
+			n += 1
+		self._length = n
+
+		self._families = {}
+		for version in [4, 6]:
+			positions, packeds, prefixlens, origin_asns = columns[version]
+			address = _top64(version, packeds)
+			# sorted addresses keep searchsorted() walking memory in order
+			order = numpy.argsort(address, kind='stable')
+			self._families[version] = (
+				numpy.array(positions, dtype=numpy.int64)[order],
+				address[order],
+				numpy.array(prefixlens, dtype=numpy.uint8)[order],
+				numpy.array(origin_asns, dtype=numpy.uint64)[order],
+			)
+
+	def __len__(self):
+		"""RTR interval index"""
+
+		return self._length
+
+	def family(self, version):
+		"""RTR interval index"""
+
+		# (positions in the batch, top 64 bits of the address,
+		# prefixlen, origin asn) arrays - sorted by address
+		return self._families[version]
+
+	def long_routes(self):
+		"""RTR interval index"""
+
+		# [(position, key, origin asn), ...] for the IPv6 routes more specific than a /64
+		return self._long
+
+class IntervalIndex(object):
+	"""RTR interval index"""
+
+	def __init__(self, routingtable=None, session_id=0, serial=0):
+		"""RTR interval index"""
+
+		if not numpy:
+			raise Exception("numpy not installed")
+		self.session_id = session_id
+		self.serial = serial
+		self._long = RoutingTable()
+		self._families = {}
+		for version in [4, 6]:
+			entries = list(routingtable.entries(version)) if routingtable is not None else []
+			self._families[version] = self._build(version, entries)
+
+	def validate_many(self, prefixes, asns=None):
+		"""RTR interval index"""
+
+		# prefixes is a RouteBatch or an iterable of prefixes
+		# to zip with asns - returns an array of states
+		if not isinstance(prefixes, RouteBatch):
+			prefixes = RouteBatch(prefixes, asns)
+		return numpy.array(_STATES, dtype=object)[self.validate_codes(prefixes)]
+
+	def validate_codes(self, batch):
+		"""RTR interval index"""
+
+		codes = numpy.zeros(len(batch), dtype=numpy.uint8)
+		for version in [4, 6]:
+			positions, address, prefixlen, asn = batch.family(version)
+			if len(positions) > 0 and self._families[version] is not None:
+				codes[positions] = self._classify(self._families[version], address, prefixlen, asn)
+		long_routes = batch.long_routes()
+		if len(self._long) > 0 and len(long_routes) > 0:
+			# more specific than a /64 - the long VRPs can only add to what the index found
+			positions = [position for position, key, asn in long_routes]
+			states = self._long.validate_many([(key, asn) for position, key, asn in long_routes])
+			codes[positions] = numpy.maximum(codes[positions], [_STATES.index(state) for state in states])
+		return codes
+
+	def _classify(self, family, address, prefixlen, asn):
+		"""RTR interval index"""
+
+		boundaries, minlen, keys, lo, hi, max_run = family
+		segment = numpy.searchsorted(boundaries, address, 'right') - 1
+		covered = minlen[segment] <= prefixlen
+		key = (segment.astype(numpy.uint64) << numpy.uint64(32)) | asn
+		first = numpy.searchsorted(keys, key)
+		valid = numpy.zeros(len(address), dtype=bool)
+		# a (segment, asn) pair can have a few VRPs - check each against the route's length
+		for ii in range(max_run):
+			idx = numpy.minimum(first + ii, len(keys) - 1)
+			valid |= (keys[idx] == key) & (lo[idx] <= prefixlen) & (prefixlen <= hi[idx])
+		return numpy.where(valid, _VALID, numpy.where(covered, _INVALID, _NOT_FOUND))
+
+	def _build(self, version, entries):
+		"""RTR interval index"""
+
+		if version == 6:
+			for packed, prefixlen, maxlen, asn in entries:
+				if prefixlen > 64:
+					self._long.announce(VRP(6, int.from_bytes(packed, 'big'), prefixlen, maxlen, asn))
+			entries = [entry for entry in entries if entry[1] <= 64]
+		if len(entries) == 0:
+			return None
+
+		packeds, prefixlens, maxlens, asns = zip(*entries)
+		start = _top64(version, packeds)
+		prefixlen = numpy.array(prefixlens, dtype=numpy.uint8)
+		maxlen = numpy.array(maxlens, dtype=numpy.uint8)
+		asn = numpy.array(asns, dtype=numpy.uint64)
+		# last address of each prefix - in two shifts, as a uint64 can't be shifted by 64 for a /64
+		half = (prefixlen // 2).astype(numpy.uint64)
+		end = start | ((numpy.uint64(0xffffffffffffffff) >> half)
+				>> (prefixlen.astype(numpy.uint64) - half))
+
+		# segments start at every prefix start and just after every prefix end
+		after = end[end != numpy.uint64(0xffffffffffffffff)] + numpy.uint64(1)
+		boundaries = numpy.unique(numpy.concatenate([numpy.zeros(1, dtype=numpy.uint64), start, after]))
+		first = numpy.searchsorted(boundaries, start)
+		counts = numpy.searchsorted(boundaries, end, 'right') - first
+
+		# one row per (VRP, segment it covers)
+		vrp = numpy.repeat(numpy.arange(len(start)), counts)
+		segment = numpy.repeat(first, counts) + (
+				numpy.arange(len(vrp)) - numpy.repeat(numpy.cumsum(counts) - counts, counts))
+
+		# covered if the least specific VRP over a segment is no more specific than the route
+		minlen = numpy.full(len(boundaries), 255, dtype=numpy.uint8)
+		numpy.minimum.at(minlen, segment, prefixlen[vrp])
+
+		# an AS0 VRP never matches anything (RFC 7607) - it only covers
+		rows = asn[vrp] != 0
+		vrp = vrp[rows]
+		keys = (segment[rows].astype(numpy.uint64) << numpy.uint64(32)) | asn[vrp]
+		order = numpy.argsort(keys, kind='stable')
+		keys = keys[order]
+		vrp = vrp[order]
+		max_run = int(numpy.unique(keys, return_counts=True)[1].max()) if len(keys) > 0 else 0
+		return boundaries, minlen, keys, prefixlen[vrp], maxlen[vrp], max_run
+
+class IndexPublisher(Subscriber):
+	"""RTR interval index"""
+
+	# rebuilds the index at End of Data, if the routing table changed - readers take current()
+	def __init__(self, router):
+		"""RTR interval index"""
+
+		self._router = router
+		self._built = None
+		self._current = None
+		self._build()
+
+	@classmethod
+	def attach(cls, router):
+		"""RTR interval index"""
+
+		publisher = cls(router)
+		router.subscribe(publisher)
+		return publisher
+
+	def current(self):
+		"""RTR interval index"""
+
+		return self._current
+
+	def end_of_data(self, session_id, serial):
+		"""RTR interval index"""
+
+		self._build()
+
+	def _build(self):
+		"""RTR interval index"""
+
+		routingtable = self._router.routingtable()
+		built = (id(routingtable), routingtable.generation() if routingtable is not None else 0)
+		try:
+			session_id = self._router.get_session_id()
+		except ValueError:
+			session_id = 0
+		if built == self._built:
+			# same VRPs under a new serial - share the arrays rather than rebuilding them
+			current = copy.copy(self._current)
+			current.session_id = session_id
+			current.serial = self._router.cache_serial_number()
+			self._current = current
+			return
+		self._current = IntervalIndex(routingtable, session_id, self._router.cache_serial_number())
+		self._built = built
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""RTR routing table journal"""
+
+import os
+import sys
+import zlib
+import struct
+
+try:
+	from rtr_vrp import VRP
+	from rtr_snapshot import Snapshot, atomic_link
+except ImportError:
+	from .rtr_vrp import VRP
+	from .rtr_snapshot import Snapshot, atomic_link
+
+#
+# The journal is a base snapshot plus an append-only file of per serial deltas.
+# Each delta record is a header followed by its announce then withdraw VRPs.
+#
+#   header:  marker 'RJ', session_id, serial, announce count, withdraw count, crc32 of the VRPs
+#   VRP:     version, prefixlen, maxlen, zero, prefix (16 bytes - IPv4 is right aligned), asn
+#
+
+_record_header = struct.Struct('!2sHLLLL')
+_record_vrp = struct.Struct('!BBBx16sL')
+
+class Journal(object):
+	"""RTR routing table journal"""
+
+	marker = b'RJ'
+	min_compact_size = 1024*1024
+
+	def __init__(self, directory='data/journal'):
+		"""RTR routing table journal"""
+
+		self.directory = directory
+		self.base_filename = os.path.join(directory, 'base.bin')
+		self.journal_filename = os.path.join(directory, 'journal.bin')
+		self._checked = False
+		self._deferred = False
+
+	def append(self, session_id, serial, announce, withdraw):
+		"""RTR routing table journal"""
+
+		body = b''.join(self._pack(vrp) for vrp in announce) + b''.join(
+				self._pack(vrp) for vrp in withdraw)
+		header = _record_header.pack(self.marker, session_id, serial, len(announce), len(withdraw),
+				zlib.crc32(body))
+		if not self._checked:
+			# a crash mid append leaves a partial record at the end - cut it off before adding more
+			self._truncate_bad_tail()
+		with open(self.journal_filename, 'ab') as fd:
+			fd.write(header + body)
+			fd.flush()
+			os.fsync(fd.fileno())
+
+	def records(self):
+		"""RTR routing table journal"""
+
+		# yields (session_id, serial, announce, withdraw) - stopping at the first bad or partial record
+		for _, record in self._records():
+			yield record
+
+	def serials(self):
+		"""RTR routing table journal"""
+
+		# the (session_id, serial) pairs that can be rebuilt - the base and every delta after it
+		session_id, serial = self._base_serial()
+		serials = []
+		if session_id is not None:
+			serials.append((session_id, serial))
+		for _, (session_id, serial, _, _) in self._records():
+			serials.append((session_id, serial))
+		return serials
+
+	def load(self, routingtable, serial=None):
+		"""RTR routing table journal"""
+
+		# rebuild the table as of serial (or the latest) from base + deltas - returns (session_id, serial)
+		if os.path.exists(self.base_filename):
+			session_id, base_serial = Snapshot(self.base_filename).read(routingtable)
+		else:
+			session_id, base_serial = (None, None)
+		latest_serial = base_serial
+		if serial is not None and serial == base_serial:
+			return session_id, latest_serial
+		for this_session_id, this_serial, announce, withdraw in self.records():
+			for vrp in announce:
+				try:
+					routingtable.announce(vrp)
+				except:
+					sys.stderr.write("journal: announce(%s) - failed\n" % (vrp))
+			for vrp in withdraw:
+				try:
+					routingtable.withdraw(vrp)
+				except:
+					sys.stderr.write("journal: withdraw(%s) - failed\n" % (vrp))
+			session_id = this_session_id
+			latest_serial = this_serial
+			if serial is not None and this_serial == serial:
+				break
+		if serial is not None and latest_serial != serial:
+			raise IndexError('journal: serial %d not available' % (serial))
+		return session_id, latest_serial
+
+	def size(self):
+		"""RTR routing table journal"""
+
+		try:
+			return os.path.getsize(self.journal_filename)
+		except FileNotFoundError:
+			return 0
+
+	def needs_compaction(self):
+		"""RTR routing table journal"""
+
+		# once replaying the deltas costs more than loading the base, fold them into the base
+		try:
+			base_size = os.path.getsize(self.base_filename)
+		except FileNotFoundError:
+			return True
+		return self.size() > max(self.min_compact_size, base_size)
+
+	def defer_compaction(self):
+		"""RTR routing table journal"""
+
+		# the table can't be written yet (the next update is already going into it) - deltas appended
+		# meanwhile might not be against the base, so none are until compact() has caught up
+		self._deferred = True
+
+	def deferred(self):
+		"""RTR routing table journal"""
+
+		return self._deferred
+
+	def compact(self, routingtable, session_id, serial, snapshot=None):
+		"""RTR routing table journal"""
+
+		# routingtable must be the table as of serial - it becomes the new base and the deltas go (a crash
+		# between the two steps is harmless - replaying old deltas over a newer base ends up the same)
+		os.makedirs(self.directory, exist_ok=True)
+		if not self._link_base(snapshot, session_id, serial):
+			Snapshot(self.base_filename).write(routingtable, session_id, serial)
+		with open(self.journal_filename, 'wb') as fd:
+			fd.flush()
+			os.fsync(fd.fileno())
+		self._checked = True
+		self._deferred = False
+
+	def _link_base(self, snapshot, session_id, serial):
+		"""RTR routing table journal"""
+
+		# a snapshot file that already holds this serial (the
+		# scheduled save) is linked rather than written again
+		if snapshot is None:
+			return False
+		try:
+			if Snapshot(snapshot).header()[0:2] != (session_id or 0, serial or 0):
+				return False
+			atomic_link(snapshot, self.base_filename)
+		except (OSError, ValueError):
+			# not a snapshot (a JSON file), or on another filesystem
+			return False
+		return True
+
+	def _pack(self, vrp):
+		"""RTR routing table journal"""
+
+		return _record_vrp.pack(vrp.version, vrp.prefixlen, vrp.maxlen, vrp.prefix.to_bytes(16, 'big'),
+				vrp.asn)
+
+	def _unpack(self, mv, offset, count):
+		"""RTR routing table journal"""
+
+		vrps = []
+		for version, prefixlen, maxlen, prefix, asn in _record_vrp.iter_unpack(
+				mv[offset:offset + count * _record_vrp.size]):
+			vrps.append(VRP(version, int.from_bytes(prefix, 'big'), prefixlen, maxlen, asn))
+		return vrps
+
+	def _records(self):
+		"""RTR routing table journal"""
+
+		try:
+			with open(self.journal_filename, 'rb') as fd:
+				data = fd.read()
+		except FileNotFoundError:
+			return
+		offset = 0
+		with memoryview(data) as mv:
+			while offset + _record_header.size <= len(data):
+				marker, session_id, serial, n_announce, n_withdraw, crc = _record_header.unpack_from(mv, offset)
+				body_offset = offset + _record_header.size
+				body_length = (n_announce + n_withdraw) * _record_vrp.size
+				if marker != self.marker or body_offset + body_length > len(data):
+					break
+				if zlib.crc32(mv[body_offset:body_offset + body_length]) != crc:
+					break
+				announce = self._unpack(mv, body_offset, n_announce)
+				withdraw = self._unpack(mv, body_offset + n_announce * _record_vrp.size, n_withdraw)
+				offset = body_offset + body_length
+				yield offset, (session_id, serial, announce, withdraw)
+
+	def _truncate_bad_tail(self):
+		"""RTR routing table journal"""
+
+		os.makedirs(self.directory, exist_ok=True)
+		good = 0
+		for offset, _ in self._records():
+			good = offset
+		if good != self.size():
+			sys.stderr.write("journal: %s: dropping %d bytes of partial record\n" % (
+					self.journal_filename, self.size() - good))
+			with open(self.journal_filename, 'r+b') as fd:
+				fd.truncate(good)
+		self._checked = True
+
+	def _base_serial(self):
+		"""RTR routing table journal"""
+
+		if not os.path.exists(self.base_filename):
+			return None, None
+		return Snapshot(self.base_filename).header()[0:2]
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""rtr_mock"""
+
+import sys
+import getopt
+import time
+import random
+import asyncio
+import logging
+
+try:
+	from rtr_protocol import rfc8210router
+	from rtr_routes import RoutingTable
+	from rtr_vrp import VRP
+	from rtr_server import RTRServer, _RouterProtocol
+	from __init__ import __version__
+except ImportError:
+	from .rtr_protocol import rfc8210router
+	from .rtr_routes import RoutingTable
+	from .rtr_vrp import VRP
+	from .rtr_server import RTRServer, _RouterProtocol
+	from .__init__ import __version__
+
+#
+# A stand-in RTR cache for load testing without the network. It serves synthetic VRPs (or the table
+# from a --dump raw file, which is also sent verbatim as the answer to each connection's first
+# query) and runs a script of deltas, notifies, cache resets and new sessions against it. Writes can
+# be cut into small fragments and throttled, so the client sees PDUs split across reads the way a
+# slow link splits them.
+#
+#   delta:ANNOUNCE[:WITHDRAW]   announce new VRPs and withdraw existing ones - and a Serial Notify
+#   notify                      a Serial Notify with nothing new
+#   reset                       drop the history - the next Serial Query gets a Cache Reset
+#   session                     a new session ID - routers have to start again
+#   sleep:SECONDS               wait (on top of the interval)
+#
+
+logger = logging.getLogger('RFC8210').getChild('mock')
+
+class VRPGenerator(object):
+	"""rtr_mock"""
+
+	# prefixes are handed out back to back (aligned to their size) so they
+	# are all unique - roughly the mix of lengths in the real table, with
+	# most VRPs having maxlen == prefixlen and the rest allowing /24 (/48)
+	ipv4_prefixlens = [18, 20, 22, 23, 24, 24, 24, 24]
+	ipv6_prefixlens = [29, 32, 36, 40, 44, 48, 48, 48]
+
+	def __init__(self, seed=8210):
+		"""rtr_mock"""
+
+		self._rnd = random.Random(seed)
+		self._ipv4_cursor = 1 << 24
+		self._ipv6_cursor = 0x2001 << 112
+
+	def ipv4(self, n):
+		"""rtr_mock"""
+
+		rnd = self._rnd
+		vrps = []
+		for _ in range(n):
+			prefixlen = rnd.choice(self.ipv4_prefixlens)
+			size = 1 << (32 - prefixlen)
+			prefix = ((self._ipv4_cursor + size - 1) & ~(size - 1)) & 0xffffffff
+			self._ipv4_cursor = prefix + size
+			maxlen = rnd.choice([prefixlen, prefixlen, prefixlen, 24])
+			vrps.append(VRP(4, prefix, prefixlen, max(prefixlen, maxlen), rnd.randrange(1, 400000)))
+		return vrps
+
+	def ipv6(self, n):
+		"""rtr_mock"""
+
+		rnd = self._rnd
+		vrps = []
+		for _ in range(n):
+			prefixlen = rnd.choice(self.ipv6_prefixlens)
+			size = 1 << (128 - prefixlen)
+			prefix = (self._ipv6_cursor + size - 1) & ~(size - 1)
+			self._ipv6_cursor = prefix + size
+			maxlen = rnd.choice([prefixlen, prefixlen, 48])
+			vrps.append(VRP(6, prefix, prefixlen, max(prefixlen, maxlen), rnd.randrange(1, 400000)))
+		return vrps
+
+	def vrps(self, n_ipv4, n_ipv6):
+		"""rtr_mock"""
+
+		return self.ipv4(n_ipv4) + self.ipv6(n_ipv6)
+
+	def sample(self, population, n):
+		"""rtr_mock"""
+
+		return self._rnd.sample(population, min(n, len(population)))
+
+	def coin(self):
+		"""rtr_mock"""
+
+		return self._rnd.random() < 0.5
+
+class _MockProtocol(_RouterProtocol):
+	"""rtr_mock"""
+
+	# writes of at most fragment bytes, delay seconds apart - both from the MockCache
+	def __init__(self, server):
+		"""rtr_mock"""
+
+		super().__init__(server)
+		self.replayed = False
+		self._timer = None
+
+	def connection_lost(self, exc):
+		"""rtr_mock"""
+
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		super().connection_lost(exc)
+
+	def _flush(self):
+		"""rtr_mock"""
+
+		fragment, delay = self._server.fragment, self._server.delay
+		if not fragment and not delay:
+			super()._flush()
+			return
+		if self._timer is not None:
+			# the next write is already scheduled
+			return
+		while self._queue and not self._paused and self.transport is not None:
+			chunk = self._queue.popleft()
+			if chunk is None:
+				self.transport.close()
+				return
+			if fragment and len(chunk) > fragment:
+				self._queue.appendleft(chunk[fragment:])
+				chunk = chunk[:fragment]
+			self.transport.write(chunk)
+			if delay:
+				self._timer = asyncio.get_running_loop().call_later(delay, self._next)
+				return
+
+	def _next(self):
+		"""rtr_mock"""
+
+		self._timer = None
+		self._flush()
+
+class MockCache(RTRServer):
+	"""rtr_mock"""
+
+	protocol = _MockProtocol
+
+	def __init__(self, n_ipv4=0, n_ipv6=0, seed=8210, replay=None, fragment=None, rate=None):
+		"""rtr_mock"""
+
+		self.routingtable = RoutingTable()
+		super().__init__(lambda: self.routingtable)
+		self.generator = VRPGenerator(seed)
+		self.replay = None
+		if replay is not None:
+			# the table (and session and serial) the dump ends
+			# with - queries after the replay are answered from it
+			rtr_session = rfc8210router(serial=0)
+			rtr_session.process(replay)
+			self.routingtable = rtr_session.routingtable()
+			self.session_id = rtr_session.get_session_id()
+			self.serial = rtr_session.cache_serial_number()
+			self._ready = True
+			self.replay = replay
+		announce = [vrp for vrp in self.generator.vrps(n_ipv4, n_ipv6) if vrp not in self.routingtable]
+		for vrp in announce:
+			self.routingtable.announce(vrp)
+		if replay is None:
+			self.update([], [], reset=True)
+		elif len(announce) > 0:
+			# the dump doesn't have the synthetic VRPs - so they're the serial after it
+			self.update(announce, [])
+
+		# a rate (bytes/sec) means writes of fragment bytes (a TCP segment by default), paced to match
+		self.fragment = fragment or (1460 if rate else None)
+		self.delay = self.fragment / rate if rate else 0
+
+	def churn(self, n_announce, n_withdraw):
+		"""rtr_mock"""
+
+		# one serial worth of changes - new prefixes from the generator and a sample of the existing VRPs
+		withdraw = self.generator.sample(list(self.routingtable), n_withdraw)
+		announce = []
+		for _ in range(n_announce):
+			announce += self.generator.ipv4(1) if self.generator.coin() else self.generator.ipv6(1)
+		for vrp in withdraw:
+			self.routingtable.withdraw(vrp)
+		for vrp in announce:
+			self.routingtable.announce(vrp)
+		self.update(announce, withdraw)
+
+	def cache_reset(self):
+		"""rtr_mock"""
+
+		# a new serial with no history to it - so the Serial Query after the notify gets a Cache Reset
+		self.update([], [], reset=True)
+
+	def new_session(self):
+		"""rtr_mock"""
+
+		self.session_id = (self.session_id % 65535) + 1
+		self.update([], [], reset=True)
+
+	def step(self, step):
+		"""rtr_mock"""
+
+		# one script step - returns the seconds to sleep for a sleep step, else 0
+		fields = step.split(':')
+		if fields[0] == 'delta':
+			n_announce = int(fields[1]) if len(fields) > 1 else 1
+			n_withdraw = int(fields[2]) if len(fields) > 2 else n_announce
+			self.churn(n_announce, n_withdraw)
+		elif fields[0] == 'notify':
+			self.notify()
+		elif fields[0] == 'reset':
+			self.cache_reset()
+		elif fields[0] == 'session':
+			self.new_session()
+		elif fields[0] == 'sleep':
+			return float(fields[1])
+		else:
+			raise ValueError('%s: unknown step' % (step))
+		logger.info('%s: session %d serial %d vrps %d', step, self.session_id, self.serial,
+				len(self.routingtable))
+		return 0
+
+	async def run_script(self, script, interval=10, repeat=1):
+		"""rtr_mock"""
+
+		# the interval comes first, so routers have connected
+		# before anything happens - repeat 0 is forever
+		n = 0
+		while repeat == 0 or n < repeat:
+			for step in script:
+				await asyncio.sleep(interval)
+				await asyncio.sleep(self.step(step))
+			n += 1
+
+	def query(self, protocol, version, pdu_type, field, pdu):
+		"""rtr_mock"""
+
+		if self.replay is not None and not protocol.replayed and pdu_type in (1, 2):
+			# the dump as it was captured - whatever the router asked for
+			protocol.replayed = True
+			protocol.version = version
+			protocol.send(self.replay)
+			return
+		super().query(protocol, version, pdu_type, field, pdu)
+
+def doit(args=None):
+	"""rtr_mock"""
+
+	host = '127.0.0.1'
+	port = 8282
+	n_ipv4 = 400000
+	n_ipv6 = 100000
+	seed = 8210
+	replay_filename = None
+	fragment = None
+	rate = None
+	interval = 10
+	repeat = 1
+
+	usage = ('usage: rtr_mock '
+		 + '[-H|--help] '
+		 + '[-V|--version] '
+		 + '[-v|--verbose] '
+		 + '[-h HOSTNAME|--host=HOSTNAME] '
+		 + '[-p PORTNUMBER|--port=PORTNUMBER] '
+		 + '[-4 COUNT|--ipv4=COUNT] '
+		 + '[-6 COUNT|--ipv6=COUNT] '
+		 + '[-s SEED|--seed=SEED] '
+		 + '[-R FILENAME|--replay=FILENAME] '
+		 + '[-F BYTES|--fragment=BYTES] '
+		 + '[-r BYTES|--rate=BYTES] '
+		 + '[-i SECONDS|--interval=SECONDS] '
+		 + '[-n COUNT|--repeat=COUNT] '
+		 + '[step ...]'
+		 )
+
+	try:
+		opts, args = getopt.getopt(args, 'HVvh:p:4:6:s:R:F:r:i:n:', [
+						'help',
+						'version',
+						'verbose',
+						'host=', 'port=',
+						'ipv4=',
+						'ipv6=',
+						'seed=',
+						'replay=',
+						'fragment=',
+						'rate=',
+						'interval=',
+						'repeat='
+						])
+	except getopt.GetoptError:
+		sys.exit(usage)
+
+	for opt, arg in opts:
+		if opt in ('-H', '--help'):
+			sys.exit(usage)
+		if opt in ('-V', '--version'):
+			sys.exit('%s: version: %s' % (sys.argv[0], __version__))
+		elif opt in ('-v', '--verbose'):
+			logging.basicConfig(level=logging.INFO)
+		elif opt in ('-h', '--host'):
+			host = arg
+		elif opt in ('-p', '--port'):
+			port = int(arg)
+		elif opt in ('-4', '--ipv4'):
+			n_ipv4 = int(arg)
+		elif opt in ('-6', '--ipv6'):
+			n_ipv6 = int(arg)
+		elif opt in ('-s', '--seed'):
+			seed = int(arg)
+		elif opt in ('-R', '--replay'):
+			replay_filename = arg
+			# just what's in the file unless asked for more
+			n_ipv4 = n_ipv6 = 0
+		elif opt in ('-F', '--fragment'):
+			fragment = int(arg)
+		elif opt in ('-r', '--rate'):
+			rate = int(arg)
+		elif opt in ('-i', '--interval'):
+			interval = float(arg)
+		elif opt in ('-n', '--repeat'):
+			repeat = int(arg)
+
+	replay = None
+	if replay_filename:
+		try:
+			with open(replay_filename, 'rb') as fd:
+				replay = fd.read()
+		except OSError as e:
+			sys.exit('%s' % (e))
+
+	t = time.perf_counter()
+	try:
+		cache = MockCache(n_ipv4, n_ipv6, seed, replay, fragment, rate)
+	except ValueError as e:
+		sys.exit('%s: %s' % (replay_filename, e))
+	sys.stderr.write('%d VRPs session %d serial %d in %.3f secs\n' % (
+			len(cache.routingtable), cache.session_id, cache.serial, time.perf_counter() - t))
+	sys.stderr.flush()
+
+	async def run():
+		"""rtr_mock"""
+		await cache.start(host, port)
+		try:
+			if args:
+				await cache.run_script(args, interval, repeat)
+			# keep serving once the script is done
+			await asyncio.Event().wait()
+		finally:
+			cache.close()
+
+	try:
+		asyncio.run(run())
+	except KeyboardInterrupt:
+		sys.exit(1)
+	except (OSError, ValueError) as e:
+		sys.exit('%s' % (e))
+	sys.exit(0)
+
+def main(args=None):
+	"""rtr_mock"""
+
+	if args is None:
+		args = sys.argv[1:]
+	doit(args)
+
+if __name__ == '__main__':
+	main()
@@ -3,19 +3,39 @@
 
 import sys
 import time
-import ipaddress
+import struct
 
 try:
 	from rtr_logging import rfc8210logger
 	from rtr_routes import RoutingTable
+	from rtr_subscriber import Subscriber, RouteBuffer
+	from rtr_vrp import VRP
 except ImportError:
 	from .rtr_logging import rfc8210logger
 	from .rtr_routes import RoutingTable
+	from .rtr_subscriber import Subscriber, RouteBuffer
+	from .rtr_vrp import VRP
+
+# precompiled layouts - all fields are network byte order
+_pdu_header = struct.Struct('!BBHL')			# version, type, session_id/flags/error_code, length
+_u32 = struct.Struct('!L')
+_end_of_data = struct.Struct('!LLLL')			# serial, refresh, retry, expire
+_ipv4_prefix = struct.Struct('!BBBxL')			# flags, prefixlen, maxlen, zero, prefix (no ASN)
+_ipv6_prefix = struct.Struct('!BBBxQQ')			# flags, prefixlen, maxlen, zero, prefix (hi, lo)
+_ipv4_prefix_pdu = struct.Struct('!BBHLBBBxLL')		# complete 20 byte IPv4 Prefix PDU
+_ipv6_prefix_pdu = struct.Struct('!BBHLBBBxQQL')	# complete 32 byte IPv6 Prefix PDU
+_ski = struct.Struct('!20s')
+
+def serial_reached(serial, target):
+	"""RTR RFC 8210 protocol"""
+
+	# RFC 1982 serial number arithmetic - serials wrap at 2^32
+	return ((serial - target) & 0xffffffff) < 0x80000000
 
 class rfc8210router(object):
 	"""RTR RFC 8210 protocol"""
 
-	def __init__(self, serial=None, session_id=None, debug=0):
+	def __init__(self, serial=None, session_id=None, debug=0, buffer_routes=False, routingtable=True):
 		"""RTR RFC 8210 protocol"""
 
 		self.time_next_refresh = None
@@ -42,12 +62,29 @@ class rfc8210router(object):
 		self._refresh_interval = 0
 		self._retry_interval = 0
 		self._expire_interval = 0
+		self._in_cache_response = False
+		self._reset_needed = False
+		self._end_of_data_count = 0
 		try:
-			self._routingtable = RoutingTable()
+			# routingtable=False decodes without keeping a table - rtr_bench times the decoder that way
+			self._routingtable = RoutingTable() if routingtable else None
 		except:
 			# this handles the case where RoutingTable() isn't configured correctly
 			self._routingtable = None
-		self.clear_routes()
+		self._subscribers = []
+		# the subscribers that want every Prefix PDU - see _streams()
+		self._streaming = []
+		self._n_routes = {'announce': 0, 'withdraw': 0}
+		self._staged = None
+		self._applied = None
+		self._direct = False
+		self._resync = False
+		self._complete = False
+		# routes() is only kept if asked for - otherwise memory doesn't grow with the size of an update
+		self._route_buffer = None
+		if buffer_routes:
+			self._route_buffer = RouteBuffer()
+			self.subscribe(self._route_buffer)
 
 	def _debug_(self, msg):
 		"""RTR RFC 8210 protocol"""
@@ -81,95 +118,50 @@ class rfc8210router(object):
 				return 'Reserved'
 		return str(pdu_type)
 
-	def _read_first4bytes(self, d):
+	def _read_header(self, pdu_type, field):
 		"""RTR RFC 8210 protocol"""
 
-		protocol_version = int(d[0])
-		pdu_type = int(d[1])
+		# the 16 bits after the PDU type mean different things per PDU type
 		if pdu_type in [0, 1, 3, 7]:
-			session_id = int(d[2]) * 256 + int(d[3])
-			header_flags = None
-			error_code = None
-		elif pdu_type in [2, 4, 6, 8]:
-			session_id = None
-			header_flags = None
-			error_code = None
-		elif pdu_type in [5]:
-			# not used! should not be seen
-			session_id = None
+			session_id = field
 			header_flags = None
 			error_code = None
 		elif pdu_type in [9]:
 			session_id = None
-			header_flags = int(d[2])
+			header_flags = field >> 8
 			error_code = None
 		elif pdu_type in [10]:
 			session_id = None
 			header_flags = None
-			error_code = int(d[2]) * 256 + int(d[3])
+			error_code = field
+		else:
+			# 2, 4, 6, 8 have zero here and 5 is not used! should not be seen
+			session_id = None
+			header_flags = None
+			error_code = None
 
 		if pdu_type not in [4, 6]:
 			# we don't debug the IPv4/IPv6 blocks because they are prolific
 			self._debug_("PDU: %s session_id='%s' header_flag='%s' error_code='%s'" % (
 							self._pdu_to_name(pdu_type), session_id, header_flags, error_code))
 
-		return pdu_type, session_id, header_flags, error_code
-
-	def _read_u32bits(self, d):
-		"""RTR RFC 8210 protocol"""
-
-		u32 = int(d[0]) * 256 * 256 * 256 + int(d[1]) * 256 * 256 + int(d[2]) * 256 + int(d[3])
-		# self._debug_('          uInt32 %d' % (u32))
-		return u32
+		return session_id, header_flags, error_code
 
-	def _read_4byte_length(self, d):
+	def _read_u32bits(self, d, offset=0):
 		"""RTR RFC 8210 protocol"""
 
-		packet_length = int(d[0]) * 256 * 256 * 256 + int(d[1]) * 256 * 256 + int(d[2]) * 256 + int(d[3])
-		# self._debug_('          Length %d' % (packet_length))
-		return packet_length
+		return _u32.unpack_from(d, offset)[0]
 
-	def _read_ipv4(self, d):
+	def _read_asn(self, d, offset=0):
 		"""RTR RFC 8210 protocol"""
 
-		ipv4 = "%d.%d.%d.%d" % (int(d[0]), int(d[1]), int(d[2]), int(d[3]))
-		# self._debug_('              IP %s' % (ipv4))
-		return ipv4
+		return _u32.unpack_from(d, offset)[0]
 
-	def _read_ipv6(self, d):
-		"""RTR RFC 8210 protocol"""
-
-		ipv6 = "%04x:%04x:%04x:%04x:%04x:%04x:%04x:%04x" % (
-						int(d[0]) * 256 + int(d[1]),
-						int(d[2]) * 256 + int(d[3]),
-						int(d[4]) * 256 + int(d[5]),
-						int(d[6]) * 256 + int(d[7]),
-						int(d[8]) * 256 + int(d[9]),
-						int(d[10]) * 256 + int(d[11]),
-						int(d[12]) * 256 + int(d[13]),
-						int(d[14]) * 256 + int(d[15]))
-		# self._debug_('              IP %s' % (ipv6))
-		return ipv6
-
-	def _read_asn(self, d):
-		"""RTR RFC 8210 protocol"""
-
-		asn = int(d[0]) * 256 * 256 * 256 + int(d[1]) * 256 * 256 + int(d[2]) * 256 + int(d[3])
-		# self._debug_('             ASN AS%d' % (asn))
-		return asn
-
-	def _read_ski(self, d):
+	def _read_ski(self, d, offset=0):
 		"""RTR RFC 8210 protocol"""
 
 		# The Key Identifier used for resource certificates is the 160-bit SHA-1 hash (RFC6487 4.8.2)
-		ski = "%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x%02x" % (
-						int(d[0]), int(d[1]), int(d[2]), int(d[3]),
-						int(d[4]), int(d[5]), int(d[6]), int(d[7]),
-						int(d[8]), int(d[9]), int(d[10]), int(d[11]),
-						int(d[12]), int(d[13]), int(d[14]), int(d[15]),
-						int(d[16]), int(d[17]), int(d[18]), int(d[19]))
-		# self._debug_('             SKI %s' % (ski))
-		return ski
+		return _ski.unpack_from(d, offset)[0].hex()
 
 	def _write_u32bits(self, u32):
 		"""RTR RFC 8210 protocol"""
@@ -191,30 +183,114 @@ class rfc8210router(object):
 		s[3] = u8d & 0xff
 		return bytes(s)
 
-	def _record_route(self, flag_announce, cidr, asn, maxlen=None):
+	def _record_route(self, flag_announce, vrp):
 		"""RTR RFC 8210 protocol"""
 
-		# Save away IP and ASN as needed
+		# the routing table (or the staged update) first - then anyone else that's interested
 		if flag_announce == 'A':
-			if maxlen:
-				self._routes['announce'] += [{'ip': cidr, 'asn': asn, 'maxlen': maxlen}]
+			self._n_routes['announce'] += 1
+			if self._staged is not None:
+				self._staged[vrp] = True
 			else:
-				self._routes['announce'] += [{'ip': cidr, 'asn': asn}]
-			if self._routingtable:
-				try:
-					self._routingtable.announce(cidr, asn, maxlen)
-				except:
-					sys.stderr.write("announce(%s, %s, %s) - failed\n" % (cidr, asn, maxlen))
+				self._apply_route('announce', vrp)
+			if self._streaming:
+				self._stream('announce', vrp)
 		else:
-			if maxlen:
-				self._routes['withdraw'] += [{'ip': cidr, 'asn': asn, 'maxlen': maxlen}]
+			self._n_routes['withdraw'] += 1
+			if self._staged is not None:
+				self._staged[vrp] = False
 			else:
-				self._routes['withdraw'] += [{'ip': cidr, 'asn': asn}]
+				self._apply_route('withdraw', vrp)
+			if self._streaming:
+				self._stream('withdraw', vrp)
+
+	def _apply_route(self, op, vrp):
+		"""RTR RFC 8210 protocol"""
+
+		if self._routingtable is not None:
+			try:
+				if op == 'announce':
+					self._routingtable.announce(vrp)
+				else:
+					self._routingtable.withdraw(vrp)
+			except:
+				# a repeated announce (or withdraw of something we don't have) changes nothing
+				self._debug_('%s(%s) - no change' % (op, vrp))
+				return
+		if self._applied is not None:
+			self._applied[op].append(vrp)
+
+	def _start_update(self):
+		"""RTR RFC 8210 protocol"""
+
+		# an update to a table that has VRPs is staged and netted down at End of Data - an empty table
+		# (first sync or after a reset) has nothing to net against, so VRPs go straight in
+		if self._routingtable is not None and len(self._routingtable) > 0:
+			self._staged = {}
+			self._direct = False
+		else:
+			self._staged = None
+			self._direct = self._routingtable is not None
+		# the first update after a Reset Query is the complete
+		# set - whatever it doesn't mention is withdrawn
+		self._complete = self._resync
+		self._resync = False
+		# the net changes are only collected if there's someone to give them to
+		self._applied = {'announce': [], 'withdraw': []} if self._subscribers else None
+
+	def _commit_update(self):
+		"""RTR RFC 8210 protocol"""
+
+		if self._staged is not None:
+			announce, withdraw = self._routingtable.apply(self._staged, self._complete)
+		elif self._applied is not None:
+			announce, withdraw = self._applied['announce'], self._applied['withdraw']
+		else:
+			announce, withdraw = [], []
+		self._staged = None
+		self._applied = None
+		self._direct = False
+		if self._subscribers:
+			self._notify('commit', announce, withdraw)
+
+	def _abort_update(self):
+		"""RTR RFC 8210 protocol"""
+
+		# a staged update never touched the table - so dropping it leaves the table as it was
+		if self._direct and len(self._routingtable) > 0:
+			# but one that went straight into an empty table did - empty it again, so the resync that
+			# follows starts from nothing and its commit() carries every VRP
+			self._routingtable.clear()
+		self._staged = None
+		self._applied = None
+		self._direct = False
+
+	def _notify(self, method, *args):
+		"""RTR RFC 8210 protocol"""
+
+		for subscriber in self._subscribers:
+			try:
+				getattr(subscriber, method)(*args)
+			except:
+				sys.stderr.write("%s.%s() - failed\n" % (subscriber.__class__.__name__, method))
+
+	def _stream(self, method, vrp):
+		"""RTR RFC 8210 protocol"""
+
+		for subscriber in self._streaming:
 			try:
-				if self._routingtable:
-					self._routingtable.withdraw(cidr, asn, maxlen)
+				getattr(subscriber, method)(vrp)
 			except:
-				sys.stderr.write("withdraw(%s, %s, %s) - failed\n" % (cidr, asn, maxlen))
+				sys.stderr.write("%s.%s() - failed\n" % (subscriber.__class__.__name__, method))
+
+	def _streams(self, subscriber):
+		"""RTR RFC 8210 protocol"""
+
+		# only a subscriber with its own announce() or withdraw() is called for each Prefix PDU - a resync
+		# is the whole set, and the rest only want commit()
+		cls = type(subscriber)
+		return (getattr(cls, 'announce', Subscriber.announce) is not Subscriber.announce
+			or getattr(cls, 'withdraw', Subscriber.withdraw) is not Subscriber.withdraw)
 
 	def _convert_to_hms(self, secs):
 		"""RTR RFC 8210 protocol"""
@@ -226,20 +302,21 @@ class rfc8210router(object):
 
 		if pdu_type == 0:
 			# Serial Notify
-			serial = self._read_u32bits(d[0:4])
+			serial = self._read_u32bits(d)
 			self._debug_('Serial Notify: cache_current_serial=%d latest_current_serial=%d serial=%d current_session_id=%s session_id=%d' % (
 							self.cache_serial_number(),
 							self.latest_serial_number(),
 							serial,
 							self._current_session_id,
 							session_id))
+			if not self._check_session_id(session_id):
+				return True
 			self.set_latest_serial_number(serial)
-			self.set_session_id(session_id)
 			return True
 
 		if pdu_type == 1:
 			# Serial Query - sent by router
-			n = self._read_u32bits(d[0:4])
+			n = self._read_u32bits(d)
 			self._debug_('Serial Query: serial=%d' % (n))
 			return True
 
@@ -251,62 +328,72 @@ class rfc8210router(object):
 		if pdu_type == 3:
 			# Cache Response
 			self._debug_('Cache Response: current_session_id=%s session_id=%d' % (self._current_session_id, session_id))
-			self.set_session_id(session_id)
+			self._check_session_id(session_id)
+			self._in_cache_response = True
+			self._n_routes = {'announce': 0, 'withdraw': 0}
+			self._start_update()
+			self._notify('cache_response', session_id)
 			return True
 
 		if pdu_type == 4 or pdu_type == 6:
-			flags = int(d[0])
-			if flags & 0x01 == 0x01:
-				flag_announce = 'A' # announcement
-			else:
-				flag_announce = 'W' # withdrawal
-			mask = int(d[1])
-			maxlen = int(d[2])
+			# only seen here if the PDU length is wrong - normal PDUs are handled in bulk by process()
 			if pdu_type == 6:
 				# IPv6
-				ip = self._read_ipv6(d[4:4 + 16])
-				asn = self._read_asn(d[20:20 + 4])
+				flags, prefixlen, maxlen, prefix_hi, prefix_lo = _ipv6_prefix.unpack_from(d, 0)
+				asn = self._read_asn(d, _ipv6_prefix.size)
+				self._prefix_pdu(6, flags, prefixlen, maxlen, (prefix_hi << 64) | prefix_lo, asn)
 			else:
 				# IPv4
-				ip = self._read_ipv4(d[4:4 + 4])
-				asn = self._read_asn(d[8:8 + 4])
-			cidr = ipaddress.ip_network(ip + '/' + str(mask))
-			if mask == maxlen:
-				if self._debug_level > 1:
-					self._debug_("%1s %-20s %4s AS%d" % (flag_announce, cidr, '', asn))
-				self._record_route(flag_announce, cidr, asn)
-			else:
-				if self._debug_level > 1:
-					self._debug_("%1s %-20s %4d AS%d" % (flag_announce, cidr, maxlen, asn))
-				self._record_route(flag_announce, cidr, asn, maxlen)
+				flags, prefixlen, maxlen, prefix = _ipv4_prefix.unpack_from(d, 0)
+				asn = self._read_asn(d, _ipv4_prefix.size)
+				self._prefix_pdu(4, flags, prefixlen, maxlen, prefix, asn)
 			return True
 
 		if pdu_type == 7:
 			# End of Data
-			latest_serial_number = self._read_u32bits(d[0:4])
-			self._refresh_interval = self._read_u32bits(d[4:8])
-			self._retry_interval = self._read_u32bits(d[8:12])
-			self._expire_interval = self._read_u32bits(d[12:16])
+			if len(d) < _end_of_data.size:
+				# version 0 (RFC 6810) is 12 bytes with no intervals - the defaults (and -t) apply
+				latest_serial_number = self._read_u32bits(d)
+				self._refresh_interval = self._retry_interval = self._expire_interval = 0
+			else:
+				(latest_serial_number,
+					self._refresh_interval,
+					self._retry_interval,
+					self._expire_interval) = _end_of_data.unpack_from(d, 0)
 			self._debug_('End of Data: n_routes=%d/%d session_id=%d serial=%d refresh=%s retry=%s expire=%s' % (
-							len(self._routes['announce']),
-							len(self._routes['withdraw']),
+							self._n_routes['announce'],
+							self._n_routes['withdraw'],
 							session_id,
 							latest_serial_number,
 							self._convert_to_hms(self._refresh_interval),
 							self._convert_to_hms(self._retry_interval),
 							self._convert_to_hms(self._expire_interval)
 						))
-			self.set_latest_serial_number(latest_serial_number)
+			self._in_cache_response = False
+			if not self._check_session_id(session_id):
+				self._abort_update()
+				return True
+			self._commit_update()
+			# a Serial Notify that came in during the response may already be past this serial - keep it
+			latest = self.latest_serial_number()
+			if latest == self.cache_serial_number() or serial_reached(latest_serial_number, latest):
+				self.set_latest_serial_number(latest_serial_number)
 			self.set_cache_serial_number(latest_serial_number)
 			self.time_set_refresh(self._refresh_interval)
-			self.set_session_id(session_id)
+			self._end_of_data_count += 1
+			self._notify('end_of_data', session_id, latest_serial_number)
 			return True
 
 		if pdu_type == 8:
 			# Cache Reset
 			self._debug_('Cache Reset:')
+			self._in_cache_response = False
+			self._abort_update()
 			self.set_latest_serial_number(0)
 			self.set_cache_serial_number(0)
+			# the cache can't give us a delta from our serial - we need to start again
+			self._reset_needed = True
+			self._notify('cache_reset')
 			return True
 
 		if pdu_type == 9:
@@ -315,9 +402,9 @@ class rfc8210router(object):
 				flag_announce = 'A' # announcement
 			else:
 				flag_announce = 'W' # withdrawal
-			ski = self._read_ski(d[4:4 + 20])
-			asn = self._read_asn(d[24:24 + 4])
-			subject_public_key = d[28:]
+			ski = self._read_ski(d, 4)
+			asn = self._read_asn(d, 24)
+			subject_public_key = bytes(d[28:])
 			self._debug_('Router Key: %1s SKI=%s AS%d %r ... NOT CODED YET' % (flag_announce, ski, asn, subject_public_key))
 			return True
 
@@ -335,37 +422,86 @@ class rfc8210router(object):
 		self._debug_('PDU: %d: Invalid PDU type' % (pdu_type))
 		return False
 
-	def process(self, packet_buffer):
+	def _prefix_pdu(self, version, flags, prefixlen, maxlen, prefix, asn):
 		"""RTR RFC 8210 protocol"""
 
-		data_index_max = len(packet_buffer)
-		data_index = 0
-		while data_index < data_index_max:
-			if (data_index_max - data_index) < 8:
-				# self._debug_('DATA EXPIRED: not enough for eight bytes')
-				break
-			d = packet_buffer[data_index:data_index + 4]
-			pdu_type, session_id, header_flags, error_code = self._read_first4bytes(d)
+		if flags & 0x01 == 0x01:
+			flag_announce = 'A' # announcement
+		else:
+			flag_announce = 'W' # withdrawal
+		vrp = VRP(version, prefix, prefixlen, maxlen, asn)
+		if self._debug_level > 1:
+			if prefixlen == maxlen:
+				self._debug_("%1s %-20s %4s AS%d" % (flag_announce, vrp.network(), '', asn))
+			else:
+				self._debug_("%1s %-20s %4d AS%d" % (flag_announce, vrp.network(), maxlen, asn))
+		self._record_route(flag_announce, vrp)
 
-			d = packet_buffer[data_index + 4:data_index + 8]
-			packet_length = self._read_4byte_length(d)
+	def _process_prefixes(self, mv, data_index, data_index_max, pdu_type):
+		"""RTR RFC 8210 protocol"""
 
-			if (data_index_max - data_index) < (packet_length):
-				# self._debug_('DATA EXPIRED: not enough for eight bytes plus data')
+		# a Cache Response is mostly a long run of back to back Prefix PDUs of the same size,
+		# so unpack the whole run in place and stop at the first PDU that's different
+		if pdu_type == 6:
+			pdu = _ipv6_prefix_pdu
+		else:
+			pdu = _ipv4_prefix_pdu
+		n_pdus = (data_index_max - data_index) // pdu.size
+		data_index_start = data_index
+		for fields in pdu.iter_unpack(mv[data_index:data_index + n_pdus * pdu.size]):
+			if fields[1] != pdu_type or fields[3] != pdu.size:
 				break
+			if pdu_type == 6:
+				self._prefix_pdu(6, fields[4], fields[5], fields[6], (fields[7] << 64) | fields[8], fields[9])
+			else:
+				self._prefix_pdu(4, fields[4], fields[5], fields[6], fields[7], fields[8])
+			data_index += pdu.size
+		return data_index - data_index_start
 
-			# We now know we have enough data in the packet
+	def process(self, packet_buffer, data_index=0):
+		"""RTR RFC 8210 protocol"""
 
-			d = packet_buffer[data_index + 8:data_index+packet_length]
-			data_index = data_index + packet_length
+		# packet_buffer can be bytes, bytearray or memoryview - PDUs start at data_index
+		with memoryview(packet_buffer) as mv:
+			data_index_max = len(mv)
+			while data_index < data_index_max:
+				if (data_index_max - data_index) < 8:
+					# self._debug_('DATA EXPIRED: not enough for eight bytes')
+					break
 
-			if not self._process_pdu(pdu_type, session_id, header_flags, error_code, d):
-				# something went wrong - this is not good
-				break
+				_, pdu_type, field, packet_length = _pdu_header.unpack_from(mv, data_index)
+
+				if (pdu_type == 4 and packet_length == _ipv4_prefix_pdu.size) or (
+						pdu_type == 6 and packet_length == _ipv6_prefix_pdu.size):
+					n = self._process_prefixes(mv, data_index, data_index_max, pdu_type)
+					if n == 0:
+						# not enough data for even one PDU
+						break
+					data_index = data_index + n
+					continue
+
+				if packet_length < 8:
+					# a PDU can't be shorter than its header - this is not good
+					self._debug_('PDU: %s: Invalid length %d' % (self._pdu_to_name(pdu_type), packet_length))
+					break
+
+				if (data_index_max - data_index) < (packet_length):
+					# self._debug_('DATA EXPIRED: not enough for eight bytes plus data')
+					break
+
+				# We now know we have enough data in the packet
+
+				session_id, header_flags, error_code = self._read_header(pdu_type, field)
+				d = mv[data_index + 8:data_index + packet_length]
+				data_index = data_index + packet_length
 
-		if data_index != data_index_max:
-			# self._debug_('DATA EXPIRED: data_index=%d data_index_max=%d' % (data_index, data_index_max))
-			pass
+				if not self._process_pdu(pdu_type, session_id, header_flags, error_code, d):
+					# something went wrong - this is not good
+					break
+
+			if data_index != data_index_max:
+				# self._debug_('DATA EXPIRED: data_index=%d data_index_max=%d' % (data_index, data_index_max))
+				pass
 
 		# tell upstream how many bytes left in data
 		return data_index_max - data_index
@@ -419,11 +555,182 @@ class rfc8210router(object):
 		"""
 		self.set_latest_serial_number(0)
 		self.set_cache_serial_number(0)
-		self.set_session_id(0)
+		# the next Cache Response tells us the session_id
+		self._current_session_id = None
+		self._current_session_id_exists = False
+		self._reset_needed = False
+		# a full set of VRPs is coming - it's diffed against the table at End
+		# of Data rather than starting from empty, so only the real changes
+		# are applied and passed on (and the table stays usable meanwhile)
+		self._abort_update()
+		self._resync = True
+		self._notify('reset')
 		reset_query = self._write_u8bits_by4(1, 2, 0, 0) + self._write_u32bits(8)
 		self._debug_('SEND RESET QUERY: %r' % (reset_query))
 		return reset_query
 
+	#
+	# The cache side - these build the PDUs a cache sends (see rtr_server). The protocol version is the
+	# one the router used in its query.
+	#
+
+	def serial_notify(self, session_id, serial, version=1):
+		"""
+		   0          8          16         24        31
+		   .-------------------------------------------.
+		   | Protocol |   PDU    |                     |
+		   | Version  |   Type   |     Session ID      |
+		   |    1     |    0     |                     |
+		   +-------------------------------------------+
+		   |                                           |
+		   |                Length=12                  |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |               Serial Number               |
+		   |                                           |
+		   `-------------------------------------------'
+		"""
+		return _pdu_header.pack(version, 0, session_id, 12) + _u32.pack(serial)
+
+	def cache_response(self, session_id, version=1):
+		"""
+		   0          8          16         24        31
+		   .-------------------------------------------.
+		   | Protocol |   PDU    |                     |
+		   | Version  |   Type   |     Session ID      |
+		   |    1     |    3     |                     |
+		   +-------------------------------------------+
+		   |                                           |
+		   |                 Length=8                  |
+		   |                                           |
+		   `-------------------------------------------'
+		"""
+		return _pdu_header.pack(version, 3, session_id, 8)
+
+	def prefix_pdus(self, vrps, announce=True, version=1):
+		"""
+		   0          8          16         24        31
+		   .-------------------------------------------.
+		   | Protocol |   PDU    |                     |
+		   | Version  |   Type   |         zero        |
+		   |    1     |  4 or 6  |                     |
+		   +-------------------------------------------+
+		   |                                           |
+		   |             Length=20 or 32               |
+		   |                                           |
+		   +-------------------------------------------+
+		   |          |  Prefix  |   Max    |          |
+		   |  Flags   |  Length  |  Length  |   zero   |
+		   |          |  0..32   |  0..32   |          |
+		   +-------------------------------------------+
+		   |                                           |
+		   |        IPv4 or IPv6 Prefix (4 or 16)      |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |         Autonomous System Number          |
+		   |                                           |
+		   `-------------------------------------------'
+		"""
+		# one Prefix PDU per VRP, all joined - flags bit 0 is announce (1) or withdraw (0)
+		flags = 1 if announce else 0
+		pdus = []
+		for vrp in vrps:
+			if vrp.version == 6:
+				pdus.append(_ipv6_prefix_pdu.pack(version, 6, 0, _ipv6_prefix_pdu.size, flags, vrp.prefixlen,
+						vrp.maxlen, vrp.prefix >> 64, vrp.prefix & 0xffffffffffffffff, vrp.asn))
+			else:
+				pdus.append(_ipv4_prefix_pdu.pack(version, 4, 0, _ipv4_prefix_pdu.size, flags, vrp.prefixlen,
+						vrp.maxlen, vrp.prefix, vrp.asn))
+		return b''.join(pdus)
+
+	def end_of_data(self, session_id, serial, refresh=3600, retry=600, expire=7200, version=1):
+		"""
+		   0          8          16         24        31
+		   .-------------------------------------------.
+		   | Protocol |   PDU    |                     |
+		   | Version  |   Type   |     Session ID      |
+		   |    1     |    7     |                     |
+		   +-------------------------------------------+
+		   |                                           |
+		   |                 Length=24                 |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |               Serial Number               |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |              Refresh Interval             |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |               Retry Interval              |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |              Expire Interval              |
+		   |                                           |
+		   `-------------------------------------------'
+		"""
+		if version == 0:
+			# version 0 (RFC 6810) has no intervals
+			return _pdu_header.pack(version, 7, session_id, 12) + _u32.pack(serial)
+		return (_pdu_header.pack(version, 7, session_id, 24)
+				+ _end_of_data.pack(serial, refresh, retry, expire))
+
+	def cache_reset(self, version=1):
+		"""
+		   0          8          16         24        31
+		   .-------------------------------------------.
+		   | Protocol |   PDU    |                     |
+		   | Version  |   Type   |         zero        |
+		   |    1     |    8     |                     |
+		   +-------------------------------------------+
+		   |                                           |
+		   |                 Length=8                  |
+		   |                                           |
+		   `-------------------------------------------'
+		"""
+		return _pdu_header.pack(version, 8, 0, 8)
+
+	def error_report(self, error_code, pdu=b'', text='', version=1):
+		"""
+		   0          8          16         24        31
+		   .-------------------------------------------.
+		   | Protocol |   PDU    |                     |
+		   | Version  |   Type   |     Error Code      |
+		   |    1     |    10    |                     |
+		   +-------------------------------------------+
+		   |                                           |
+		   |                  Length                   |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |       Length of Encapsulated PDU          |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   ~               Erroneous PDU               ~
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |           Length of Error Text            |
+		   |                                           |
+		   +-------------------------------------------+
+		   |                                           |
+		   |              Arbitrary Text               |
+		   |                    of                     |
+		   ~          Error Diagnostic Message         ~
+		   |                                           |
+		   `-------------------------------------------'
+		"""
+		text = text.encode('utf-8')
+		length = _pdu_header.size + 4 + len(pdu) + 4 + len(text)
+		return (_pdu_header.pack(version, 10, error_code, length) + _u32.pack(len(pdu)) + bytes(pdu)
+				+ _u32.pack(len(text)) + text)
+
 	def get_session_id(self):
 		"""RTR RFC 8210 protocol"""
 
@@ -467,36 +774,112 @@ class rfc8210router(object):
 	def time_set_refresh(self, t):
 		"""RTR RFC 8210 protocol"""
 
-		if t > 60:
-			# CHEAT
-			t = 60
 		self.time_next_refresh = self.time_now() + t
 
 	def time_remaining(self):
 		"""RTR RFC 8210 protocol"""
 
-		now = self.time_now()
-		if self.time_next_refresh and now < self.time_next_refresh:
-			return True
-		self.time_set_refresh(15)
-		return False
+		# True until the cache's refresh interval is up
+		return self.time_next_refresh is not None and self.time_now() < self.time_next_refresh
+
+	# RFC 8210 section 6 - used until an End of Data tells us otherwise
+	default_refresh_interval = 3600
+	default_retry_interval = 600
+	default_expire_interval = 7200
+
+	def refresh_interval(self):
+		"""RTR RFC 8210 protocol"""
+
+		return self._refresh_interval or self.default_refresh_interval
+
+	def retry_interval(self):
+		"""RTR RFC 8210 protocol"""
+
+		return self._retry_interval or self.default_retry_interval
+
+	def expire_interval(self):
+		"""RTR RFC 8210 protocol"""
+
+		return self._expire_interval or self.default_expire_interval
+
+	def notified(self):
+		"""RTR RFC 8210 protocol"""
+
+		# True when a Serial Notify has told us about a serial we don't have yet
+		return not self._in_cache_response and self.latest_serial_number() != self.cache_serial_number()
+
+	def save_routing_table(self, filename='data/routingtable.bin'):
+		"""RTR RFC 8210 protocol"""
+
+		if self._routingtable is not None:
+			return self._routingtable.save_routing_table(filename, self._current_session_id,
+					self.cache_serial_number())
+		return 0
+
+	def _check_session_id(self, session_id):
+		"""RTR RFC 8210 protocol"""
+
+		# a different session_id means our serial numbers mean nothing to this cache (RFC 8210 5.1)
+		if self._current_session_id_exists and session_id != self._current_session_id:
+			self._debug_('Session ID mismatch: current_session_id=%s session_id=%d' % (
+					self._current_session_id, session_id))
+			self._reset_needed = True
+			return False
+		self.set_session_id(session_id)
+		return True
+
+	def reset_needed(self):
+		"""RTR RFC 8210 protocol"""
+
+		# True after a Cache Reset or a session_id mismatch - send a reset_query()
+		return self._reset_needed
+
+	def in_cache_response(self):
+		"""RTR RFC 8210 protocol"""
+
+		# True between a Cache Response and its End of Data - the routing table is half updated
+		return self._in_cache_response
+
+	def end_of_data_count(self):
+		"""RTR RFC 8210 protocol"""
+
+		# goes up by one for every good End of Data - even one that didn't change the serial
+		return self._end_of_data_count
+
+	def routingtable(self):
+		"""RTR RFC 8210 protocol"""
+
+		return self._routingtable
+
+	def subscribe(self, subscriber):
+		"""RTR RFC 8210 protocol"""
+
+		# see rtr_subscriber - called as each PDU is decoded
+		self._subscribers.append(subscriber)
+		if self._streams(subscriber):
+			self._streaming.append(subscriber)
 
-	def save_routing_table(self):
+	def unsubscribe(self, subscriber):
 		"""RTR RFC 8210 protocol"""
 
-		if self._routingtable:
-			self._routingtable.save_routing_table()
+		self._subscribers.remove(subscriber)
+		if subscriber in self._streaming:
+			self._streaming.remove(subscriber)
 
 	def routes(self):
 		"""RTR RFC 8210 protocol"""
 
-		return self._routes
+		# only filled in with buffer_routes=True
+		if self._route_buffer is None:
+			return {'announce': [], 'withdraw': []}
+		return self._route_buffer.routes()
 
 	def clear_routes(self):
 		"""RTR RFC 8210 protocol"""
 
-		self._routes = {'announce': [], 'withdraw': []}
+		if self._route_buffer is not None:
+			self._route_buffer.clear()
 		# turns out you don't clear the routing table
-		#if self._routingtable:
+		#if self._routingtable is not None:
 		#	self._routingtable.clear()
 
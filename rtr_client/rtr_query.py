@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""RTR query server"""
+
+import sys
+import os
+import getopt
+import json
+import socket
+import asyncio
+import logging
+import ipaddress
+import urllib.parse
+from collections import OrderedDict
+
+try:
+	import pytricia
+except:
+	pytricia = None
+
+try:
+	from rtr_routes import route_key
+	from rtr_session import RTRSession
+	from rtr_group import CacheGroup
+	from __init__ import __version__
+except ImportError:
+	from .rtr_routes import route_key
+	from .rtr_session import RTRSession
+	from .rtr_group import CacheGroup
+	from .__init__ import __version__
+
+#
+# Lookups against the live routing table - over a Unix socket (a line per query, a line of JSON
+# back) or local HTTP (GET /validate?prefix=1.1.1.0/24&asn=13335). Validation results are cached;
+# each delta only drops the cached routes that its VRPs cover, everything else stays.
+#
+#   validate PREFIX ASN     /validate?prefix=PREFIX&asn=ASN
+#   show PREFIX [long]      /show?prefix=PREFIX&long=1
+#   asn ASN                 /asn?asn=ASN
+#   status                  /status
+#
+
+logger = logging.getLogger('RFC8210').getChild('query')
+
+class ValidationCache(object):
+	"""RTR query server"""
+
+	maxsize = 100000
+
+	def __init__(self, maxsize=None):
+		"""RTR query server"""
+
+		if not pytricia:
+			raise Exception("pytricia not installed")
+		if maxsize is not None:
+			self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self.invalidated = 0
+		self.clear()
+
+	def __len__(self):
+		"""RTR query server"""
+
+		return len(self._results)
+
+	def clear(self):
+		"""RTR query server"""
+
+		# (version, (packed, prefixlen), origin_asn): result - in least recently used order
+		self._results = OrderedDict()
+		# the cached routes by prefix - so a VRP can find the routes it covers
+		self._routes = {4: pytricia.PyTricia(32, socket.AF_INET, True),
+				6: pytricia.PyTricia(128, socket.AF_INET6, True)}
+
+	def get(self, key):
+		"""RTR query server"""
+
+		result = self._results.get(key)
+		if result is None:
+			self.misses += 1
+			return None
+		self._results.move_to_end(key)
+		self.hits += 1
+		return result
+
+	def put(self, key, result):
+		"""RTR query server"""
+
+		version, route, origin_asn = key
+		self._results[key] = result
+		self._results.move_to_end(key)
+		trie = self._routes[version]
+		if not trie.has_key(route):
+			trie.insert(route, set())
+		trie.get(route).add(origin_asn)
+		while len(self._results) > self.maxsize:
+			self._discard(next(iter(self._results)))
+
+	def invalidate(self, vrps):
+		"""RTR query server"""
+
+		# a VRP can only change the answer for routes at or inside its prefix
+		for vrp in vrps:
+			trie = self._routes[vrp.version]
+			key = vrp.key()
+			added = not trie.has_key(key)
+			if added:
+				# children() wants a prefix that's in the trie
+				trie.insert(key, set())
+			routes = [key] + trie.children(key)
+			for route in routes:
+				for origin_asn in list(trie.get(route)):
+					self._discard((vrp.version, route, origin_asn))
+					self.invalidated += 1
+			if added and trie.has_key(key):
+				trie.delete(key)
+
+	def _discard(self, key):
+		"""RTR query server"""
+
+		version, route, origin_asn = key
+		del self._results[key]
+		trie = self._routes[version]
+		origin_asns = trie.get(route)
+		origin_asns.discard(origin_asn)
+		if len(origin_asns) == 0:
+			trie.delete(route)
+
+class QueryServer(object):
+	"""RTR query server"""
+
+	def __init__(self, routingtable, cache_size=None):
+		"""RTR query server"""
+
+		# routingtable() returns the table to answer from (or
+		# None before the first sync) - e.g. group.routingtable
+		self._routingtable = routingtable
+		self.cache = ValidationCache(cache_size)
+		self._servers = []
+		self._serial = None
+		self._session_id = None
+
+	def delta(self, session, delta):
+		"""RTR query server"""
+
+		# a delta callback - for RTRSession or CacheGroup
+		self._session_id = delta.session_id
+		self._serial = delta.serial
+		if delta.reset or len(delta.announce) + len(delta.withdraw) > len(self.cache):
+			# cheaper to start again
+			self.cache.clear()
+			return
+		self.cache.invalidate(delta.announce)
+		self.cache.invalidate(delta.withdraw)
+
+	async def start_unix(self, path):
+		"""RTR query server"""
+
+		try:
+			# a socket left behind by an earlier run
+			os.unlink(path)
+		except FileNotFoundError:
+			pass
+		self._servers.append(await asyncio.start_unix_server(self._serve_lines, path))
+
+	async def start_http(self, host='127.0.0.1', port=8323):
+		"""RTR query server"""
+
+		self._servers.append(await asyncio.start_server(self._serve_http, host, port))
+
+	def close(self):
+		"""RTR query server"""
+
+		for server in self._servers:
+			server.close()
+		self._servers = []
+
+	def query(self, command, prefix=None, asn=None, show_long=False):
+		"""RTR query server"""
+
+		# a dict ready for JSON - raises ValueError for a bad query
+		if command == 'status':
+			routingtable = self._routingtable()
+			return {'session_id': self._session_id, 'serial': self._serial,
+				'vrps': len(routingtable) if routingtable is not None else 0,
+				'cache': {'size': len(self.cache), 'hits': self.cache.hits, 'misses': self.cache.misses,
+					'invalidated': self.cache.invalidated}}
+		if command not in ('validate', 'show', 'asn'):
+			raise ValueError('%s: unknown query' % (command))
+		routingtable = self._routingtable()
+		if routingtable is None:
+			raise ValueError('no routing table yet')
+
+		if command == 'asn':
+			asn = self._asn(asn)
+			return {'asn': asn, 'vrps': [vrp.to_json() for vrp in routingtable.by_asn(asn)]}
+
+		if prefix is None:
+			raise ValueError('%s: needs a prefix' % (command))
+		try:
+			version, route = route_key(prefix)
+		except (ValueError, OSError):
+			raise ValueError('%s: bad prefix' % (prefix))
+		prefix = str(ipaddress.ip_network(route))
+		if command == 'show':
+			return {'prefix': prefix,
+					'vrps': [vrp.to_json() for vrp in routingtable.show_vrps(route, show_long)]}
+
+		origin_asn = self._asn(asn)
+		key = (version, route, origin_asn)
+		result = self.cache.get(key)
+		if result is None:
+			state, matched, covering = routingtable.validate(route, origin_asn)
+			result = {'prefix': prefix, 'origin_asn': origin_asn, 'state': state,
+				'matched': [vrp.to_json() for vrp in matched], 'covering': [vrp.to_json() for vrp in covering]}
+			self.cache.put(key, result)
+		return result
+
+	def _asn(self, asn):
+		"""RTR query server"""
+
+		# 13335 or AS13335
+		try:
+			return int(str(asn).upper().replace('AS', '', 1))
+		except ValueError:
+			raise ValueError('%s: bad asn' % (asn))
+
+	def _answer(self, command, prefix=None, asn=None, show_long=False):
+		"""RTR query server"""
+
+		try:
+			return True, self.query(command, prefix, asn, show_long)
+		except ValueError as e:
+			return False, {'error': str(e)}
+		except Exception as e:
+			logger.exception('%s: query failed', command)
+			return False, {'error': str(e)}
+
+	async def _readline(self, reader):
+		"""RTR query server"""
+
+		# None for a line over the reader's limit (it's been discarded) - b'' at EOF
+		try:
+			return await reader.readline()
+		except (ValueError, asyncio.LimitOverrunError):
+			return None
+
+	async def _serve_lines(self, reader, writer):
+		"""RTR query server"""
+
+		try:
+			while True:
+				line = await self._readline(reader)
+				if line is None:
+					writer.write(json.dumps({'error': 'line too long'}).encode() + b'\n')
+					await writer.drain()
+					break
+				if not line:
+					break
+				fields = line.decode('ascii', 'replace').split()
+				if len(fields) == 0:
+					continue
+				command, args = fields[0], fields[1:]
+				if command == 'asn':
+					_, result = self._answer(command, asn=args[0] if args else None)
+				elif command == 'show':
+					_, result = self._answer(command, args[0] if args else None, show_long='long' in args[1:])
+				else:
+					_, result = self._answer(command, *args[:2])
+				writer.write(json.dumps(result).encode() + b'\n')
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+	def _http_response(self, writer, status, result, keep_alive):
+		"""RTR query server"""
+
+		body = json.dumps(result).encode()
+		writer.write(('HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n%s\r\n' % (
+						status, len(body), '' if keep_alive else 'Connection: close\r\n')).encode('latin-1') + body)
+
+	async def _serve_http(self, reader, writer):
+		"""RTR query server"""
+
+		# just enough HTTP/1.1 for GET with keep-alive
+		try:
+			while True:
+				request = await self._readline(reader)
+				if request == b'':
+					break
+				headers = {}
+				too_long = request is None
+				while not too_long:
+					line = await self._readline(reader)
+					if line is None:
+						too_long = True
+					elif line in (b'\r\n', b'\n', b''):
+						break
+					else:
+						name, _, value = line.decode('latin-1').partition(':')
+						headers[name.strip().lower()] = value.strip()
+				if too_long:
+					self._http_response(writer, '431 Request Header Fields Too Large',
+							{'error': 'request too long'}, False)
+					await writer.drain()
+					break
+				try:
+					method, target, version = request.decode('latin-1').split()
+				except ValueError:
+					break
+				url = urllib.parse.urlsplit(target)
+				params = dict(urllib.parse.parse_qsl(url.query))
+				if method != 'GET':
+					result, status = {'error': '%s: method not allowed' % (method)}, '405 Method Not Allowed'
+				else:
+					ok, result = self._answer(url.path.strip('/'), params.get('prefix'), params.get('asn'),
+							params.get('long') in ('1', 'true', 'yes'))
+					status = '200 OK' if ok else '400 Bad Request'
+				keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+				self._http_response(writer, status, result, keep_alive)
+				await writer.drain()
+				if not keep_alive:
+					break
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+def parse_listen(arg, host='127.0.0.1'):
+	"""RTR query server"""
+
+	# [HOST:]PORT - local only unless a host is given, [::1]:PORT for IPv6
+	address, _, port = arg.rpartition(':')
+	return (address.strip('[]') or host, int(port))
+
+def doit(args=None):
+	"""RTR query server"""
+
+	caches = []
+	unix_path = None
+	http = None
+	cache_size = None
+
+	usage = ('usage: rtr_query '
+		 + '[-H|--help] '
+		 + '[-V|--version] '
+		 + '[-v|--verbose] '
+		 + '[-c HOST[,PORT]|--cache=HOST[,PORT] ...] '
+		 + '[-u PATH|--unix=PATH] '
+		 + '[-w [HOST:]PORT|--http=[HOST:]PORT] '
+		 + '[-n COUNT|--cache-size=COUNT] '
+		 )
+
+	try:
+		opts, args = getopt.getopt(args, 'HVvc:u:w:n:', [
+						'help',
+						'version',
+						'verbose',
+						'cache=',
+						'unix=',
+						'http=',
+						'cache-size='
+						])
+	except getopt.GetoptError:
+		sys.exit(usage)
+
+	for opt, arg in opts:
+		if opt in ('-H', '--help'):
+			sys.exit(usage)
+		if opt in ('-V', '--version'):
+			sys.exit('%s: version: %s' % (sys.argv[0], __version__))
+		elif opt in ('-v', '--verbose'):
+			logging.basicConfig(level=logging.INFO)
+		elif opt in ('-c', '--cache'):
+			# HOST[,PORT]
+			fields = arg.split(',')
+			try:
+				caches.append((fields[0], int(fields[1]) if len(fields) > 1 and fields[1] else None))
+			except ValueError:
+				sys.exit(usage)
+		elif opt in ('-u', '--unix'):
+			unix_path = arg
+		elif opt in ('-w', '--http'):
+			try:
+				http = parse_listen(arg)
+			except ValueError:
+				sys.exit(usage)
+		elif opt in ('-n', '--cache-size'):
+			cache_size = int(arg)
+
+	if unix_path is None and http is None:
+		sys.exit(usage)
+	if not caches:
+		caches = [(None, None)]
+
+	# beside rtr_client - this follows the cache(s) itself, inside it use rtr_client -q/-Q
+	async def run():
+		"""RTR query server"""
+		group = CacheGroup()
+		for host, port in caches:
+			group.add(RTRSession(host, port))
+		server = QueryServer(group.routingtable, cache_size)
+		group.add_callback('delta', server.delta)
+		if unix_path:
+			await server.start_unix(unix_path)
+		if http:
+			await server.start_http(*http)
+		try:
+			await group.run()
+		finally:
+			server.close()
+
+	try:
+		asyncio.run(run())
+	except KeyboardInterrupt:
+		sys.exit(1)
+	except OSError as e:
+		sys.exit('%s' % (e))
+	sys.exit(0)
+
+def main(args=None):
+	"""RTR query server"""
+
+	if args is None:
+		args = sys.argv[1:]
+	doit(args)
+
+if __name__ == '__main__':
+	main()
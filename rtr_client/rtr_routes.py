@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 """RTR protocol basic Routing Table support"""
 
+import os
 import json
+import socket
 import ipaddress
 
 try:
@@ -9,139 +11,396 @@ try:
 except:
 	pytricia = None
 
+try:
+	from rtr_vrp import VRP
+	from rtr_snapshot import Snapshot, atomic_write
+except ImportError:
+	from .rtr_vrp import VRP
+	from .rtr_snapshot import Snapshot, atomic_write
+
+# RFC 6811 route origin validation states
+VALID = 'Valid'
+INVALID = 'Invalid'
+NOT_FOUND = 'NotFound'
+
+def route_key(cidr):
+	"""RTR protocol basic Routing Table support"""
+
+	# (version, (packed prefix, prefixlen)) - from an ipaddress network, a VRP, a 'prefix/len' string
+	# or an already packed (bytes, len) key
+	if isinstance(cidr, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+		return cidr.version, (cidr.network_address.packed, cidr.prefixlen)
+	if isinstance(cidr, tuple):
+		if len(cidr[0]) == 4:
+			return 4, cidr
+		return 6, cidr
+	if isinstance(cidr, VRP):
+		return cidr.version, cidr.key()
+	address, _, prefixlen = str(cidr).partition('/')
+	if ':' in address:
+		packed = socket.inet_pton(socket.AF_INET6, address)
+		return 6, (packed, int(prefixlen) if prefixlen else 128)
+	packed = socket.inet_pton(socket.AF_INET, address)
+	return 4, (packed, int(prefixlen) if prefixlen else 32)
+
+def vrp_matches(asn, maxlen, prefixlen, origin_asn):
+	"""RTR protocol basic Routing Table support"""
+
+	# does a covering VRP match a route - an AS0 VRP never matches anything (RFC 7607)
+	return asn == origin_asn and prefixlen <= maxlen and asn != 0
+
 class RoutingTable(object):
 	"""RTR protocol basic Routing Table support"""
 
-	def __init__(self):
+	def __init__(self, ipv=None, asns=None, count=0):
 		"""RTR protocol basic Routing Table support"""
 
 		if not pytricia:
 			raise Exception("pytricia not installed")
+		self._generation = 0
 		self._clear()
+		if ipv is not None:
+			# the tries and reverse index of a table that copy() or updated() built
+			self._ipv = ipv
+			self._asns = asns
+			self._changed(count)
 
-	def announce(self, cidr, asn, maxlen=None):
+	def announce(self, vrp):
 		"""RTR protocol basic Routing Table support"""
 
-		version = cidr.version
-		if not maxlen:
-			maxlen = cidr.prefixlen
-		if not self._ipv[version].has_key(cidr):
-			self._ipv[version].insert(cidr, {})
-		if maxlen not in self._ipv[version][cidr]:
+		# each prefix holds {maxlen: {asn, ...}} - the prefix itself is the trie key
+		trie = self._ipv[vrp.version]
+		key = vrp.key()
+		if trie.has_key(key):
+			rr = trie[key]
+		else:
+			rr = {}
+			trie.insert(key, rr)
+		if vrp.maxlen not in rr:
 			# we know we can enter the data raw and be done!
-			self._ipv[version][cidr][maxlen] = [{asn:cidr}]
-			return
-
-		if asn in self._ipv[version][cidr][maxlen]:
-			raise Exception("announce1: %s %s %s" % (cidr, asn, maxlen))
-		try:
-			self._ipv[version][cidr][maxlen] += [{asn:cidr}]
-		except:
-			raise Exception("announce2: %s %s %s" % (cidr, asn, maxlen))
+			rr[vrp.maxlen] = {vrp.asn}
+		elif vrp.asn in rr[vrp.maxlen]:
 			# asn already in there
+			raise Exception("announce1: %s" % (vrp))
+		else:
+			rr[vrp.maxlen].add(vrp.asn)
+		# the reverse index - asn to (version, prefix, prefixlen, maxlen)
+		asns = self._asns.get(vrp.asn)
+		if asns is None:
+			asns = self._asns[vrp.asn] = set()
+		asns.add((vrp.version, vrp.prefix, vrp.prefixlen, vrp.maxlen))
+		self._changed(1)
 
-	def withdraw(self, cidr, asn, maxlen=None):
-		"""RTR protocol basic Routing Table support"""
-
-		version = cidr.version
-		if not maxlen:
-			maxlen = cidr.prefixlen
-		if self._ipv[version].has_key(cidr):
-			if maxlen in self._ipv[version][cidr]:
-				for ii in range(0, len(self._ipv[version][cidr][maxlen])):
-					pp = self._ipv[version][cidr][maxlen][ii]
-					if asn == list(pp)[0]:
-						# found it!
-						del self._ipv[version][cidr][maxlen][ii]
-
-						# now clean up data - just because
-						if len(self._ipv[version][cidr][maxlen]) == 0:
-							del self._ipv[version][cidr][maxlen]
-						if len(self._ipv[version][cidr]) == 0:
-							self._ipv[version].delete(cidr)
-						return
-					ii += 1
-				##  asn not found
+	def withdraw(self, vrp):
+		"""RTR protocol basic Routing Table support"""
+
+		trie = self._ipv[vrp.version]
+		key = vrp.key()
+		# get() and [] are longest match - so check for the exact prefix first
+		if trie.has_key(key):
+			rr = trie[key]
+			asns = rr.get(vrp.maxlen)
+			if asns and vrp.asn in asns:
+				# found it!
+				asns.remove(vrp.asn)
+
+				# now clean up data - just because
+				if len(asns) == 0:
+					del rr[vrp.maxlen]
+				if len(rr) == 0:
+					trie.delete(key)
+				asns = self._asns[vrp.asn]
+				asns.discard((vrp.version, vrp.prefix, vrp.prefixlen, vrp.maxlen))
+				if len(asns) == 0:
+					del self._asns[vrp.asn]
+				self._changed(-1)
+				return
 
 		# clearly we didn't find the route you are trying to withdraw
-		raise IndexError("withdraw: %s %s %s" % (cidr, asn, maxlen))
+		raise IndexError("withdraw: %s" % (vrp))
+
+	def apply(self, staged, complete=False):
+		"""RTR protocol basic Routing Table support"""
 
-	def save_routing_table(self):
+		# staged is {vrp: True to announce, False to withdraw} - the last word on each VRP in an update
+		# only real changes touch the trie; returns the (announce, withdraw) lists that were applied
+		if complete:
+			# staged is the whole set (after a Reset Query) - anything we have that isn't in it goes
+			for vrp in list(self):
+				if vrp not in staged:
+					staged[vrp] = False
+		announce = []
+		withdraw = []
+		for vrp, present in staged.items():
+			if present == (vrp in self):
+				continue
+			if present:
+				self.announce(vrp)
+				announce.append(vrp)
+			else:
+				self.withdraw(vrp)
+				withdraw.append(vrp)
+		return announce, withdraw
+
+	def save_routing_table(self, filename='data/routingtable.bin', session_id=0, serial=0):
 		"""RTR protocol basic Routing Table support"""
 
-		self._save_routing_table()
+		# returns the number of bytes written - a .json
+		# filename gets the older (and much larger) JSON format
+		if filename.endswith('.json'):
+			return self._save_routing_table(filename)
+		return Snapshot(filename).write(self, session_id, serial)
+
+	def load_routing_table(self, filename='data/routingtable.bin'):
+		"""RTR protocol basic Routing Table support"""
+
+		# returns (session_id, serial) from the snapshot
+		return Snapshot(filename).read(self)
 
 	def clear(self):
 		"""RTR protocol basic Routing Table support"""
 
 		self._clear()
 
+	def copy(self):
+		"""RTR protocol basic Routing Table support"""
+
+		# a table of its own with the same VRPs - built from the trie values and reverse index as they
+		# are, without a VRP (or an announce) per entry
+		ipv = self._tries()
+		for version in [4, 6]:
+			trie = self._ipv[version]
+			for key in trie:
+				ipv[version].insert(key, {maxlen: set(asns) for maxlen, asns in trie.get(key).items()})
+		asns = {asn: set(entries) for asn, entries in self._asns.items()}
+		return RoutingTable(ipv, asns, self._count)
+
+	def updated(self, announce, withdraw):
+		"""RTR protocol basic Routing Table support"""
+
+		# a new table with the changes made, leaving this one as it is. What the changes don't touch is
+		# shared between the two, so neither should be changed afterwards other than by another updated()
+		announce = list(announce)
+		withdraw = list(withdraw)
+		ipv = self._tries()
+		for version in [4, 6]:
+			trie = self._ipv[version]
+			for key in trie:
+				ipv[version].insert(key, trie.get(key))
+		asns = dict(self._asns)
+
+		# copy just the entries about to change
+		for vrp in withdraw + announce:
+			trie = ipv[vrp.version]
+			key = vrp.key()
+			if trie.has_key(key) and trie.get(key) is self._ipv[vrp.version].get(key):
+				trie.insert(key, {maxlen: set(entries) for maxlen, entries in trie.get(key).items()})
+			if vrp.asn in asns and asns[vrp.asn] is self._asns[vrp.asn]:
+				asns[vrp.asn] = set(asns[vrp.asn])
+
+		routingtable = RoutingTable(ipv, asns, self._count)
+		for vrp in withdraw:
+			if vrp in routingtable:
+				routingtable.withdraw(vrp)
+		for vrp in announce:
+			if vrp not in routingtable:
+				routingtable.announce(vrp)
+		return routingtable
+
+	def generation(self):
+		"""RTR protocol basic Routing Table support"""
+
+		# bumped on every change - so a saved copy can tell if it's stale
+		return self._generation
+
+	def entries(self, version):
+		"""RTR protocol basic Routing Table support"""
+
+		# (packed prefix, prefixlen, maxlen, asn) for every VRP - without building VRP objects
+		trie = self._ipv[version]
+		for key in trie:
+			rr = trie.get(key)
+			for maxlen in rr:
+				for asn in rr[maxlen]:
+					yield key[0], key[1], maxlen, asn
+
+	def __iter__(self):
+		"""RTR protocol basic Routing Table support"""
+
+		for version in [4, 6]:
+			for packed, prefixlen, maxlen, asn in self.entries(version):
+				yield VRP(version, int.from_bytes(packed, 'big'), prefixlen, maxlen, asn)
+
+	def __len__(self):
+		"""RTR protocol basic Routing Table support"""
+
+		return self._count
+
+	def __contains__(self, vrp):
+		"""RTR protocol basic Routing Table support"""
+
+		# exact match on prefix, maxlen and asn
+		trie = self._ipv[vrp.version]
+		key = vrp.key()
+		if not trie.has_key(key):
+			return False
+		asns = trie[key].get(vrp.maxlen)
+		return asns is not None and vrp.asn in asns
+
+	def by_asn(self, asn):
+		"""RTR protocol basic Routing Table support"""
+
+		# every VRP for an origin ASN - from the reverse index, so the cost is the size of the answer
+		asns = self._asns.get(int(asn), ())
+		return sorted(VRP(version, prefix, prefixlen, maxlen, int(asn))
+				for version, prefix, prefixlen, maxlen in asns)
+
+	def covering(self, cidr):
+		"""RTR protocol basic Routing Table support"""
+
+		version, key = route_key(cidr)
+		trie = self._ipv[version]
+		vrps = []
+		node = trie.get_key(key)
+		while node is not None:
+			vrps += self._vrps(version, node, trie.get(node))
+			node = trie.parent(node)
+		return vrps
+
+	def validate(self, cidr, origin_asn):
+		"""RTR protocol basic Routing Table support"""
+
+		# RFC 6811 - returns (state, matched VRPs, covering VRPs)
+		_, key = route_key(cidr)
+		return self.validate_covering(self.covering(key), key[1], origin_asn)
+
+	def validate_covering(self, covering, prefixlen, origin_asn):
+		"""RTR protocol basic Routing Table support"""
+
+		# the RFC 6811 decision once the covering VRPs are
+		# known - returns (state, matched VRPs, covering VRPs)
+		if len(covering) == 0:
+			return NOT_FOUND, [], []
+		matched = [vrp for vrp in covering if vrp_matches(vrp.asn, vrp.maxlen, prefixlen, origin_asn)]
+		if len(matched) > 0:
+			return VALID, matched, covering
+		return INVALID, [], covering
+
+	def validate_many(self, routes, details=False):
+		"""RTR protocol basic Routing Table support"""
+
+		# routes is an iterable of (prefix, origin_asn) -
+		# returns a list of states (or full validate() results)
+		if details:
+			return [self.validate(cidr, origin_asn) for cidr, origin_asn in routes]
+
+		results = []
+		for cidr, origin_asn in routes:
+			version, key = route_key(cidr)
+			trie = self._ipv[version]
+			prefixlen = key[1]
+			state = NOT_FOUND
+			# a single walk from the longest covering prefix up through its parents
+			node = trie.get_key(key)
+			while node is not None:
+				state = INVALID
+				rr = trie.get(node)
+				if origin_asn != 0 and any(prefixlen <= maxlen and origin_asn in rr[maxlen] for maxlen in rr):
+					state = VALID
+					break
+				node = trie.parent(node)
+			results.append(state)
+		return results
+
+	def show_vrps(self, cidr, show_long=False):
+		"""RTR protocol basic Routing Table support"""
+
+		# the VRPs show() prints - an exact match and, with show_long, everything more specific
+		version, key = route_key(cidr)
+		trie = self._ipv[version]
+		routes = []
+		if trie.has_key(key):
+			routes.append(key)
+			if show_long:
+				routes += trie.children(key)
+
+		vrps = []
+		for route in routes:
+			# XXX need to sort/uniq
+			rr = trie.get(route)
+			prefix = int.from_bytes(route[0], 'big')
+			for maxlen in rr.keys():
+				for asn in sorted(rr[maxlen]):
+					vrps.append(VRP(version, prefix, route[1], maxlen, asn))
+		return vrps
+
 	def show(self, cidr, show_long=False):
 		"""RTR protocol basic Routing Table support"""
 
-		version = cidr.version
 		print("%-16s %-16s %6s %s" % ('ROUTE', 'ROA', 'MaxLen', 'ASN'))
-		r = None
-		if show_long:
-			r_temp = {}
-			if cidr in self._ipv[version]:
-				rr = self._ipv[version][cidr]
-				for maxlen in list(rr.keys()):
-					if maxlen in r_temp:
-						r_temp[maxlen] += rr[maxlen]
-					else:
-						r_temp[maxlen] = rr[maxlen]
-				for child in self._ipv[version].children(cidr):
-					rr = self._ipv[version][child]
-					for maxlen in list(rr.keys()):
-						if maxlen in r_temp:
-							r_temp[maxlen] += rr[maxlen]
-						else:
-							r_temp[maxlen] = rr[maxlen]
-					# r_temp.update(r3)
-			if len(r_temp) > 0:
-				r = r_temp
-		else:
-			if self._ipv[version].has_key(cidr):
-				r = self._ipv[version][cidr]
+		for vrp in self.show_vrps(cidr, show_long):
+			if vrp.has_maxlen():
+				s_maxlen = '/' + str(vrp.maxlen)
+			else:
+				s_maxlen = ''
+			print("%-16s %-16s %6s %s" % (cidr, vrp.network(), s_maxlen, 'AS' + str(vrp.asn)))
 
-		if r:
-			# XXX need to sort/uniq
-			for maxlen in r.keys():
-				all_routes = r[maxlen]
-				for pp in all_routes:
-					asn = list(pp)[0]
-					route = pp[asn]
-					if maxlen == route.prefixlen:
-						s_maxlen = ''
-					else:
-						s_maxlen = '/' + str(maxlen)
-					print("%-16s %-16s %6s %s" % (cidr, route, s_maxlen, 'AS' + str(asn)))
-
-	def _save_routing_table(self):
-		"""RTR protocol basic Routing Table support"""
-
-		j = {'routes': {'ipv4': self._ipv[4], 'ipv6': self._ipv[6]}}
-		with open('data/routingtable.json', 'w') as fd:
-
-			class IPAddressEncoder(json.JSONEncoder):
-				def default(self, obj):
-					if isinstance(obj, pytricia.PyTricia):
-						a = {}
-						for prefix in obj:
-							a[prefix] = obj[prefix]
-						return a
-					if isinstance(obj, ipaddress.IPv4Network):
-						return str(obj)
-					if isinstance(obj, ipaddress.IPv6Network):
-						return str(obj)
-					return json.JSONEncoder.default(self, obj)
-
-			fd.write(json.dumps(j, indent=2, cls=IPAddressEncoder))
+	def show_asn(self, asn):
+		"""RTR protocol basic Routing Table support"""
 
-	def _clear(self):
+		print("%-16s %6s %s" % ('ROA', 'MaxLen', 'ASN'))
+		for vrp in self.by_asn(asn):
+			if vrp.has_maxlen():
+				s_maxlen = '/' + str(vrp.maxlen)
+			else:
+				s_maxlen = ''
+			print("%-16s %6s %s" % (vrp.network(), s_maxlen, 'AS' + str(vrp.asn)))
+
+	def _vrps(self, version, key, rr):
+		"""RTR protocol basic Routing Table support"""
+
+		prefix = int.from_bytes(key[0], 'big')
+		return [VRP(version, prefix, key[1], maxlen, asn) for maxlen in rr for asn in rr[maxlen]]
+
+	def _key_to_string(self, version, key):
+		"""RTR protocol basic Routing Table support"""
+
+		if version == 6:
+			return str(ipaddress.IPv6Network((key[0], key[1])))
+		return str(ipaddress.IPv4Network((key[0], key[1])))
+
+	def _changed(self, n):
+		"""RTR protocol basic Routing Table support"""
+
+		self._count += n
+		self._generation += 1
+
+	def _save_routing_table(self, filename):
+		"""RTR protocol basic Routing Table support"""
+
+		j = {'routes': {}}
+		for version in [4, 6]:
+			trie = self._ipv[version]
+			routes = j['routes']['ipv%d' % (version)] = {}
+			for key in trie:
+				rr = trie.get(key)
+				routes[self._key_to_string(version, key)] = {maxlen: sorted(rr[maxlen]) for maxlen in rr}
+		with atomic_write(filename, 'w') as fd:
+			json.dump(j, fd, indent=2)
+		return os.path.getsize(filename)
+
+	def _tries(self):
 		"""RTR protocol basic Routing Table support"""
 
 		# this storage method allows for searching and more
-		self._ipv = {4: pytricia.PyTricia(32), 6: pytricia.PyTricia(128)}
+		# keys come back as (packed address, prefixlen)
+		return {4: pytricia.PyTricia(32, socket.AF_INET, True),
+				6: pytricia.PyTricia(128, socket.AF_INET6, True)}
+
+	def _clear(self):
+		"""RTR protocol basic Routing Table support"""
 
+		self._ipv = self._tries()
+		self._asns = {}
+		self._count = 0
+		self._generation += 1
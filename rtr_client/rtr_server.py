@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""RTR cache server"""
+
+import random
+import struct
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+try:
+	from rtr_protocol import rfc8210router
+except ImportError:
+	from .rtr_protocol import rfc8210router
+
+#
+# The cache side of RFC 8210 - so one client syncs upstream and any number of routers sync from it.
+# The server has its own session_id and serial (one serial per upstream delta, switches included)
+# and keeps the last few deltas so a Serial Query gets just the net changes. Responses are encoded
+# once per serial - the full set for a Reset Query and the net delta from each older serial - and
+# the same bytes go to every router that asks. Sessions are plain asyncio protocols, no task each,
+# so thousands is fine.
+#
+
+logger = logging.getLogger('RFC8210').getChild('server')
+
+_pdu_header = struct.Struct('!BBHL')
+_u32 = struct.Struct('!L')
+
+# RFC 8210 section 12 - error codes
+CORRUPT_DATA = 0
+INTERNAL_ERROR = 1
+NO_DATA_AVAILABLE = 2
+INVALID_REQUEST = 3
+UNSUPPORTED_PROTOCOL_VERSION = 4
+UNSUPPORTED_PDU_TYPE = 5
+UNEXPECTED_PROTOCOL_VERSION = 8
+
+SUPPORTED_VERSIONS = (0, 1)
+
+class _RouterProtocol(asyncio.Protocol):
+	"""RTR cache server"""
+
+	# one downstream router - writes are queued as slices
+	# of shared bytes and fed out as the socket drains
+
+	chunk_size = 65536
+
+	def __init__(self, server):
+		"""RTR cache server"""
+
+		self._server = server
+		self._buffer = bytearray()
+		self._queue = deque()
+		self._paused = False
+		self.transport = None
+		self.version = None
+
+	def connection_made(self, transport):
+		"""RTR cache server"""
+
+		self.transport = transport
+		self._server.router_connected(self)
+
+	def connection_lost(self, exc):
+		"""RTR cache server"""
+
+		self._server.router_disconnected(self)
+		self.transport = None
+		self._queue.clear()
+
+	def pause_writing(self):
+		"""RTR cache server"""
+
+		self._paused = True
+
+	def resume_writing(self):
+		"""RTR cache server"""
+
+		self._paused = False
+		self._flush()
+
+	def data_received(self, data):
+		"""RTR cache server"""
+
+		self._buffer += data
+		while len(self._buffer) >= _pdu_header.size:
+			version, pdu_type, field, length = _pdu_header.unpack_from(self._buffer, 0)
+			if length < _pdu_header.size or length > 65536:
+				self.error(CORRUPT_DATA, bytes(self._buffer[:_pdu_header.size]), 'bad PDU length %d' % (length))
+				return
+			if len(self._buffer) < length:
+				return
+			pdu = bytes(self._buffer[:length])
+			del self._buffer[:length]
+			self._server.query(self, version, pdu_type, field, pdu)
+			if self.transport is None or self.transport.is_closing():
+				return
+
+	def send(self, *parts):
+		"""RTR cache server"""
+
+		# parts are bytes that may be shared with other routers - they are sliced, never copied whole
+		if self.transport is None or self.transport.is_closing():
+			return
+		for part in parts:
+			mv = memoryview(part)
+			for offset in range(0, len(mv), self.chunk_size):
+				self._queue.append(mv[offset:offset + self.chunk_size])
+		self._flush()
+
+	def error(self, error_code, pdu, text):
+		"""RTR cache server"""
+
+		# Error Reports from the cache are all fatal here - send it and close once it's written
+		version = self.version if self.version is not None else max(SUPPORTED_VERSIONS)
+		logger.info('%s: error %d: %s', self.name(), error_code, text)
+		self.send(self._server.router.error_report(error_code, pdu, text, version))
+		self._queue.append(None)
+		self._flush()
+
+	def name(self):
+		"""RTR cache server"""
+
+		peername = self.transport.get_extra_info('peername') if self.transport else None
+		return '%s.%s' % (peername[0], peername[1]) if peername else '?'
+
+	def _flush(self):
+		"""RTR cache server"""
+
+		while self._queue and not self._paused and self.transport is not None:
+			chunk = self._queue.popleft()
+			if chunk is None:
+				self.transport.close()
+				return
+			self.transport.write(chunk)
+
+class RTRServer(object):
+	"""RTR cache server"""
+
+	refresh = 3600
+	retry = 600
+	expire = 7200
+
+	max_history = 100
+
+	# one per router connection
+	protocol = _RouterProtocol
+
+	def __init__(self, routingtable, session_id=None, max_history=None):
+		"""RTR cache server"""
+
+		# routingtable() returns the table being served (or None) - e.g. group.routingtable
+		self._routingtable = routingtable
+		self.router = rfc8210router()
+		self.session_id = session_id if session_id is not None else random.randrange(1, 65536)
+		if max_history is not None:
+			self.max_history = max_history
+		self.serial = 0
+		self._ready = False
+		# from serial: (to serial, announce, withdraw)
+		self._history = OrderedDict()
+		# (version, from serial or None for the full set):
+		# encoded Prefix PDUs - for the current serial only
+		self._responses = {}
+		self._routers = set()
+		self._servers = []
+
+	def routers(self):
+		"""RTR cache server"""
+
+		return len(self._routers)
+
+	def update(self, announce, withdraw, reset=False):
+		"""RTR cache server"""
+
+		# the served table has moved on - announce/withdraw are the net VRP changes (VRP lists)
+		# reset means they can't be expressed as a delta (a new table) - routers have to start again
+		previous = self.serial
+		self.serial = (self.serial + 1) & 0xffffffff
+		if reset or not self._ready:
+			self._history.clear()
+		else:
+			self._history[previous] = (self.serial, announce, withdraw)
+			while len(self._history) > self.max_history:
+				self._history.popitem(last=False)
+		self._ready = True
+		self._responses = {}
+		self.notify()
+
+	def notify(self):
+		"""RTR cache server"""
+
+		# one Serial Notify per protocol version - the same bytes to every router
+		notify = {}
+		for protocol in self._routers:
+			if protocol.version is not None:
+				if protocol.version not in notify:
+					notify[protocol.version] = self.router.serial_notify(self.session_id, self.serial,
+							protocol.version)
+				protocol.send(notify[protocol.version])
+
+	def delta(self, session, delta):
+		"""RTR cache server"""
+
+		# a delta callback - for RTRSession or CacheGroup
+		self.update(delta.announce, delta.withdraw, delta.reset)
+
+	async def start(self, host=None, port=8282):
+		"""RTR cache server"""
+
+		loop = asyncio.get_running_loop()
+		self._servers.append(await loop.create_server(lambda: self.protocol(self), host, port,
+				backlog=1024))
+
+	def addresses(self):
+		"""RTR cache server"""
+
+		# the (host, port, ...) addresses being listened on - port 0 to start() picks a free port
+		return [sock.getsockname() for server in self._servers for sock in server.sockets]
+
+	def close(self):
+		"""RTR cache server"""
+
+		for server in self._servers:
+			server.close()
+		self._servers = []
+		for protocol in list(self._routers):
+			if protocol.transport is not None:
+				protocol.transport.close()
+
+	def router_connected(self, protocol):
+		"""RTR cache server"""
+
+		self._routers.add(protocol)
+		logger.info('%s: connect (%d routers)', protocol.name(), len(self._routers))
+
+	def router_disconnected(self, protocol):
+		"""RTR cache server"""
+
+		self._routers.discard(protocol)
+		logger.info('%s: disconnect (%d routers)', protocol.name(), len(self._routers))
+
+	def query(self, protocol, version, pdu_type, field, pdu):
+		"""RTR cache server"""
+
+		# RFC 8210 section 7 - the first PDU sets the version, anything we can't speak gets our highest
+		if version not in SUPPORTED_VERSIONS:
+			protocol.error(UNSUPPORTED_PROTOCOL_VERSION, pdu,
+					'protocol version %d not supported' % (version))
+			return
+		if protocol.version is None:
+			protocol.version = version
+		elif version != protocol.version:
+			protocol.error(UNEXPECTED_PROTOCOL_VERSION, pdu,
+					'protocol version changed from %d' % (protocol.version))
+			return
+
+		if pdu_type == 10:
+			# Error Report from the router - nothing to answer
+			logger.info('%s: error report %d', protocol.name(), field)
+			return
+		if pdu_type not in (1, 2):
+			protocol.error(UNSUPPORTED_PDU_TYPE, pdu, 'unexpected PDU type %d' % (pdu_type))
+			return
+		if pdu_type == 1 and len(pdu) != 12 or pdu_type == 2 and len(pdu) != 8:
+			protocol.error(CORRUPT_DATA, pdu, 'bad PDU length %d' % (len(pdu)))
+			return
+		routingtable = self._routingtable()
+		if not self._ready or routingtable is None:
+			protocol.error(NO_DATA_AVAILABLE, pdu, 'no data available')
+			return
+
+		if pdu_type == 1:
+			# Serial Query - a delta if we still have the history, else the router has to start again
+			serial = _u32.unpack_from(pdu, _pdu_header.size)[0]
+			if field != self.session_id:
+				protocol.send(self.router.cache_reset(version))
+				return
+			body = self._delta_response(version, serial)
+			if body is None:
+				protocol.send(self.router.cache_reset(version))
+				return
+		else:
+			# Reset Query - everything
+			body = self._full_response(version, routingtable)
+
+		protocol.send(self.router.cache_response(self.session_id, version), body,
+				self.router.end_of_data(self.session_id, self.serial, self.refresh, self.retry, self.expire,
+						version))
+
+	def _full_response(self, version, routingtable):
+		"""RTR cache server"""
+
+		key = (version, None)
+		if key not in self._responses:
+			self._responses[key] = self.router.prefix_pdus(routingtable, True, version)
+		return self._responses[key]
+
+	def _delta_response(self, version, serial):
+		"""RTR cache server"""
+
+		# the net changes from serial to now - None if serial is too old (or unknown)
+		key = (version, serial)
+		if key in self._responses:
+			return self._responses[key]
+		changes = {}
+		while serial != self.serial:
+			if serial not in self._history:
+				return None
+			serial, announce, withdraw = self._history[serial]
+			for vrp in withdraw:
+				if changes.get(vrp) is True:
+					del changes[vrp]
+				else:
+					changes[vrp] = False
+			for vrp in announce:
+				if changes.get(vrp) is False:
+					del changes[vrp]
+				else:
+					changes[vrp] = True
+		withdraw = [vrp for vrp, present in changes.items() if not present]
+		announce = [vrp for vrp, present in changes.items() if present]
+		body = (self.router.prefix_pdus(withdraw, False, version)
+			+ self.router.prefix_pdus(announce, True, version))
+		self._responses[key] = body
+		return body
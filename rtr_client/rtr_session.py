@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""RTR asyncio session"""
+
+import asyncio
+import logging
+import collections
+
+try:
+	from rtr_protocol import rfc8210router, serial_reached
+	from rtr_connect import connect, shared_resolver, backoff
+	from rtr_subscriber import RouteBuffer
+except ImportError:
+	from .rtr_protocol import rfc8210router, serial_reached
+	from .rtr_connect import connect, shared_resolver, backoff
+	from .rtr_subscriber import RouteBuffer
+
+#
+# An RTR session that runs inside an asyncio event loop - so it can be embedded in other services
+# (and several can run in one process). Nothing here writes to stderr or exits; callers hear about
+# things via callbacks, the deltas() async iterator or wait_for_serial().
+#
+
+logger = logging.getLogger('RFC8210').getChild('session')
+
+# one per End of Data that changed something - reset is True when announce is the complete set (a
+# Reset Query into an empty table); after a resync of a table that had VRPs it's just the net
+# changes like any other
+Delta = collections.namedtuple('Delta', ['session_id', 'serial', 'announce', 'withdraw', 'reset'])
+
+class ReceiveBuffer(object):
+	"""RTR asyncio session"""
+
+	# unprocessed data lives in _buffer[_start:_end] and new data is recv()'ed straight in after it
+	initial_size = 256*1024
+
+	def __init__(self):
+		"""RTR asyncio session"""
+		self._buffer = bytearray(self.initial_size)
+		self._start = 0
+		self._end = 0
+
+	def __len__(self):
+		"""RTR asyncio session"""
+		return self._end - self._start
+
+	def clear(self):
+		"""RTR asyncio session"""
+		self._start = 0
+		self._end = 0
+
+	def writable(self, n):
+		"""RTR asyncio session"""
+		# a memoryview with room for at least n bytes - release it before calling anything else
+		if len(self._buffer) - self._end < n:
+			self._compact(n)
+		return memoryview(self._buffer)[self._end:]
+
+	def written(self, n):
+		"""RTR asyncio session"""
+		self._end += n
+
+	def write(self, b):
+		"""RTR asyncio session"""
+		with self.writable(len(b)) as mv:
+			mv[0:len(b)] = b
+		self.written(len(b))
+
+	def process(self, rtr_session):
+		"""RTR asyncio session"""
+		with memoryview(self._buffer) as mv:
+			data_left = rtr_session.process(mv[0:self._end], self._start)
+		self._start = self._end - data_left
+		if self._start == self._end:
+			# everything consumed - cheap to start again at the front
+			self._start = 0
+			self._end = 0
+
+	def _compact(self, n):
+		"""RTR asyncio session"""
+		# only called when there's no room after _end - slide the leftover PDU down to the front
+		length = self._end - self._start
+		if self._start > 0:
+			with memoryview(self._buffer) as mv:
+				mv[0:length] = mv[self._start:self._end]
+			self._start = 0
+			self._end = length
+		if len(self._buffer) - self._end < n:
+			# a PDU bigger than the buffer - grow it, doubling keeps this rare
+			self._buffer.extend(bytes(max(len(self._buffer), n)))
+
+class _RTRProtocol(asyncio.BufferedProtocol):
+	"""RTR asyncio session"""
+
+	# asyncio recv_into()'s our buffer directly - same zero copy path as the blocking client
+	recv_size = 64*1024
+
+	def __init__(self, session):
+		"""RTR asyncio session"""
+		self._session = session
+		self._buffer = ReceiveBuffer()
+		self._mv = None
+
+	def connection_made(self, transport):
+		"""RTR asyncio session"""
+		self._session.connection_made(transport)
+
+	def get_buffer(self, sizehint):
+		"""RTR asyncio session"""
+		self._mv = self._buffer.writable(self.recv_size)
+		return self._mv
+
+	def buffer_updated(self, nbytes):
+		"""RTR asyncio session"""
+		if self._session.dump_fd:
+			# save raw data away
+			self._session.dump_fd.write(self._mv[0:nbytes])
+			self._session.dump_fd.flush()
+		# let go of the view so the buffer can be compacted or grown next time round
+		self._mv.release()
+		self._mv = None
+		self._buffer.written(nbytes)
+		self._buffer.process(self._session.router)
+		self._session.processed()
+
+	def eof_received(self):
+		"""RTR asyncio session"""
+		# close our side too
+		return False
+
+	def connection_lost(self, exc):
+		"""RTR asyncio session"""
+		self._session.connection_lost(exc)
+
+class RTRSession(object):
+	"""RTR asyncio session"""
+
+	rtr_host = 'rtr.rpki.cloudflare.com'
+	rtr_port = 8282
+	connect_timeout = 5 # this is about the socket connect timeout and not data timeout
+	backoff_max = 32
+
+	_events = ('connect', 'disconnect', 'reset', 'delta', 'sync', 'stale')
+
+	def __init__(self, host=None, port=None, router=None, serial=None, session_id=None, timeout=None,
+			dump_fd=None, debug=0, buffer_routes=True):
+		"""RTR asyncio session"""
+
+		self.host = host or self.rtr_host
+		self.port = port or self.rtr_port
+		if router is None:
+			router = rfc8210router(serial=serial, session_id=session_id, debug=debug)
+		self.router = router
+		# Delta announce/withdraw lists - without them deltas
+		# are empty and only the table is kept up to date
+		self._routes = None
+		if buffer_routes:
+			self._routes = RouteBuffer()
+			router.subscribe(self._routes)
+		if timeout:
+			# the refresh interval to use when the cache doesn't send one (version 0 End of Data)
+			router.default_refresh_interval = timeout
+		self.dump_fd = dump_fd
+		self.resolver = shared_resolver
+
+		self._callbacks = dict((event, []) for event in self._events)
+		self._queues = []
+		self._transport = None
+		self._lost = None
+		self._stop = None
+		self._sync_event = None
+		self._closing = False
+		self._synced = False
+		self._stale = False
+		self._synced_at = None
+		self._query_sent = None
+		self._timer = None
+		self._after_reset = False
+		self._serial = router.cache_serial_number()
+		self._end_of_data_count = router.end_of_data_count()
+
+	def name(self):
+		"""RTR asyncio session"""
+
+		return '%s:%d' % (self.host, self.port)
+
+	def add_callback(self, event, callback):
+		"""RTR asyncio session"""
+
+		# callback(session, ...) - connect: peername, disconnect: exception or None, reset: nothing,
+		# delta: Delta, sync: nothing (every End of Data - after any delta), stale: nothing (expire
+		# interval passed without a sync)
+		if event not in self._callbacks:
+			raise ValueError('%s: unknown event' % (event))
+		self._callbacks[event].append(callback)
+
+	def remove_callback(self, event, callback):
+		"""RTR asyncio session"""
+
+		self._callbacks[event].remove(callback)
+
+	def serial(self):
+		"""RTR asyncio session"""
+
+		return self._serial
+
+	def synced(self):
+		"""RTR asyncio session"""
+
+		# True once an End of Data has been seen (and no
+		# Cache Reset since) - the routing table is complete
+		return self._synced
+
+	def stale(self):
+		"""RTR asyncio session"""
+
+		# True once the cache's expire interval has passed since the last End of Data
+		return self._stale
+
+	def connected(self):
+		"""RTR asyncio session"""
+
+		return self._transport is not None
+
+	async def wait_for_serial(self, serial=None):
+		"""RTR asyncio session"""
+
+		# wait until synced - and if serial is given, until the table is at (or past) that serial
+		while not (self._synced and (serial is None or serial_reached(self._serial, serial))):
+			if self._sync_event is None:
+				self._sync_event = asyncio.Event()
+			await self._sync_event.wait()
+		return self._serial
+
+	async def deltas(self):
+		"""RTR asyncio session"""
+
+		# async for delta in session.deltas(): ... - every
+		# Delta from now on, ending when the session is closed
+		queue = asyncio.Queue()
+		self._queues.append(queue)
+		try:
+			while True:
+				delta = await queue.get()
+				if delta is None:
+					return
+				yield delta
+		finally:
+			self._queues.remove(queue)
+
+	async def run(self):
+		"""RTR asyncio session"""
+
+		# connect, sync and stay in sync - reconnecting as needed - until close() is called
+		self._closing = False
+		self._stop = asyncio.Event()
+		# the router may have been given a table since __init__ (a warm start from the journal) - its
+		# serial is where we are, so the first End of Data for it isn't mistaken for a change
+		self._serial = self.router.cache_serial_number()
+		self._end_of_data_count = self.router.end_of_data_count()
+		attempt = 0
+		while not self._closing:
+			try:
+				await self._connect()
+			except (OSError, asyncio.TimeoutError) as e:
+				logger.info('%s: connect failed: %s', self.name(), e)
+				self._fire('disconnect', e)
+				await self._sleep(backoff(attempt, cap=self.backoff_max))
+				attempt += 1
+				continue
+			attempt = 0
+			await self._serve()
+
+	def start(self):
+		"""RTR asyncio session"""
+
+		return asyncio.ensure_future(self.run())
+
+	def close(self):
+		"""RTR asyncio session"""
+
+		self._closing = True
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		if self._stop is not None:
+			self._stop.set()
+		if self._transport is not None:
+			self._transport.close()
+		for queue in self._queues:
+			queue.put_nowait(None)
+
+	async def __aenter__(self):
+		"""RTR asyncio session"""
+
+		self._task = self.start()
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		"""RTR asyncio session"""
+
+		self.close()
+		await self._task
+
+	async def _connect(self):
+		"""RTR asyncio session"""
+
+		loop = asyncio.get_running_loop()
+		self._lost = loop.create_future()
+		# Happy Eyeballs - the fastest working address wins
+		sock = await connect(self.host, self.port, self.connect_timeout, resolver=self.resolver)
+		await loop.create_connection(lambda: _RTRProtocol(self), sock=sock)
+
+	async def _serve(self):
+		"""RTR asyncio session"""
+
+		if self._closing:
+			self._transport.close()
+		elif self.router.cache_serial_number() == 0 or not self._have_session_id():
+			# starting from scratch!
+			self._reset_query()
+		else:
+			self._query(self.router.serial_query())
+
+		# everything from here on is driven by received data and the timer
+		self._fire('disconnect', await self._lost)
+
+	async def _sleep(self, secs):
+		"""RTR asyncio session"""
+
+		# a sleep that close() cuts short
+		try:
+			await asyncio.wait_for(self._stop.wait(), secs)
+		except asyncio.TimeoutError:
+			pass
+
+	def connection_made(self, transport):
+		"""RTR asyncio session"""
+
+		# connection_made(), connection_lost() and processed() are called by the protocol
+		self._transport = transport
+		peername = transport.get_extra_info('peername')
+		logger.info('%s: connected %s', self.name(), peername)
+		self._fire('connect', peername)
+
+	def connection_lost(self, exc):
+		"""RTR asyncio session"""
+
+		self._transport = None
+		self._query_sent = None
+		logger.info('%s: connection lost: %s', self.name(), exc)
+		# only the expire timer matters while disconnected
+		self._schedule()
+		if self._lost is not None and not self._lost.done():
+			self._lost.set_result(exc)
+
+	def processed(self):
+		"""RTR asyncio session"""
+
+		if self.router.reset_needed():
+			# Cache Reset or the session_id changed - our serial means nothing now, so start again
+			logger.info('%s: cache reset', self.name())
+			# not synced any more - but the table is still intact while the callbacks run
+			self._synced = False
+			self._fire('reset')
+			self._reset_query()
+
+		if self.router.end_of_data_count() != self._end_of_data_count:
+			self._end_of_data()
+
+		if self.router.notified() and self._query_sent is None:
+			# Serial Notify - no need to wait for the refresh timer
+			logger.debug('%s: serial notify %d', self.name(), self.router.latest_serial_number())
+			self._query(self.router.serial_query())
+
+	def _send(self, packet):
+		"""RTR asyncio session"""
+
+		if self._transport is not None:
+			self._transport.write(packet)
+
+	def _reset_query(self):
+		"""RTR asyncio session"""
+
+		self._serial = 0
+		self._synced = False
+		routingtable = self.router.routingtable()
+		self._after_reset = routingtable is None or len(routingtable) == 0
+		self._query(self.router.reset_query())
+
+	def _query(self, packet):
+		"""RTR asyncio session"""
+
+		# a Serial Query or Reset Query - it's outstanding
+		# until the End of Data (or Cache Reset) comes back
+		self._query_sent = asyncio.get_running_loop().time()
+		self._send(packet)
+		self._schedule()
+
+	def _schedule(self):
+		"""RTR asyncio session"""
+
+		# one timer for whichever comes first - expire, retry (query outstanding) or refresh (idle)
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		deadlines = []
+		if self._synced_at is not None and not self._stale:
+			deadlines.append(self._synced_at + self.router.expire_interval())
+		if self._transport is not None:
+			if self._query_sent is not None:
+				deadlines.append(self._query_sent + self.router.retry_interval())
+			elif self._synced_at is not None:
+				deadlines.append(self._synced_at + self.router.refresh_interval())
+		if deadlines and not self._closing:
+			self._timer = asyncio.get_running_loop().call_at(min(deadlines), self._timer_expired)
+
+	def _timer_expired(self):
+		"""RTR asyncio session"""
+
+		self._timer = None
+		now = asyncio.get_running_loop().time()
+		if (self._synced_at is not None and not self._stale
+				and now >= self._synced_at + self.router.expire_interval()):
+			# RFC 8210 section 6 - data this old can't be trusted
+			logger.info('%s: data expired', self.name())
+			self._stale = True
+			self._fire('stale')
+		if self._transport is not None:
+			if self._query_sent is not None:
+				if now >= self._query_sent + self.router.retry_interval():
+					# no answer - a fresh connection (which sends a fresh query) is the retry
+					logger.info('%s: no response within retry interval', self.name())
+					self._transport.close()
+			elif self._synced_at is not None and now >= self._synced_at + self.router.refresh_interval():
+				self._query(self.router.serial_query())
+		self._schedule()
+
+	def _have_session_id(self):
+		"""RTR asyncio session"""
+
+		try:
+			self.router.get_session_id()
+		except ValueError:
+			return False
+		return True
+
+	def _end_of_data(self):
+		"""RTR asyncio session"""
+
+		self._end_of_data_count = self.router.end_of_data_count()
+		self._query_sent = None
+		self._synced_at = asyncio.get_running_loop().time()
+		self._stale = False
+		# the table is complete again - so delta callbacks see a synced session
+		self._synced = True
+		new_serial = self.router.cache_serial_number()
+		if self._routes is not None:
+			routes = self._routes.routes()
+			self._routes.clear()
+		else:
+			routes = {'announce': [], 'withdraw': []}
+		if new_serial != self._serial or routes['announce'] or routes['withdraw']:
+			try:
+				session_id = self.router.get_session_id()
+			except ValueError:
+				session_id = 0
+			delta = Delta(session_id, new_serial, routes['announce'], routes['withdraw'], self._after_reset)
+			self._serial = new_serial
+			self._after_reset = False
+			logger.debug('%s: session %d serial %d announce=%d withdraw=%d', self.name(), session_id,
+					new_serial, len(delta.announce), len(delta.withdraw))
+			self._fire('delta', delta)
+			for queue in self._queues:
+				queue.put_nowait(delta)
+
+		self._fire('sync')
+		if self._sync_event is not None:
+			self._sync_event.set()
+			self._sync_event = None
+		self._schedule()
+
+	def _fire(self, event, *args):
+		"""RTR asyncio session"""
+
+		for callback in list(self._callbacks[event]):
+			try:
+				callback(self, *args)
+			except Exception:
+				# a broken callback shouldn't take the session down with it
+				logger.exception('%s: %s callback failed', self.name(), event)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""RTR shared table"""
+
+import os
+import mmap
+import struct
+
+try:
+	from rtr_routes import RoutingTable, route_key
+	from rtr_snapshot import Snapshot, MappedTable
+except ImportError:
+	from .rtr_routes import RoutingTable, route_key
+	from .rtr_snapshot import Snapshot, MappedTable
+
+#
+# One process publishes the VRPs, any number of readers on the box look them up without loading
+# them. The table is a snapshot file (already sorted, so MappedTable can binary search it) - written
+# aside and renamed into place, then a generation counter in a small mmap'd file is bumped. Readers
+# check the counter and re-map the snapshot when it moves. The rename means a reader never sees a
+# half written table and anyone holding the old one keeps a consistent copy until they're done.
+#
+#   generation:  magic 'RTRG', zero (4 bytes), generation (8 bytes)
+#
+
+_generation = struct.Struct('!4sxxxxQ')
+
+default_directory = '/dev/shm/rtr_client' if os.path.isdir('/dev/shm') else 'data/shared'
+
+class SharedPublisher(object):
+	"""RTR shared table"""
+
+	magic = b'RTRG'
+
+	def __init__(self, directory=None):
+		"""RTR shared table"""
+
+		self.directory = directory or default_directory
+		os.makedirs(self.directory, exist_ok=True)
+		self.filename = os.path.join(self.directory, 'routingtable.bin')
+		self._published = None
+		generation_filename = os.path.join(self.directory, 'generation')
+		fd = os.open(generation_filename, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			if os.fstat(fd).st_size < _generation.size:
+				os.ftruncate(fd, _generation.size)
+			self._mm = mmap.mmap(fd, _generation.size)
+		finally:
+			os.close(fd)
+		magic, generation = _generation.unpack_from(self._mm, 0)
+		# carry on from an earlier run - readers only care that it moves
+		self._generation = generation if magic == self.magic else 0
+
+	def generation(self):
+		"""RTR shared table"""
+
+		return self._generation
+
+	def publish(self, routingtable, session_id=0, serial=0):
+		"""RTR shared table"""
+
+		# write the table (if it changed) and then bump the generation - in that order
+		published = (id(routingtable), routingtable.generation(), session_id, serial)
+		if published == self._published:
+			return False
+		Snapshot(self.filename).write(routingtable, session_id, serial)
+		self._generation += 1
+		_generation.pack_into(self._mm, 0, self.magic, self._generation)
+		self._published = published
+		return True
+
+	def delta(self, session, delta):
+		"""RTR shared table"""
+
+		# a delta callback - for RTRSession or CacheGroup
+		self.publish(session.router.routingtable(), delta.session_id, delta.serial)
+
+	def close(self):
+		"""RTR shared table"""
+
+		self._mm.close()
+
+class SharedTable(object):
+	"""RTR shared table"""
+
+	# RFC 6811 as RoutingTable does it - only covering() differs
+	validate_covering = RoutingTable.validate_covering
+
+	def __init__(self, directory=None):
+		"""RTR shared table"""
+
+		self.directory = directory or default_directory
+		self.filename = os.path.join(self.directory, 'routingtable.bin')
+		with open(os.path.join(self.directory, 'generation'), 'rb') as fd:
+			self._mm = mmap.mmap(fd.fileno(), _generation.size, access=mmap.ACCESS_READ)
+		self._generation = None
+		self._table = None
+
+	def generation(self):
+		"""RTR shared table"""
+
+		magic, generation = _generation.unpack_from(self._mm, 0)
+		if magic != SharedPublisher.magic:
+			raise ValueError('%s: nothing published' % (self.directory))
+		return generation
+
+	def current(self):
+		"""RTR shared table"""
+
+		# the MappedTable for the latest generation - a reader holding an older one can carry on using it
+		generation = self.generation()
+		if generation != self._generation:
+			# the counter is read first - if the table moves on meanwhile, the next call maps it again
+			self._table = MappedTable(self.filename)
+			self._generation = generation
+		return self._table
+
+	def __len__(self):
+		"""RTR shared table"""
+
+		return len(self.current())
+
+	def covering(self, cidr):
+		"""RTR shared table"""
+
+		return self.current().covering(cidr)
+
+	def validate(self, cidr, origin_asn):
+		"""RTR shared table"""
+
+		# RFC 6811 - returns (state, matched VRPs, covering VRPs)
+		_, key = route_key(cidr)
+		return self.validate_covering(self.current().covering(key), key[1], origin_asn)
+
+	def validate_many(self, routes):
+		"""RTR shared table"""
+
+		# one generation for the whole batch
+		table = self.current()
+		results = []
+		for cidr, origin_asn in routes:
+			_, key = route_key(cidr)
+			results.append(self.validate_covering(table.covering(key), key[1], origin_asn)[0])
+		return results
+
+	def show_vrps(self, cidr, show_long=False):
+		"""RTR shared table"""
+
+		return self.current().show_vrps(cidr, show_long)
+
+	def by_asn(self, asn):
+		"""RTR shared table"""
+
+		return self.current().by_asn(asn)
+
+	def close(self):
+		"""RTR shared table"""
+
+		self._table = None
+		self._mm.close()
@@ -9,29 +9,46 @@ import ipaddress
 
 try:
 	from rtr_routes import RoutingTable
+	from rtr_vrp import VRP
+	from rtr_snapshot import Snapshot, MappedTable
+	from rtr_journal import Journal
 	from __init__ import __version__
 except ImportError:
 	from .rtr_routes import RoutingTable
+	from .rtr_vrp import VRP
+	from .rtr_snapshot import Snapshot, MappedTable
+	from .rtr_journal import Journal
 	from .__init__ import __version__
 
 
 def read_file(routingtable, filename, debug):
 	"""rtr_show"""
 
+	if Snapshot.is_snapshot(filename):
+		session_id, serial = routingtable.load_routing_table(filename)
+		if debug:
+			sys.stderr.write("debug: session_id=%d serial=%d count=%d\n" % (
+					session_id, serial, len(routingtable)))
+			sys.stderr.flush()
+		return
+
 	count = 0
-	with open('data/routingtable.json', 'r') as fd:
+	with open(filename, 'r') as fd:
 		data = json.load(fd)
 		for ip in ['ipv4', 'ipv6']:
 			pp = data['routes'][ip]
 			for cidr in pp.keys():
+				network = ipaddress.ip_network(cidr)
 				for maxlen in pp[cidr]:
 					for x in pp[cidr][maxlen]:
-						asn = list(x.keys())[0]
+						if isinstance(x, dict):
+							# older files saved {asn: cidr}
+							asn = list(x.keys())[0]
+						else:
+							asn = x
 						if debug:
-							cidr2 = x[asn]
-							# cidr2 should match cidr
-							sys.stderr.write("debug: %-30s\t%9d\t%2d\t;\t%s %s\n" % (cidr2, int(asn), int(maxlen), cidr, pp[cidr]))
-						routingtable.announce(ipaddress.ip_network(cidr), int(asn), int(maxlen))
+							sys.stderr.write("debug: %-30s\t%9d\t%2d\t;\t%s\n" % (cidr, int(asn), int(maxlen), pp[cidr]))
+						routingtable.announce(VRP.from_network(network, asn, maxlen))
 						count += 1
 
 	if debug:
@@ -42,25 +59,34 @@ def doit(args=None):
 	"""rtr_show"""
 
 	debug = 0
-	filename = 'data/routingtable.json'
+	filename = 'data/routingtable.bin'
+	journal_directory = None
+	serial = None
 	long_flag = False
+	asns = []
 
 	usage = ('usage: rtr_show '
 		 + '[-H|--help] '
 		 + '[-V|--version] '
 		 + '[-v|--verbose] '
 		 + '[-f FILENAME|--file=FILENAME] '
+		 + '[-J DIRECTORY|--journal=DIRECTORY] '
+		 + '[-s SERIALNUMBER|--serial=SERIALNUMBER] '
 		 + '[-l|--long] '
-		 + 'route'
+		 + '[-a ASN|--asn=ASN] '
+		 + '[route ...]'
 		 )
 
 	try:
-		opts, args = getopt.getopt(args, 'HVvf:l', [
+		opts, args = getopt.getopt(args, 'HVvf:J:s:la:', [
 						'help',
 						'version',
 						'verbose',
 						'file=',
-						'long'
+						'journal=',
+						'serial=',
+						'long',
+						'asn='
 						])
 	except getopt.GetoptError:
 		sys.exit(usage)
@@ -74,12 +100,45 @@ def doit(args=None):
 			debug += 1
 		elif opt in ('-f', '--file'):
 			filename = arg
+		elif opt in ('-J', '--journal'):
+			journal_directory = arg
+		elif opt in ('-s', '--serial'):
+			serial = int(arg)
 		elif opt in ('-l', '--long'):
 			long_flag = True
-
-	routingtable = RoutingTable()
-
-	read_file(routingtable, filename, debug)
+		elif opt in ('-a', '--asn'):
+			# 13335 or AS13335
+			try:
+				asns.append(int(arg.upper().replace('AS', '', 1)))
+			except ValueError:
+				sys.exit(usage)
+
+	if journal_directory:
+		# rebuild the table from the journal - as of any serial it still holds
+		routingtable = RoutingTable()
+		try:
+			session_id, serial = Journal(journal_directory).load(routingtable, serial)
+		except IndexError as e:
+			sys.exit('%s: %s' % (journal_directory, e))
+		if debug:
+			sys.stderr.write("debug: session_id=%s serial=%s count=%d\n" % (
+					session_id, serial, len(routingtable)))
+			sys.stderr.flush()
+	elif Snapshot.is_snapshot(filename):
+		# mmap the snapshot - nothing is loaded, each lookup is a binary search of the file
+		try:
+			routingtable = MappedTable(filename)
+		except ValueError as e:
+			sys.exit('%s' % (e))
+		if debug:
+			sys.stderr.write("debug: session_id=%d serial=%d count=%d\n" % (
+					routingtable.session_id, routingtable.serial, len(routingtable)))
+			sys.stderr.flush()
+	else:
+		routingtable = RoutingTable()
+		read_file(routingtable, filename, debug)
+	for asn in asns:
+		routingtable.show_asn(asn)
 	for route in args:
 		try:
 			routingtable.show(ipaddress.ip_network(route), long_flag)
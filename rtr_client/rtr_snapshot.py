@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""RTR routing table snapshot"""
+
+import os
+import mmap
+import struct
+import ipaddress
+import contextlib
+
+try:
+	from rtr_vrp import VRP
+except ImportError:
+	from .rtr_vrp import VRP
+
+#
+# A snapshot is a small header followed by fixed size records, all network byte order.
+# Records are sorted - and because the prefix comes first that's the same as sorting by prefix.
+# So the file can be used as it is - MappedTable mmaps it and binary searches the records.
+#
+#   header:  magic 'RTRS', format version, zero, session_id, serial, IPv4 count, IPv6 count
+#   IPv4:    prefix (4 bytes), prefixlen, maxlen, zero (2 bytes), asn
+#   IPv6:    prefix (16 bytes), prefixlen, maxlen, zero (2 bytes), asn
+#
+
+_header = struct.Struct('!4sBxHLLL')
+_ipv4_record = struct.Struct('!4sBBxxL')
+_ipv6_record = struct.Struct('!16sBBxxL')
+
+@contextlib.contextmanager
+def atomic_write(filename, mode='wb'):
+	"""RTR routing table snapshot"""
+
+	# write a temp file next to the real one and rename
+	# it over the top - readers never see a partial file
+	tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+	try:
+		with open(tmp_filename, mode) as fd:
+			yield fd
+			fd.flush()
+			os.fsync(fd.fileno())
+		os.replace(tmp_filename, filename)
+	except:
+		try:
+			os.unlink(tmp_filename)
+		except FileNotFoundError:
+			pass
+		raise
+
+def atomic_link(source, filename):
+	"""RTR routing table snapshot"""
+
+	# filename becomes another name for source - swapped
+	# in the same way, so readers see one or the other
+	tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+	try:
+		os.link(source, tmp_filename)
+		os.replace(tmp_filename, filename)
+	except:
+		try:
+			os.unlink(tmp_filename)
+		except FileNotFoundError:
+			pass
+		raise
+
+class Snapshot(object):
+	"""RTR routing table snapshot"""
+
+	magic = b'RTRS'
+	format_version = 1
+
+	def __init__(self, filename):
+		"""RTR routing table snapshot"""
+
+		self.filename = filename
+
+	@classmethod
+	def is_snapshot(cls, filename):
+		"""RTR routing table snapshot"""
+
+		with open(filename, 'rb') as fd:
+			return fd.read(len(cls.magic)) == cls.magic
+
+	def write(self, routingtable, session_id=0, serial=0):
+		"""RTR routing table snapshot"""
+
+		records = {}
+		for version, record in [(4, _ipv4_record), (6, _ipv6_record)]:
+			records[version] = [record.pack(packed, prefixlen, maxlen, asn)
+					for packed, prefixlen, maxlen, asn in routingtable.entries(version)]
+			records[version].sort()
+
+		header = _header.pack(self.magic, self.format_version, session_id or 0, serial or 0,
+				len(records[4]), len(records[6]))
+		with atomic_write(self.filename) as fd:
+			fd.write(header)
+			fd.write(b''.join(records[4]))
+			fd.write(b''.join(records[6]))
+		return _header.size + len(records[4]) * _ipv4_record.size + len(records[6]) * _ipv6_record.size
+
+	def header(self):
+		"""RTR routing table snapshot"""
+
+		# (session_id, serial, IPv4 count, IPv6 count) without reading the records
+		with open(self.filename, 'rb') as fd:
+			data = fd.read(_header.size)
+		if len(data) != _header.size:
+			raise ValueError('%s: truncated routing table snapshot' % (self.filename))
+		magic, format_version, session_id, serial, n_ipv4, n_ipv6 = _header.unpack(data)
+		if magic != self.magic or format_version != self.format_version:
+			raise ValueError('%s: not a routing table snapshot' % (self.filename))
+		return session_id, serial, n_ipv4, n_ipv6
+
+	def read(self, routingtable):
+		"""RTR routing table snapshot"""
+
+		with open(self.filename, 'rb') as fd:
+			data = fd.read()
+		magic, format_version, session_id, serial, n_ipv4, n_ipv6 = _header.unpack_from(data, 0)
+		if magic != self.magic or format_version != self.format_version:
+			raise ValueError('%s: not a routing table snapshot' % (self.filename))
+		if len(data) != _header.size + n_ipv4 * _ipv4_record.size + n_ipv6 * _ipv6_record.size:
+			raise ValueError('%s: truncated routing table snapshot' % (self.filename))
+
+		with memoryview(data) as mv:
+			offset = _header.size
+			for version, record, count in [(4, _ipv4_record, n_ipv4), (6, _ipv6_record, n_ipv6)]:
+				for packed, prefixlen, maxlen, asn in record.iter_unpack(
+						mv[offset:offset + count * record.size]):
+					routingtable.announce(VRP(version, int.from_bytes(packed, 'big'), prefixlen, maxlen, asn))
+				offset += count * record.size
+		return session_id, serial
+
+class MappedTable(object):
+	"""RTR routing table snapshot"""
+
+	# a snapshot opened with mmap - nothing is read up front, lookups binary search the sorted records
+
+	def __init__(self, filename):
+		"""RTR routing table snapshot"""
+
+		self.filename = filename
+		with open(filename, 'rb') as fd:
+			size = os.fstat(fd.fileno()).st_size
+			if size < _header.size:
+				raise ValueError('%s: truncated routing table snapshot' % (filename))
+			self._mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, format_version, self.session_id, self.serial, n_ipv4, n_ipv6 = _header.unpack_from(
+				self._mm, 0)
+		if magic != Snapshot.magic or format_version != Snapshot.format_version:
+			self.close()
+			raise ValueError('%s: not a routing table snapshot' % (filename))
+		if size != _header.size + n_ipv4 * _ipv4_record.size + n_ipv6 * _ipv6_record.size:
+			self.close()
+			raise ValueError('%s: truncated routing table snapshot' % (filename))
+		# version: (offset of the first record, count, record)
+		self._sections = {4: (_header.size, n_ipv4, _ipv4_record),
+				6: (_header.size + n_ipv4 * _ipv4_record.size, n_ipv6, _ipv6_record)}
+		self._lengths = {}
+
+	def close(self):
+		"""RTR routing table snapshot"""
+
+		self._mm.close()
+
+	def __enter__(self):
+		"""RTR routing table snapshot"""
+
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		"""RTR routing table snapshot"""
+
+		self.close()
+
+	def __len__(self):
+		"""RTR routing table snapshot"""
+
+		return self._sections[4][1] + self._sections[6][1]
+
+	def entries(self, version):
+		"""RTR routing table snapshot"""
+
+		# (packed prefix, prefixlen, maxlen, asn) in sorted order - the same as RoutingTable.entries()
+		offset, count, record = self._sections[version]
+		with memoryview(self._mm) as mv:
+			yield from record.iter_unpack(mv[offset:offset + count * record.size])
+
+	def __iter__(self):
+		"""RTR routing table snapshot"""
+
+		for version in [4, 6]:
+			for packed, prefixlen, maxlen, asn in self.entries(version):
+				yield VRP(version, int.from_bytes(packed, 'big'), prefixlen, maxlen, asn)
+
+	def more_specifics(self, cidr, show_long=True):
+		"""RTR routing table snapshot"""
+
+		# VRPs for exactly cidr - and with show_long everything inside it too - from one binary search
+		if not isinstance(cidr, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+			cidr = ipaddress.ip_network(cidr)
+		offset, count, record = self._sections[cidr.version]
+		first = cidr.network_address.packed
+		last = cidr.broadcast_address.packed
+		vrps = []
+		index = self._bisect(cidr.version, first + bytes([cidr.prefixlen]))
+		while index < count:
+			packed, prefixlen, maxlen, asn = record.unpack_from(self._mm, offset + index * record.size)
+			if packed > last or (not show_long and (packed != first or prefixlen != cidr.prefixlen)):
+				break
+			vrps.append(VRP(cidr.version, int.from_bytes(packed, 'big'), prefixlen, maxlen, asn))
+			index += 1
+		return vrps
+
+	def covering(self, cidr):
+		"""RTR routing table snapshot"""
+
+		# VRPs for cidr and every less specific prefix of it - a binary search per prefixlen in the file
+		# cidr is an ipaddress network, a 'prefix/len' string or a packed (bytes, len) key
+		if isinstance(cidr, tuple):
+			packed, route_prefixlen = cidr
+		else:
+			if not isinstance(cidr, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+				cidr = ipaddress.ip_network(cidr)
+			packed, route_prefixlen = cidr.network_address.packed, cidr.prefixlen
+		version = 4 if len(packed) == 4 else 6
+		bits = len(packed) * 8
+		address = int.from_bytes(packed, 'big')
+		offset, count, record = self._sections[version]
+		vrps = []
+		for prefixlen in self._prefixlens(version):
+			if prefixlen > route_prefixlen:
+				break
+			prefix = (address >> (bits - prefixlen)) << (bits - prefixlen)
+			key = prefix.to_bytes(len(packed), 'big') + bytes([prefixlen])
+			index = self._bisect(version, key)
+			while index < count:
+				start = offset + index * record.size
+				if self._mm[start:start + len(key)] != key:
+					break
+				_, _, maxlen, asn = record.unpack_from(self._mm, start)
+				vrps.append(VRP(version, prefix, prefixlen, maxlen, asn))
+				index += 1
+		return vrps
+
+	def by_asn(self, asn):
+		"""RTR routing table snapshot"""
+
+		# there's no ASN index in the file - so this is a scan, but of the raw records
+		asn = int(asn)
+		return [VRP(version, int.from_bytes(packed, 'big'), prefixlen, maxlen, asn)
+				for version in [4, 6]
+				for packed, prefixlen, maxlen, record_asn in self.entries(version) if record_asn == asn]
+
+	def show_vrps(self, cidr, show_long=False):
+		"""RTR routing table snapshot"""
+
+		# as RoutingTable.show_vrps() - so nothing at all unless there's an exact match
+		if not isinstance(cidr, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+			cidr = ipaddress.ip_network(cidr)
+		vrps = self.more_specifics(cidr, show_long)
+		if len(vrps) > 0 and (vrps[0].prefix, vrps[0].prefixlen) != (
+				int(cidr.network_address), cidr.prefixlen):
+			return []
+		return vrps
+
+	def show(self, cidr, show_long=False):
+		"""RTR routing table snapshot"""
+
+		# the same output as RoutingTable.show()
+		print("%-16s %-16s %6s %s" % ('ROUTE', 'ROA', 'MaxLen', 'ASN'))
+		for vrp in self.show_vrps(cidr, show_long):
+			if vrp.has_maxlen():
+				s_maxlen = '/' + str(vrp.maxlen)
+			else:
+				s_maxlen = ''
+			print("%-16s %-16s %6s %s" % (cidr, vrp.network(), s_maxlen, 'AS' + str(vrp.asn)))
+
+	def show_asn(self, asn):
+		"""RTR routing table snapshot"""
+
+		print("%-16s %6s %s" % ('ROA', 'MaxLen', 'ASN'))
+		for vrp in self.by_asn(asn):
+			if vrp.has_maxlen():
+				s_maxlen = '/' + str(vrp.maxlen)
+			else:
+				s_maxlen = ''
+			print("%-16s %6s %s" % (vrp.network(), s_maxlen, 'AS' + str(vrp.asn)))
+
+	def _prefixlens(self, version):
+		"""RTR routing table snapshot"""
+
+		# the prefix lengths in use, shortest first - a strided slice picks every record's prefixlen byte
+		if version not in self._lengths:
+			offset, count, record = self._sections[version]
+			start = offset + record.size - 8
+			self._lengths[version] = sorted(set(self._mm[start:start + count * record.size:record.size]))
+		return self._lengths[version]
+
+	def _bisect(self, version, key):
+		"""RTR routing table snapshot"""
+
+		# the first record that's not less than key - records
+		# compare as bytes, key is a leading part of one
+		offset, count, record = self._sections[version]
+		lo = 0
+		hi = count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			start = offset + mid * record.size
+			if self._mm[start:start + len(key)] < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
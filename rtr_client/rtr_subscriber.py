@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""RTR protocol subscriber"""
+
+#
+# Subscribers hear about VRPs as they are decoded - rfc8210router.subscribe(subscriber).
+# Override whichever methods are needed; nothing is kept unless a subscriber keeps it.
+#
+# announce() and withdraw() are the raw stream, one call per Prefix PDU - after a Reset Query that's
+# the complete set (500k or so VRPs) however little changed. commit() is the net change, and is
+# what most subscribers want. Only subscribers that override announce() or withdraw() get them.
+#
+
+class Subscriber(object):
+	"""RTR protocol subscriber"""
+
+	def cache_response(self, session_id):
+		"""RTR protocol subscriber"""
+
+	def announce(self, vrp):
+		"""RTR protocol subscriber"""
+		# each Prefix PDU as it's decoded - the VRP may already be in the table
+
+	def withdraw(self, vrp):
+		"""RTR protocol subscriber"""
+		# each Prefix PDU as it's decoded - the VRP may not be in the table
+
+	def commit(self, announce, withdraw):
+		"""RTR protocol subscriber"""
+		# just before end_of_data() - the net changes this update made to the routing table
+
+	def end_of_data(self, session_id, serial):
+		"""RTR protocol subscriber"""
+
+	def cache_reset(self):
+		"""RTR protocol subscriber"""
+
+	def reset(self):
+		"""RTR protocol subscriber"""
+		# a Reset Query was sent - a complete set of VRPs follows, netted against the table so that
+		# commit() still only carries the differences
+
+class RouteBuffer(Subscriber):
+	"""RTR protocol subscriber"""
+
+	# the opt-in buffer - collects the net announce/withdraw changes until cleared, or hands each
+	# End of Data's worth to batch(session_id, serial, announce, withdraw) and starts again
+
+	def __init__(self, batch=None):
+		"""RTR protocol subscriber"""
+		self._batch = batch
+		self.clear()
+
+	def routes(self):
+		"""RTR protocol subscriber"""
+		return self._routes
+
+	def clear(self):
+		"""RTR protocol subscriber"""
+		self._routes = {'announce': [], 'withdraw': []}
+
+	def commit(self, announce, withdraw):
+		"""RTR protocol subscriber"""
+		for op, vrps in [('announce', announce), ('withdraw', withdraw)]:
+			if self._routes[op]:
+				self._routes[op].extend(vrps)
+			else:
+				# nothing to add to - a full set can be large, so don't copy it
+				self._routes[op] = vrps
+
+	def end_of_data(self, session_id, serial):
+		"""RTR protocol subscriber"""
+		if self._batch is not None:
+			routes = self._routes
+			self.clear()
+			self._batch(session_id, serial, routes['announce'], routes['withdraw'])
+
+	def reset(self):
+		"""RTR protocol subscriber"""
+		self.clear()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""rtr_validate"""
+
+import sys
+import os
+import io
+import getopt
+import time
+import json
+import csv
+import gzip
+import bz2
+import struct
+import socket
+import asyncio
+import multiprocessing
+
+try:
+	from rtr_routes import RoutingTable, route_key
+	from rtr_interval import IntervalIndex, numpy
+	from rtr_session import RTRSession
+	from rtr_client import parse_cache
+	from rtr_show import read_file
+	from __init__ import __version__
+except ImportError:
+	from .rtr_routes import RoutingTable, route_key
+	from .rtr_interval import IntervalIndex, numpy
+	from .rtr_session import RTRSession
+	from .rtr_client import parse_cache
+	from .rtr_show import read_file
+	from .__init__ import __version__
+
+#
+# Route origin validation of a whole RIB dump. The VRPs are loaded once, then the workers are forked
+# - so they share the table copy-on-write and nothing big is pickled. The input is read in batches,
+# each batch is parsed and validated by a worker and the results are written out in input order.
+#
+
+MRT_TABLE_DUMP_V2 = 13
+# RFC 6396 RIB_IPV4_UNICAST, RIB_IPV6_UNICAST and the RFC 8050 ADDPATH versions of them
+MRT_RIB_SUBTYPES = {
+		2: (socket.AF_INET, 4, False), 4: (socket.AF_INET6, 16, False),
+		8: (socket.AF_INET, 4, True), 9: (socket.AF_INET6, 16, True)}
+
+BGP_ATTR_AS_PATH = 2
+AS_SEQUENCE = 2
+
+# the VRPs each worker validates against - IntervalIndex if numpy is installed, else RoutingTable
+_worker = {}
+
+def load_live(host, port, timeout=60):
+	"""rtr_validate"""
+
+	# sync once with a cache and hand back its routing table
+	async def _sync():
+		session = RTRSession(host, port, buffer_routes=False)
+		task = session.start()
+		try:
+			await asyncio.wait_for(session.wait_for_serial(), timeout)
+		finally:
+			session.close()
+			await task
+		return session.router.routingtable()
+
+	return asyncio.run(_sync())
+
+def text_route(line):
+	"""rtr_validate"""
+
+	# 'prefix asn', 'prefix,asn' (asn can be AS13335) or a bgpdump -m line - None for anything else
+	line = line.strip()
+	if not line or line[0] == '#':
+		return None
+	if '|' in line:
+		# TABLE_DUMP2|time|B|peer|peer_asn|prefix|as_path|...
+		fields = line.split('|')
+		if len(fields) < 7:
+			return None
+		path = fields[6].split()
+		if len(path) == 0 or not path[-1].isdigit():
+			# an empty path or an AS_SET at the end - there's no origin to match (RFC 6811)
+			return fields[5], 0
+		return fields[5], int(path[-1])
+	fields = line.replace(',', ' ').split()
+	if len(fields) < 2:
+		return None
+	return fields[0], int(fields[1].upper().replace('AS', '', 1))
+
+def mrt_records(fd):
+	"""rtr_validate"""
+
+	# (subtype, body) for each TABLE_DUMP_V2 RIB record - everything else is skipped
+	while True:
+		header = fd.read(12)
+		if len(header) < 12:
+			return
+		_, mrt_type, subtype, length = struct.unpack('!LHHL', header)
+		body = fd.read(length)
+		if mrt_type == MRT_TABLE_DUMP_V2 and subtype in MRT_RIB_SUBTYPES:
+			yield subtype, body
+
+def mrt_routes(subtype, body):
+	"""rtr_validate"""
+
+	# [(prefix, origin_asn), ...] - one per distinct origin across the record's RIB entries
+	family, size, addpath = MRT_RIB_SUBTYPES[subtype]
+	prefixlen = body[4]
+	n = (prefixlen + 7) // 8
+	prefix = '%s/%d' % (socket.inet_ntop(family, body[5:5 + n] + bytes(size - n)), prefixlen)
+	offset = 5 + n
+	count = struct.unpack_from('!H', body, offset)[0]
+	offset += 2
+	origins = []
+	for _ in range(count):
+		# peer index, originated time and (ADDPATH) path identifier
+		offset += 10 if addpath else 6
+		attributes_length = struct.unpack_from('!H', body, offset)[0]
+		offset += 2
+		origin = _origin_asn(body, offset, offset + attributes_length)
+		offset += attributes_length
+		if origin not in origins:
+			origins.append(origin)
+	return [(prefix, origin) for origin in origins]
+
+def masked_prefix(prefix):
+	"""rtr_validate"""
+
+	# the prefix with any host bits cleared (1.1.1.1/24 is
+	# validated as 1.1.1.0/24) - ValueError for a bad length
+	version, (packed, prefixlen) = route_key(prefix)
+	size = len(packed) * 8
+	if not 0 <= prefixlen <= size:
+		raise ValueError('%s: bad prefix length' % (prefix))
+	address = int.from_bytes(packed, 'big')
+	host = (1 << (size - prefixlen)) - 1
+	if address & host == 0:
+		return prefix
+	packed = (address & ~host).to_bytes(len(packed), 'big')
+	return '%s/%d' % (
+			socket.inet_ntop(socket.AF_INET if version == 4 else socket.AF_INET6, packed), prefixlen)
+
+def _origin_asn(body, offset, end):
+	"""rtr_validate"""
+
+	# the last ASN of the AS_PATH - 0 if it's empty or ends in an AS_SET (RFC 6811)
+	while offset < end:
+		flags, attr_type = body[offset], body[offset + 1]
+		if flags & 0x10:
+			length = struct.unpack_from('!H', body, offset + 2)[0]
+			offset += 4
+		else:
+			length = body[offset + 2]
+			offset += 3
+		if attr_type == BGP_ATTR_AS_PATH:
+			origin = 0
+			segment_end = offset + length
+			while offset < segment_end:
+				segment_type, segment_count = body[offset], body[offset + 1]
+				offset += 2 + 4 * segment_count
+				# TABLE_DUMP_V2 always has 4 byte ASNs (RFC 6396 section 4.3.4)
+				if segment_type == AS_SEQUENCE and segment_count > 0:
+					origin = struct.unpack_from('!L', body, offset - 4)[0]
+				else:
+					origin = 0
+			return origin
+		offset += length
+	return 0
+
+def _init_worker(engine):
+	"""rtr_validate"""
+
+	# the pool's initializer - with fork the engine is inherited, not pickled
+	_worker['engine'] = engine
+
+def _validate_shard(shard):
+	"""rtr_validate"""
+
+	# runs in a worker - returns ([(prefix, origin_asn, state), ...], lines skipped)
+	input_format, items = shard
+	routes = []
+	skipped = 0
+	for item in items:
+		try:
+			if input_format == 'mrt':
+				found = mrt_routes(*item)
+			else:
+				route = text_route(item)
+				found = [route] if route is not None else []
+			# parsed now so a bad line is skipped rather than failing the whole batch
+			routes += [(masked_prefix(prefix), origin_asn) for prefix, origin_asn in found]
+		except (ValueError, OSError, IndexError, struct.error):
+			skipped += 1
+
+	engine = _worker['engine']
+	if isinstance(engine, IntervalIndex):
+		states = engine.validate_many([prefix for prefix, origin_asn in routes],
+				[origin_asn for prefix, origin_asn in routes])
+	else:
+		states = engine.validate_many(routes)
+	return ([(prefix, origin_asn, state) for (prefix, origin_asn), state in zip(routes, states)],
+			skipped)
+
+def open_input(filename):
+	"""rtr_validate"""
+
+	# a binary file object - gzip and bzip2 dumps (as
+	# RouteViews and RIS publish them) are opened as such
+	if filename == '-':
+		# closing this leaves stdin open
+		return open(sys.stdin.fileno(), 'rb', closefd=False)
+	if filename.endswith('.gz'):
+		return gzip.open(filename, 'rb')
+	if filename.endswith('.bz2'):
+		return bz2.open(filename, 'rb')
+	return open(filename, 'rb')
+
+def is_mrt(fd):
+	"""rtr_validate"""
+
+	# an MRT common header with a type we know - a text file won't start with that
+	header = fd.peek(12)[:12]
+	if len(header) < 12:
+		return False
+	_, mrt_type, _, length = struct.unpack('!LHHL', header)
+	return mrt_type in (12, 13, 16, 17) and length < (1 << 24)
+
+def shards(filenames, input_format, batch):
+	"""rtr_validate"""
+
+	# (format, [items]) batches - MRT records are only framed here, the parsing is done by the workers
+	for filename in filenames:
+		with open_input(filename) as fd:
+			file_format = input_format
+			if file_format is None:
+				file_format = 'mrt' if is_mrt(fd) else 'text'
+			if file_format == 'mrt':
+				items = mrt_records(fd)
+			else:
+				items = io.TextIOWrapper(fd, errors='replace')
+			shard = []
+			for item in items:
+				shard.append(item)
+				if len(shard) >= batch:
+					yield file_format, shard
+					shard = []
+			if shard:
+				yield file_format, shard
+
+def write_json(row):
+	"""rtr_validate"""
+
+	# JSON lines - so the output can be streamed
+	sys.stdout.write(json.dumps({'prefix': row[0], 'origin_asn': row[1], 'state': row[2]}) + '\n')
+
+def doit(args=None):
+	"""rtr_validate"""
+
+	debug = 0
+	filename = 'data/routingtable.bin'
+	cache = None
+	input_format = None
+	output_format = 'csv'
+	workers = os.cpu_count() or 1
+	batch = 10000
+
+	usage = ('usage: rtr_validate '
+		 + '[-H|--help] '
+		 + '[-V|--version] '
+		 + '[-v|--verbose] '
+		 + '[-f FILENAME|--file=FILENAME] '
+		 + '[-c HOST[,PORT]|--cache=HOST[,PORT]] '
+		 + '[-F text|mrt|--format=text|mrt] '
+		 + '[-o csv|json|--output=csv|json] '
+		 + '[-w COUNT|--workers=COUNT] '
+		 + '[-b COUNT|--batch=COUNT] '
+		 + '[file ...]'
+		 )
+
+	try:
+		opts, args = getopt.getopt(args, 'HVvf:c:F:o:w:b:', [
+						'help',
+						'version',
+						'verbose',
+						'file=',
+						'cache=',
+						'format=',
+						'output=',
+						'workers=',
+						'batch='
+						])
+	except getopt.GetoptError:
+		sys.exit(usage)
+
+	for opt, arg in opts:
+		if opt in ('-H', '--help'):
+			sys.exit(usage)
+		if opt in ('-V', '--version'):
+			sys.exit('%s: version: %s' % (sys.argv[0], __version__))
+		elif opt in ('-v', '--verbose'):
+			debug += 1
+		elif opt in ('-f', '--file'):
+			filename = arg
+		elif opt in ('-c', '--cache'):
+			try:
+				cache = parse_cache(arg, None)
+			except ValueError:
+				sys.exit(usage)
+		elif opt in ('-F', '--format'):
+			if arg not in ('text', 'mrt'):
+				sys.exit(usage)
+			input_format = arg
+		elif opt in ('-o', '--output'):
+			if arg not in ('csv', 'json'):
+				sys.exit(usage)
+			output_format = arg
+		elif opt in ('-w', '--workers'):
+			workers = int(arg)
+		elif opt in ('-b', '--batch'):
+			batch = max(1, int(arg))
+
+	if len(args) == 0:
+		args = ['-']
+
+	t = time.perf_counter()
+	if cache:
+		host, port, _ = cache
+		try:
+			routingtable = load_live(host, port)
+		except (OSError, asyncio.TimeoutError) as e:
+			sys.exit('%s: %s' % (host, e))
+	else:
+		routingtable = RoutingTable()
+		read_file(routingtable, filename, debug)
+	# the workers share whichever is faster - and the table can go once the index is built
+	engine = IntervalIndex(routingtable) if numpy else routingtable
+	routingtable = None
+	if debug:
+		sys.stderr.write('debug: VRPs loaded in %.3f secs\n' % (time.perf_counter() - t))
+		sys.stderr.flush()
+
+	if output_format == 'csv':
+		writer = csv.writer(sys.stdout)
+		writer.writerow(['prefix', 'origin_asn', 'state'])
+		write = writer.writerow
+	else:
+		write = write_json
+
+	counts = {}
+	skipped = 0
+	pool = None
+	if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+		pool = multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker,
+				initargs=(engine,))
+	else:
+		_init_worker(engine)
+	try:
+		if pool:
+			results = pool.imap(_validate_shard, shards(args, input_format, batch))
+		else:
+			results = map(_validate_shard, shards(args, input_format, batch))
+		for rows, n_skipped in results:
+			skipped += n_skipped
+			for row in rows:
+				write(row)
+				counts[row[2]] = counts.get(row[2], 0) + 1
+	except KeyboardInterrupt:
+		sys.exit(1)
+	except OSError as e:
+		sys.exit('%s' % (e))
+	finally:
+		if pool:
+			pool.terminate()
+
+	sys.stdout.flush()
+	if skipped:
+		sys.stderr.write('%d lines skipped\n' % (skipped))
+	if debug:
+		sys.stderr.write('debug: %s in %.3f secs\n' % (
+				' '.join(['%s=%d' % (state, counts[state]) for state in sorted(counts)]),
+				time.perf_counter() - t))
+	sys.stderr.flush()
+	sys.exit(0)
+
+def main(args=None):
+	"""rtr_validate"""
+
+	if args is None:
+		args = sys.argv[1:]
+	doit(args)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""RTR routing table versions"""
+
+try:
+	from rtr_routes import RoutingTable, route_key, VALID, INVALID, NOT_FOUND
+	from rtr_subscriber import Subscriber
+except ImportError:
+	from .rtr_routes import RoutingTable, route_key, VALID, INVALID, NOT_FOUND
+	from .rtr_subscriber import Subscriber
+
+#
+# Readers (any thread) take publisher.current() and get a TableVersion that never changes - no
+# locks. A version is an immutable base table plus a small overlay of VRPs added and removed since
+# the base was built. Each End of Data publishes a new version with a fresh overlay; once the
+# overlay gets big it's folded into a new base. Nothing a reader holds is mutated, only replaced.
+#
+
+class TableVersion(object):
+	"""RTR routing table versions"""
+
+	def __init__(self, base, added, removed, session_id=0, serial=0, number=0):
+		"""RTR routing table versions"""
+
+		self._base = base
+		self._added = added
+		self._removed = removed
+		self.session_id = session_id
+		self.serial = serial
+		self.number = number
+
+	def overlay_size(self):
+		"""RTR routing table versions"""
+
+		return len(self._added) + len(self._removed)
+
+	def __len__(self):
+		"""RTR routing table versions"""
+
+		return len(self._base) + len(self._added) - len(self._removed)
+
+	def __contains__(self, vrp):
+		"""RTR routing table versions"""
+
+		return vrp in self._added or (vrp not in self._removed and vrp in self._base)
+
+	def __iter__(self):
+		"""RTR routing table versions"""
+
+		for vrp in self._base:
+			if vrp not in self._removed:
+				yield vrp
+		yield from self._added
+
+	def by_asn(self, asn):
+		"""RTR routing table versions"""
+
+		vrps = self._base.by_asn(asn)
+		if self._removed:
+			vrps = [vrp for vrp in vrps if vrp not in self._removed]
+		return sorted(vrps + self._added.by_asn(asn))
+
+	def covering(self, cidr):
+		"""RTR routing table versions"""
+
+		vrps = self._base.covering(cidr)
+		if self._removed:
+			vrps = [vrp for vrp in vrps if vrp not in self._removed]
+		if len(self._added) > 0:
+			vrps += self._added.covering(cidr)
+		return vrps
+
+	def validate(self, cidr, origin_asn):
+		"""RTR routing table versions"""
+
+		# RFC 6811 - returns (state, matched VRPs, covering VRPs)
+		_, key = route_key(cidr)
+		return self._base.validate_covering(self.covering(key), key[1], origin_asn)
+
+	def validate_many(self, routes, details=False):
+		"""RTR routing table versions"""
+
+		if details or self._removed:
+			# a removed VRP can change any answer - so take the long way round
+			results = [self.validate(cidr, origin_asn) for cidr, origin_asn in routes]
+			return results if details else [result[0] for result in results]
+		routes = list(routes)
+		states = self._base.validate_many(routes)
+		if len(self._added) == 0:
+			return states
+		# only additions - Valid in either wins, then Invalid in either
+		for ii, added_state in enumerate(self._added.validate_many(routes)):
+			if added_state == VALID or (added_state == INVALID and states[ii] == NOT_FOUND):
+				states[ii] = added_state
+		return states
+
+class TablePublisher(Subscriber):
+	"""RTR routing table versions"""
+
+	# fold the overlay into a new base once it's this big - every lookup pays for the overlay
+	max_overlay = 10000
+
+	def __init__(self, routingtable=None, session_id=0, serial=0):
+		"""RTR routing table versions"""
+
+		self._base = routingtable.copy() if routingtable is not None else RoutingTable()
+		self._added = RoutingTable()
+		self._removed = set()
+		self._number = 0
+		self._publish(session_id, serial)
+
+	@classmethod
+	def attach(cls, router):
+		"""RTR routing table versions"""
+
+		# start from whatever the router already has (a warm start) and follow its updates
+		try:
+			session_id = router.get_session_id()
+		except ValueError:
+			session_id = 0
+		publisher = cls(router.routingtable(), session_id, router.cache_serial_number())
+		router.subscribe(publisher)
+		return publisher
+
+	def current(self):
+		"""RTR routing table versions"""
+
+		# one attribute read - safe from any thread
+		return self._current
+
+	def commit(self, announce, withdraw):
+		"""RTR routing table versions"""
+
+		for vrp in withdraw:
+			if vrp in self._added:
+				self._added.withdraw(vrp)
+			else:
+				self._removed.add(vrp)
+		for vrp in announce:
+			if vrp in self._removed:
+				self._removed.discard(vrp)
+			else:
+				self._added.announce(vrp)
+
+	def end_of_data(self, session_id, serial):
+		"""RTR routing table versions"""
+
+		if len(self._added) + len(self._removed) > self.max_overlay:
+			# readers may still hold the old base - it's left alone and the new one shares what didn't change
+			self._base = self._base.updated(self._added, self._removed)
+			self._added = RoutingTable()
+			self._removed = set()
+		self._publish(session_id, serial)
+
+	def _publish(self, session_id, serial):
+		"""RTR routing table versions"""
+
+		# the overlay is copied (it's small) so the writer can carry on changing its own
+		self._number += 1
+		self._current = TableVersion(self._base, self._added.copy(), frozenset(self._removed), session_id,
+				serial, self._number)
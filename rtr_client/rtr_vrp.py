@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""RTR protocol Validated ROA Payload (VRP)"""
+
+import ipaddress
+
+class VRP(object):
+	"""RTR protocol Validated ROA Payload (VRP)"""
+
+	# one of these per ROA - so keep it small; ipaddress objects are only built when asked for
+	__slots__ = ('version', 'prefix', 'prefixlen', 'maxlen', 'asn')
+
+	_bits = {4: 32, 6: 128}
+
+	def __init__(self, version, prefix, prefixlen, maxlen, asn):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		bits = self._bits[version]
+		if prefixlen > bits or maxlen < prefixlen or maxlen > bits:
+			raise ValueError('%d/%d maxlen %d is not valid' % (prefix, prefixlen, maxlen))
+		if prefix & ((1 << (bits - prefixlen)) - 1):
+			raise ValueError('%d/%d has host bits set' % (prefix, prefixlen))
+		self.version = version
+		self.prefix = prefix
+		self.prefixlen = prefixlen
+		self.maxlen = maxlen
+		self.asn = asn
+
+	@classmethod
+	def from_network(cls, cidr, asn, maxlen=None):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		if not isinstance(cidr, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+			cidr = ipaddress.ip_network(cidr)
+		if not maxlen:
+			maxlen = cidr.prefixlen
+		return cls(cidr.version, int(cidr.network_address), cidr.prefixlen, int(maxlen), int(asn))
+
+	def network(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		if self.version == 6:
+			return ipaddress.IPv6Network((self.prefix, self.prefixlen))
+		return ipaddress.IPv4Network((self.prefix, self.prefixlen))
+
+	def key(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		# pytricia takes a (packed address, prefixlen) tuple - much cheaper than a string or ipaddress
+		return (self.prefix.to_bytes(self._bits[self.version] >> 3, 'big'), self.prefixlen)
+
+	def has_maxlen(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		return self.maxlen != self.prefixlen
+
+	def to_json(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		if self.has_maxlen():
+			return {'ip': str(self.network()), 'asn': self.asn, 'maxlen': self.maxlen}
+		return {'ip': str(self.network()), 'asn': self.asn}
+
+	def _tuple(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		return (self.version, self.prefix, self.prefixlen, self.maxlen, self.asn)
+
+	def __eq__(self, other):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		if not isinstance(other, VRP):
+			return NotImplemented
+		return self._tuple() == other._tuple()
+
+	def __lt__(self, other):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		return self._tuple() < other._tuple()
+
+	def __hash__(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		return hash(self._tuple())
+
+	def __str__(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		if self.has_maxlen():
+			return '%s-%d AS%d' % (self.network(), self.maxlen, self.asn)
+		return '%s AS%d' % (self.network(), self.asn)
+
+	def __repr__(self):
+		"""RTR protocol Validated ROA Payload (VRP)"""
+
+		return 'VRP(%d, %d, %d, %d, %d)' % self._tuple()
@@ -24,14 +24,19 @@ def main():
 		author_email='martin@cloudflare.com',
 		url='https://github.com/cloudflare/rpki-rtr-client',
 		license='BSD 3',
-		packages=['rtr_client']+find_packages(),
+		packages=['rtr_client']+find_packages(exclude=['tests']),
 		include_package_data=True,
 		install_requires=['pytricia'],
+		extras_require={'numpy': ['numpy']},
 		keywords='RFC9210, RPKI, RTR, Cloudflare',
 		entry_points={
 			'console_scripts': [
 				'rtr_client=rtr_client.rtr_client:main',
 				'rtr_show=rtr_client.rtr_show:main',
+				'rtr_validate=rtr_client.rtr_validate:main',
+				'rtr_query=rtr_client.rtr_query:main',
+				'rtr_mock=rtr_client.rtr_mock:main',
+				'rtr_bench=rtr_client.rtr_bench:main',
 			]
 		},
 		classifiers=[
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""RTR interval index tests"""
+
+import unittest
+
+from rtr_client.rtr_interval import IntervalIndex, RouteBatch, numpy
+from rtr_client.rtr_routes import RoutingTable
+from rtr_client.rtr_vrp import VRP
+from rtr_client.rtr_mock import VRPGenerator
+
+@unittest.skipIf(numpy is None, 'numpy not installed')
+class TestIntervalIndex(unittest.TestCase):
+	"""RTR interval index tests"""
+
+	def test_same_as_routingtable(self):
+		"""RTR interval index tests"""
+
+		# every answer the index gives has to be the one the trie gives
+		generator = VRPGenerator()
+		vrps = generator.vrps(2000, 500)
+		# IPv6 VRPs longer than a /64, AS0 and a second ASN on some prefixes
+		vrps += [VRP(6, vrp.prefix | (0xabcd << 32), 96, 112, vrp.asn) for vrp in vrps[-50:]]
+		vrps += [VRP(vrp.version, vrp.prefix, vrp.prefixlen, vrp.maxlen, 0) for vrp in vrps[:20]]
+		vrps += [VRP(vrp.version, vrp.prefix, vrp.prefixlen, vrp.prefixlen, vrp.asn + 1)
+				for vrp in vrps[20:40]]
+		routingtable = RoutingTable()
+		for vrp in set(vrps):
+			routingtable.announce(vrp)
+
+		# routes at, under and over each VRP's maxlen, its supernet and
+		# VRPs nobody has - from the VRP's ASN, another one and AS0
+		routes = []
+		for vrp in generator.sample(vrps, 1000) + generator.vrps(200, 50):
+			network = vrp.network()
+			for prefixlen in {network.prefixlen, vrp.maxlen, min(vrp.maxlen + 1, network.max_prefixlen),
+					max(network.prefixlen - 1, 0)}:
+				route = str(network.supernet(new_prefix=prefixlen) if prefixlen < network.prefixlen
+						else next(network.subnets(new_prefix=prefixlen)))
+				routes += [(route, vrp.asn), (route, vrp.asn + 1), (route, 0)]
+
+		expected = routingtable.validate_many(routes)
+		index = IntervalIndex(routingtable)
+		batch = RouteBatch([prefix for prefix, asn in routes], [asn for prefix, asn in routes])
+		self.assertEqual(list(index.validate_many(batch)), expected)
+		self.assertEqual(list(index.validate_many([prefix for prefix, asn in routes],
+				[asn for prefix, asn in routes])), expected)
+		self.assertGreater(len(batch.long_routes()), 0)
+
+		# the same batch against a changed table
+		for vrp in vrps[:500]:
+			routingtable.withdraw(vrp)
+		self.assertEqual(list(IntervalIndex(routingtable).validate_many(batch)),
+				routingtable.validate_many(routes))
+
+	def test_empty(self):
+		"""RTR interval index tests"""
+
+		index = IntervalIndex(RoutingTable())
+		self.assertEqual(list(index.validate_many(['1.1.1.0/24', '2001:db8::/32'], [13335, 13335])),
+				['NotFound', 'NotFound'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""RTR routing table journal tests"""
+
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+
+from rtr_client.rtr_journal import Journal
+from rtr_client.rtr_routes import RoutingTable
+from rtr_client.rtr_protocol import rfc8210router
+from rtr_client.rtr_client import dump_routes, SaveSchedule
+from rtr_client.rtr_snapshot import Snapshot
+from rtr_client.rtr_mock import VRPGenerator
+
+class TestJournal(unittest.TestCase):
+	"""RTR routing table journal tests"""
+
+	def setUp(self):
+		"""RTR routing table journal tests"""
+
+		self._directory = tempfile.TemporaryDirectory()
+		self.directory = os.path.join(self._directory.name, 'journal')
+		self.journal = Journal(self.directory)
+		generator = VRPGenerator()
+		# serial 1 is the base, then a delta to 2 and to 3
+		self.tables = {1: set(generator.vrps(30, 10))}
+		self.deltas = {}
+		vrps = sorted(self.tables[1])
+		self.deltas[2] = (generator.vrps(5, 2), vrps[:4])
+		self.deltas[3] = (vrps[:2] + generator.vrps(1, 1), sorted(self.deltas[2][0])[:3])
+		for serial in (2, 3):
+			announce, withdraw = self.deltas[serial]
+			self.tables[serial] = (self.tables[serial - 1] | set(announce)) - set(withdraw)
+
+	def tearDown(self):
+		"""RTR routing table journal tests"""
+
+		self._directory.cleanup()
+
+	def table(self, vrps):
+		"""RTR routing table journal tests"""
+
+		routingtable = RoutingTable()
+		for vrp in vrps:
+			routingtable.announce(vrp)
+		return routingtable
+
+	def load(self, serial=None, journal=None):
+		"""RTR routing table journal tests"""
+
+		routingtable = RoutingTable()
+		session_id, serial = (journal or self.journal).load(routingtable, serial)
+		return session_id, serial, set(routingtable)
+
+	def write(self):
+		"""RTR routing table journal tests"""
+
+		self.journal.compact(self.table(self.tables[1]), 7, 1)
+		for serial in (2, 3):
+			self.journal.append(7, serial, *self.deltas[serial])
+
+	def test_round_trip(self):
+		"""RTR routing table journal tests"""
+
+		self.assertEqual(self.load(), (None, None, set()))
+		self.write()
+		self.assertEqual(self.journal.serials(), [(7, 1), (7, 2), (7, 3)])
+		self.assertEqual([record[1:] for record in self.journal.records()],
+				[(serial,) + self.deltas[serial] for serial in (2, 3)])
+		self.assertEqual(self.load(), (7, 3, self.tables[3]))
+		for serial in (1, 2, 3):
+			self.assertEqual(self.load(serial), (7, serial, self.tables[serial]))
+		with self.assertRaises(IndexError):
+			self.load(4)
+
+	def test_compact(self):
+		"""RTR routing table journal tests"""
+
+		self.write()
+		self.assertGreater(self.journal.size(), 0)
+		self.journal.compact(self.table(self.tables[3]), 7, 3)
+		self.assertEqual(self.journal.size(), 0)
+		self.assertEqual(self.journal.serials(), [(7, 3)])
+		self.assertEqual(self.load(), (7, 3, self.tables[3]))
+		with self.assertRaises(IndexError):
+			self.load(2)
+
+		# compaction is due once the deltas outgrow the base
+		self.assertFalse(self.journal.needs_compaction())
+		self.journal.min_compact_size = 0
+		self.journal.append(7, 4, *self.deltas[2])
+		self.assertFalse(self.journal.needs_compaction())
+		self.journal.append(7, 5, list(self.tables[3]), [])
+		self.assertTrue(self.journal.needs_compaction())
+
+	def test_compact_from_snapshot(self):
+		"""RTR routing table journal tests"""
+
+		# a snapshot of the same serial becomes the base - any
+		# other serial (or no snapshot at all) and it's written
+		snapshot = os.path.join(self._directory.name, 'routingtable.bin')
+		Snapshot(snapshot).write(self.table(self.tables[3]), 7, 3)
+		self.write()
+		self.journal.compact(self.table(self.tables[3]), 7, 3, snapshot)
+		self.assertTrue(os.path.samefile(snapshot, self.journal.base_filename))
+		self.assertEqual(self.load(), (7, 3, self.tables[3]))
+
+		self.journal.compact(self.table(self.tables[2]), 7, 4, snapshot)
+		self.assertFalse(os.path.samefile(snapshot, self.journal.base_filename))
+		self.assertEqual(self.load(), (7, 4, self.tables[2]))
+
+		self.journal.compact(self.table(self.tables[1]), 7, 5,
+				os.path.join(self._directory.name, 'missing.bin'))
+		self.assertEqual(self.load(), (7, 5, self.tables[1]))
+
+	def test_bad_tail(self):
+		"""RTR routing table journal tests"""
+
+		# a crash part way through an append - the records
+		# before it are kept and the next append goes after them
+		self.write()
+		good = self.journal.size()
+		self.journal.append(7, 9, list(self.tables[1]), [])
+		with open(self.journal.journal_filename, 'r+b') as fd:
+			fd.truncate(self.journal.size() - 5)
+		self.assertEqual(self.load(), (7, 3, self.tables[3]))
+
+		journal = Journal(self.directory)
+		with contextlib.redirect_stderr(io.StringIO()):
+			journal.append(7, 4, [], sorted(self.tables[3])[:1])
+		self.assertEqual(journal.serials(), [(7, 1), (7, 2), (7, 3), (7, 4)])
+		self.assertEqual(self.load(journal=journal),
+				(7, 4, self.tables[3] - set(sorted(self.tables[3])[:1])))
+
+		# a record that doesn't match its crc ends the journal there
+		with open(self.journal.journal_filename, 'r+b') as fd:
+			fd.seek(good - 1)
+			fd.write(b'\xff')
+		self.assertEqual(journal.serials(), [(7, 1), (7, 2)])
+		self.assertEqual(self.load(journal=journal), (7, 2, self.tables[2]))
+
+	def test_compact_after_reset(self):
+		"""RTR routing table journal tests"""
+
+		# the End of Data of a reset and the start of the next update arrive together - the delta callback
+		# runs with the next update under way, so the compaction waits for its End of Data
+		self.write()
+		router = rfc8210router()
+		announce, withdraw = self.deltas[2]
+		router.process(router.cache_response(8) + router.prefix_pdus(self.tables[1])
+				+ router.end_of_data(8, 1) + router.cache_response(8) + router.prefix_pdus(announce))
+		self.assertTrue(router.in_cache_response())
+		with contextlib.redirect_stderr(io.StringIO()):
+			dump_routes(router, 1, 8, self.journal, reset=True,
+					routes={'announce': list(self.tables[1]), 'withdraw': []})
+			self.assertTrue(self.journal.deferred())
+			self.assertEqual(self.load()[:2], (7, 3))
+
+			router.process(router.prefix_pdus(withdraw, False) + router.end_of_data(8, 2))
+			save_schedule = SaveSchedule(os.path.join(self._directory.name, 'routingtable.bin'))
+			dump_routes(router, 2, 8, self.journal, routes={'announce': announce, 'withdraw': withdraw},
+					save_schedule=save_schedule)
+		self.assertFalse(self.journal.deferred())
+		self.assertEqual(self.load(), (8, 2, self.tables[2]))
+		self.assertEqual(self.journal.size(), 0)
+		# the saved table and the base are the one file
+		self.assertTrue(os.path.samefile(save_schedule.filename, self.journal.base_filename))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""RTR RFC 8210 protocol tests"""
+
+import random
+import struct
+import ipaddress
+import unittest
+
+from rtr_client.rtr_protocol import rfc8210router
+from rtr_client.rtr_subscriber import Subscriber, RouteBuffer
+from rtr_client.rtr_versions import TablePublisher
+from rtr_client.rtr_vrp import VRP
+from rtr_client.rtr_mock import VRPGenerator
+
+def feed(router, data, boundaries):
+	"""RTR RFC 8210 protocol tests"""
+
+	# as a connection would - whatever process() leaves is kept and the next chunk added to it
+	pending = b''
+	start = 0
+	for end in list(boundaries) + [len(data)]:
+		pending += data[start:end]
+		start = end
+		left = router.process(pending)
+		pending = pending[len(pending) - left:]
+	return pending
+
+class Recorder(Subscriber):
+	"""RTR RFC 8210 protocol tests"""
+
+	# every Prefix PDU as it's decoded, in order
+	def __init__(self, router):
+		"""RTR RFC 8210 protocol tests"""
+		self.routes = {'announce': [], 'withdraw': []}
+		router.subscribe(self)
+
+	def announce(self, vrp):
+		"""RTR RFC 8210 protocol tests"""
+		self.routes['announce'].append(vrp)
+
+	def withdraw(self, vrp):
+		"""RTR RFC 8210 protocol tests"""
+		self.routes['withdraw'].append(vrp)
+
+class TestProcess(unittest.TestCase):
+	"""RTR RFC 8210 protocol tests"""
+
+	def setUp(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		generator = VRPGenerator()
+		self.announce = generator.vrps(40, 20)
+		self.announce = generator.sample(self.announce, len(self.announce))
+		self.withdraw = self.announce[:7]
+		router = rfc8210router()
+		self.data = (router.cache_response(7) + router.prefix_pdus(self.announce)
+				+ router.end_of_data(7, 1) + router.cache_response(7)
+				+ router.prefix_pdus(self.withdraw, False) + router.end_of_data(7, 2))
+
+	def test_chunks(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# every byte boundary, fixed sizes that don't line up with the PDUs and random ones
+		rnd = random.Random(8210)
+		splits = [[n] for n in range(len(self.data))]
+		splits += [range(n, len(self.data), n) for n in (1, 3, 19, 21, 31, 33, 1000)]
+		splits += [sorted(rnd.sample(range(len(self.data)), 25)) for ii in range(20)]
+		for boundaries in splits:
+			router = rfc8210router(buffer_routes=True)
+			self.assertEqual(feed(router, self.data, boundaries), b'')
+			self.assertEqual(router.routes(), {'announce': self.announce, 'withdraw': self.withdraw})
+			self.assertEqual(sorted(router.routingtable()), sorted(self.announce[7:]))
+			self.assertEqual(router.cache_serial_number(), 2)
+
+	def test_type_change(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# IPv4 and IPv6 PDUs in short runs - and an IPv4 PDU with a longer length in the middle of a run
+		router = rfc8210router()
+		recorder = Recorder(router)
+		ipv4 = [vrp for vrp in self.announce if vrp.version == 4]
+		ipv6 = [vrp for vrp in self.announce if vrp.version == 6]
+		odd = ipv4[3]
+		padded = (struct.pack('!BBHLBBBxLL', 1, 4, 0, 24, 1, odd.prefixlen, odd.maxlen, odd.prefix,
+				odd.asn) + bytes(4))
+		data = (router.cache_response(7) + router.prefix_pdus(ipv4[:3]) + padded
+				+ router.prefix_pdus(ipv4[4:6]) + router.prefix_pdus(ipv6[:1]) + router.prefix_pdus(ipv4[6:7])
+				+ router.prefix_pdus(ipv6[1:]) + router.prefix_pdus(ipv4[7:]) + router.end_of_data(7, 1))
+		self.assertEqual(router.process(data), 0)
+		self.assertEqual(recorder.routes['announce'],
+				ipv4[:6] + ipv6[:1] + ipv4[6:7] + ipv6[1:] + ipv4[7:])
+		self.assertEqual(len(router.routingtable()), len(self.announce))
+		self.assertFalse(router.in_cache_response())
+
+	def test_same_length(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# a 20 byte Error Report in a run of IPv4 PDUs is still
+		# an Error Report - and processing stops after it
+		router = rfc8210router()
+		recorder = Recorder(router)
+		ipv4 = [vrp for vrp in self.announce if vrp.version == 4]
+		error = router.error_report(2, text='oops')
+		self.assertEqual(len(error), 20)
+		rest = router.prefix_pdus(ipv4[3:])
+		self.assertEqual(router.process(router.cache_response(7) + router.prefix_pdus(ipv4[:3]) + error
+				+ rest), len(rest))
+		self.assertEqual(recorder.routes['announce'], ipv4[:3])
+
+	def test_short_length(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# a length under 8 can't be framed - processing stops there and everything from it is left
+		router = rfc8210router()
+		recorder = Recorder(router)
+		bad = struct.pack('!BBHL', 1, 4, 0, 4)
+		data = (router.cache_response(7) + router.prefix_pdus(self.announce[:2]) + bad
+				+ router.prefix_pdus(self.announce[2:4]))
+		self.assertEqual(router.process(data), len(bad) + len(router.prefix_pdus(self.announce[2:4])))
+		self.assertEqual(recorder.routes['announce'], self.announce[:2])
+
+	def test_known_bytes(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		router = rfc8210router()
+		recorder = Recorder(router)
+		data = bytes.fromhex(
+				'01030007' '00000008'						# Cache Response, session 7
+				'01060000' '00000020' '01203000' '20010db8' '00000000'
+					'00000000' '00000000' '00003417'			# IPv6 2001:db8::/32-48 AS13335
+				'01060000' '00000020' '00808000' '20010db8' '00000001'
+					'00000002' '00000003' '0000fde8'			# withdraw 2001:db8:0:1:0:2:0:3/128 AS65000
+				'01040000' '00000014' '01181800' '01010100' '00003417')	# IPv4 1.1.1.0/24 AS13335
+		self.assertEqual(router.process(data), 0)
+		self.assertEqual(recorder.routes, {
+				'announce': [VRP(6, int(ipaddress.ip_address('2001:db8::')), 32, 48, 13335),
+					VRP(4, 0x01010100, 24, 24, 13335)],
+				'withdraw': [VRP(6, int(ipaddress.ip_address('2001:db8:0:1:0:2:0:3')), 128, 128, 65000)]})
+		self.assertEqual(str(recorder.routes['announce'][0].network()), '2001:db8::/32')
+
+class TestResync(unittest.TestCase):
+	"""RTR RFC 8210 protocol tests"""
+
+	def test_aborted_first_sync(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# a first sync that breaks off part way, then a
+		# complete one - every VRP has to reach the subscribers
+		vrps = VRPGenerator().vrps(8, 2)
+		router = rfc8210router()
+		buffer = RouteBuffer()
+		router.subscribe(buffer)
+		publisher = TablePublisher.attach(router)
+
+		router.reset_query()
+		router.process(router.cache_response(7) + router.prefix_pdus(vrps[:5]))
+		self.assertTrue(router.in_cache_response())
+
+		# the connection drops - a reconnect starts again with a Reset Query
+		router.reset_query()
+		router.process(router.cache_response(7) + router.prefix_pdus(vrps) + router.end_of_data(7, 1))
+
+		self.assertEqual(len(router.routingtable()), 10)
+		self.assertEqual(sorted(buffer.routes()['announce']), sorted(vrps))
+		self.assertEqual(buffer.routes()['withdraw'], [])
+		self.assertEqual(len(publisher.current()), 10)
+
+	def test_cache_reset_during_first_sync(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		vrps = VRPGenerator().vrps(8, 2)
+		router = rfc8210router()
+		buffer = RouteBuffer()
+		router.subscribe(buffer)
+
+		router.reset_query()
+		router.process(router.cache_response(7) + router.prefix_pdus(vrps[:5]) + router.cache_reset())
+		self.assertEqual(len(router.routingtable()), 0)
+		self.assertTrue(router.reset_needed())
+
+		router.reset_query()
+		router.process(router.cache_response(7) + router.prefix_pdus(vrps) + router.end_of_data(7, 1))
+		self.assertEqual(len(router.routingtable()), 10)
+		self.assertEqual(sorted(buffer.routes()['announce']), sorted(vrps))
+
+	def test_resync_of_full_table(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# a Reset Query over a complete table still only passes on the differences
+		vrps = VRPGenerator().vrps(8, 2)
+		router = rfc8210router()
+		buffer = RouteBuffer()
+		router.subscribe(buffer)
+		router.reset_query()
+		router.process(router.cache_response(7) + router.prefix_pdus(vrps) + router.end_of_data(7, 1))
+		buffer.clear()
+
+		recorder = Recorder(router)
+		router.reset_query()
+		router.process(router.cache_response(8) + router.prefix_pdus(vrps[1:]) + router.end_of_data(8, 1))
+		self.assertEqual(len(router.routingtable()), 9)
+		self.assertEqual(buffer.routes(), {'announce': [], 'withdraw': [vrps[0]]})
+		# announce() is the raw stream - the whole set
+		self.assertEqual(recorder.routes, {'announce': vrps[1:], 'withdraw': []})
+
+class TestEndOfData(unittest.TestCase):
+	"""RTR RFC 8210 protocol tests"""
+
+	def test_intervals(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		router = rfc8210router()
+		router.process(router.cache_response(7) + router.end_of_data(7, 5, 900, 300, 3600))
+		self.assertEqual(router.cache_serial_number(), 5)
+		self.assertEqual((router.refresh_interval(), router.retry_interval(), router.expire_interval()),
+				(900, 300, 3600))
+
+	def test_version_0(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# RFC 6810 has no intervals - the defaults apply, with the refresh interval from -t
+		vrps = VRPGenerator().vrps(8, 2)
+		router = rfc8210router()
+		router.default_refresh_interval = 120
+		router.process(router.cache_response(7, 0) + router.prefix_pdus(vrps, True, 0)
+				+ router.end_of_data(7, 5, version=0))
+		self.assertEqual(router.cache_serial_number(), 5)
+		self.assertEqual(len(router.routingtable()), 10)
+		self.assertFalse(router.in_cache_response())
+		self.assertEqual((router.refresh_interval(), router.retry_interval(), router.expire_interval()),
+				(120, 600, 7200))
+
+	def test_serial_notify_during_response(self):
+		"""RTR RFC 8210 protocol tests"""
+
+		# serial 6 is announced while the response for 5 is
+		# still arriving - another Serial Query is needed
+		router = rfc8210router()
+		router.process(router.cache_response(7) + router.serial_notify(7, 6) + router.end_of_data(7, 5))
+		self.assertEqual(router.cache_serial_number(), 5)
+		self.assertEqual(router.latest_serial_number(), 6)
+		self.assertTrue(router.notified())
+
+		# across the wrap
+		router.serial_query(0xfffffffe)
+		router.process(router.cache_response(7) + router.serial_notify(7, 1)
+				+ router.end_of_data(7, 0xffffffff))
+		self.assertEqual(router.latest_serial_number(), 1)
+
+		# a first sync to a serial a long way from 0
+		router.reset_query()
+		router.process(router.cache_response(7) + router.end_of_data(7, 0x90000000))
+		self.assertEqual(router.latest_serial_number(), 0x90000000)
+		self.assertFalse(router.notified())
+
+if __name__ == '__main__':
+	unittest.main()
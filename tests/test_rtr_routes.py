@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""RTR protocol basic Routing Table support tests"""
+
+import unittest
+
+from rtr_client.rtr_routes import RoutingTable, route_key, VALID, INVALID, NOT_FOUND
+from rtr_client.rtr_vrp import VRP
+from rtr_client.rtr_mock import VRPGenerator
+
+class TestValidate(unittest.TestCase):
+	"""RTR protocol basic Routing Table support tests"""
+
+	def setUp(self):
+		"""RTR protocol basic Routing Table support tests"""
+
+		self.routingtable = RoutingTable()
+		for cidr, asn, maxlen in [
+				('1.1.0.0/16', 13335, 24),
+				('1.1.1.0/24', 64500, None),
+				('10.0.0.0/8', 0, None),
+				('2001:db8::/32', 13335, 48),
+			]:
+			self.routingtable.announce(VRP.from_network(cidr, asn, maxlen))
+
+	def test_states(self):
+		"""RTR protocol basic Routing Table support tests"""
+
+		state, matched, covering = self.routingtable.validate('1.1.2.0/24', 13335)
+		self.assertEqual(state, VALID)
+		self.assertEqual(matched, [VRP.from_network('1.1.0.0/16', 13335, 24)])
+		self.assertEqual(len(covering), 1)
+
+		state, matched, covering = self.routingtable.validate('1.1.2.0/24', 64501)
+		self.assertEqual((state, matched, len(covering)), (INVALID, [], 1))
+
+		self.assertEqual(self.routingtable.validate('8.8.8.0/24', 15169), (NOT_FOUND, [], []))
+		self.assertEqual(self.routingtable.validate('2001:db9::/32', 13335), (NOT_FOUND, [], []))
+
+		# either of two covering VRPs can make it valid
+		self.assertEqual(self.routingtable.validate('1.1.1.0/24', 64500)[0], VALID)
+		self.assertEqual(self.routingtable.validate('1.1.1.0/24', 13335)[0], VALID)
+
+	def test_maxlen(self):
+		"""RTR protocol basic Routing Table support tests"""
+
+		self.assertEqual(self.routingtable.validate('1.1.0.0/16', 13335)[0], VALID)
+		self.assertEqual(self.routingtable.validate('1.1.2.0/24', 13335)[0], VALID)
+		self.assertEqual(self.routingtable.validate('1.1.2.0/25', 13335)[0], INVALID)
+		self.assertEqual(self.routingtable.validate('2001:db8:1::/48', 13335)[0], VALID)
+		self.assertEqual(self.routingtable.validate('2001:db8:1::/49', 13335)[0], INVALID)
+		# no maxlen is the prefix length
+		self.assertEqual(self.routingtable.validate('1.1.1.128/25', 64500)[0], INVALID)
+
+	def test_as0(self):
+		"""RTR protocol basic Routing Table support tests"""
+
+		# RFC 7607 - an AS0 VRP covers but never matches, and neither does an AS0 origin
+		self.assertEqual(self.routingtable.validate('10.1.0.0/16', 0),
+				(INVALID, [], [VRP.from_network('10.0.0.0/8', 0)]))
+		self.assertEqual(self.routingtable.validate('10.0.0.0/8', 64500)[0], INVALID)
+		self.assertEqual(self.routingtable.validate('1.1.0.0/16', 0)[0], INVALID)
+
+	def test_validate_many(self):
+		"""RTR protocol basic Routing Table support tests"""
+
+		generator = VRPGenerator()
+		for vrp in generator.vrps(200, 50):
+			self.routingtable.announce(vrp)
+		# a mix of exact, more specific and unrelated routes, each from a matching and a different ASN
+		routes = []
+		for vrp in generator.vrps(100, 25) + generator.sample(list(self.routingtable), 100):
+			network = vrp.network()
+			for prefixlen in (network.prefixlen, min(network.prefixlen + 4, network.max_prefixlen)):
+				route = str(next(network.subnets(new_prefix=prefixlen)))
+				routes += [(route, vrp.asn), (route, vrp.asn + 1), (route, 0)]
+
+		states = self.routingtable.validate_many(routes)
+		self.assertEqual(states, [self.routingtable.validate(cidr, asn)[0] for cidr, asn in routes])
+		self.assertEqual(set(states), {VALID, INVALID, NOT_FOUND})
+		self.assertEqual(self.routingtable.validate_many(routes, True),
+				[self.routingtable.validate(cidr, asn) for cidr, asn in routes])
+
+	def test_route_key(self):
+		"""RTR protocol basic Routing Table support tests"""
+
+		key = (bytes([1, 1, 1, 0]), 24)
+		self.assertEqual(route_key('1.1.1.0/24'), (4, key))
+		self.assertEqual(route_key(VRP.from_network('1.1.1.0/24', 13335)), (4, key))
+		self.assertEqual(route_key(key), (4, key))
+		self.assertEqual(route_key('1.1.1.1'), (4, (bytes([1, 1, 1, 1]), 32)))
+		self.assertEqual(route_key('2001:db8::/32'),
+				(6, (bytes([0x20, 0x01, 0x0d, 0xb8]) + bytes(12), 32)))
+
+if __name__ == '__main__':
+	unittest.main()
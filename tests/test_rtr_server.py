@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""RTR cache server tests"""
+
+import struct
+import unittest
+
+from rtr_client.rtr_server import (RTRServer, CORRUPT_DATA, NO_DATA_AVAILABLE,
+		UNSUPPORTED_PROTOCOL_VERSION, UNSUPPORTED_PDU_TYPE, UNEXPECTED_PROTOCOL_VERSION)
+from rtr_client.rtr_routes import RoutingTable
+from rtr_client.rtr_protocol import rfc8210router
+from rtr_client.rtr_mock import VRPGenerator, MockCache
+from rtr_client.rtr_vrp import VRP
+
+_pdu_header = struct.Struct('!BBHL')
+
+class Transport(object):
+	"""RTR cache server tests"""
+
+	# just enough of an asyncio transport - everything written is kept
+	def __init__(self):
+		"""RTR cache server tests"""
+		self.data = b''
+		self.closed = False
+
+	def write(self, data):
+		"""RTR cache server tests"""
+		self.data += bytes(data)
+
+	def close(self):
+		"""RTR cache server tests"""
+		self.closed = True
+
+	def is_closing(self):
+		"""RTR cache server tests"""
+		return self.closed
+
+	def get_extra_info(self, name):
+		"""RTR cache server tests"""
+		return ('192.0.2.1', 8282) if name == 'peername' else None
+
+def reset_query(version=1):
+	"""RTR cache server tests"""
+
+	return _pdu_header.pack(version, 2, 0, 8)
+
+def serial_query(session_id, serial, version=1):
+	"""RTR cache server tests"""
+
+	return _pdu_header.pack(version, 1, session_id, 12) + struct.pack('!L', serial)
+
+def pdus(data):
+	"""RTR cache server tests"""
+
+	# [(version, pdu_type, field, body), ...] - Prefix PDUs become (version, type, 'A' or 'W', VRP)
+	result = []
+	offset = 0
+	while offset < len(data):
+		version, pdu_type, field, length = _pdu_header.unpack_from(data, offset)
+		body = data[offset + _pdu_header.size:offset + length]
+		if pdu_type == 4:
+			flags, prefixlen, maxlen, prefix, asn = struct.unpack('!BBBxLL', body)
+			body = VRP(4, prefix, prefixlen, maxlen, asn)
+			field = 'A' if flags & 1 else 'W'
+		elif pdu_type == 6:
+			flags, prefixlen, maxlen, hi, lo, asn = struct.unpack('!BBBxQQL', body)
+			body = VRP(6, (hi << 64) | lo, prefixlen, maxlen, asn)
+			field = 'A' if flags & 1 else 'W'
+		result.append((version, pdu_type, field, body))
+		offset += length
+	return result
+
+class TestServer(unittest.TestCase):
+	"""RTR cache server tests"""
+
+	def setUp(self):
+		"""RTR cache server tests"""
+
+		self.routingtable = RoutingTable()
+		self.server = RTRServer(lambda: self.routingtable, session_id=7, max_history=3)
+		self.generator = VRPGenerator()
+
+	def connect(self):
+		"""RTR cache server tests"""
+
+		protocol = self.server.protocol(self.server)
+		protocol.connection_made(Transport())
+		return protocol
+
+	def query(self, data, protocol=None):
+		"""RTR cache server tests"""
+
+		protocol = protocol or self.connect()
+		protocol.transport.data = b''
+		protocol.data_received(data)
+		return pdus(protocol.transport.data)
+
+	def update(self, announce, withdraw, reset=False):
+		"""RTR cache server tests"""
+
+		for vrp in announce:
+			self.routingtable.announce(vrp)
+		for vrp in withdraw:
+			self.routingtable.withdraw(vrp)
+		self.server.update(announce, withdraw, reset)
+
+	def prefixes(self, response):
+		"""RTR cache server tests"""
+
+		# Cache Response ... End of Data - the (flag, VRP) pairs in between
+		self.assertEqual(response[0][:3], (1, 3, 7))
+		self.assertEqual(response[-1][:3], (1, 7, 7))
+		self.assertEqual(struct.unpack_from('!L', response[-1][3])[0], self.server.serial)
+		return [(flag, vrp) for version, pdu_type, flag, vrp in response[1:-1]]
+
+	def test_full(self):
+		"""RTR cache server tests"""
+
+		vrps = self.generator.vrps(20, 5)
+		self.update(vrps, [], True)
+		response = self.prefixes(self.query(reset_query()))
+		self.assertEqual(sorted(response), sorted(('A', vrp) for vrp in vrps))
+
+	def test_delta_merge(self):
+		"""RTR cache server tests"""
+
+		vrps = self.generator.vrps(20, 5)
+		added = self.generator.vrps(6, 2)
+		more = self.generator.vrps(3, 1)
+		self.update(vrps, [], True)
+		self.update(added, vrps[:2])
+		# the first two back, one added VRP gone again and a few more
+		self.update(vrps[:2] + more, added[:1])
+		self.assertEqual(self.server.serial, 3)
+
+		# from 1 - the withdraw and re-announce cancel out, as do the announce and withdraw of added[0]
+		response = self.prefixes(self.query(serial_query(7, 1)))
+		self.assertEqual(sorted(response), sorted(('A', vrp) for vrp in added[1:] + more))
+
+		# from 2 - withdraws first
+		response = self.prefixes(self.query(serial_query(7, 2)))
+		self.assertEqual(response[0], ('W', added[0]))
+		self.assertEqual(sorted(response[1:]), sorted(('A', vrp) for vrp in vrps[:2] + more))
+
+		# from 3 - nothing
+		self.assertEqual(self.prefixes(self.query(serial_query(7, 3))), [])
+
+		# what a router at serial 1 ends up with is what's being served
+		routingtable = set(vrps)
+		for flag, vrp in self.prefixes(self.query(serial_query(7, 1))):
+			if flag == 'A':
+				routingtable.add(vrp)
+			else:
+				routingtable.discard(vrp)
+		self.assertEqual(sorted(routingtable), sorted(self.routingtable))
+
+	def test_cache_reset(self):
+		"""RTR cache server tests"""
+
+		self.update(self.generator.vrps(10, 2), [], True)
+		for _ in range(4):
+			self.update(self.generator.vrps(1, 0), [])
+		self.assertEqual(self.server.serial, 5)
+
+		# max_history is 3 - so 2 is the oldest serial there's a delta from
+		self.assertEqual(len(self.prefixes(self.query(serial_query(7, 2)))), 3)
+		for serial in (1, 0, 6, 0x80000000):
+			self.assertEqual(self.query(serial_query(7, serial)), [(1, 8, 0, b'')])
+		# another session's serial means nothing here
+		self.assertEqual(self.query(serial_query(8, 4)), [(1, 8, 0, b'')])
+
+		# a reset throws the history away
+		self.update(self.generator.vrps(3, 0), [], True)
+		self.assertEqual(self.query(serial_query(7, 5)), [(1, 8, 0, b'')])
+
+	def test_versions(self):
+		"""RTR cache server tests"""
+
+		vrps = self.generator.vrps(5, 2)
+		self.update(vrps, [], True)
+
+		# version 0 - the whole response in version 0 and a 12 byte End of Data
+		response = self.query(reset_query(0))
+		self.assertEqual({version for version, pdu_type, field, body in response}, {0})
+		self.assertEqual(len(response[-1][3]), 4)
+		self.assertEqual(len(response), len(vrps) + 2)
+
+		# a router that changes version part way is told so and dropped
+		protocol = self.connect()
+		self.query(reset_query(1), protocol)
+		response = self.query(serial_query(7, 1, 0), protocol)
+		self.assertEqual([pdu_type for version, pdu_type, field, body in response], [10])
+		self.assertEqual(response[0][:3], (1, 10, UNEXPECTED_PROTOCOL_VERSION))
+		self.assertTrue(protocol.transport.closed)
+
+		# one we don't speak gets our highest version
+		protocol = self.connect()
+		response = self.query(reset_query(2), protocol)
+		self.assertEqual(response[0][:3], (1, 10, UNSUPPORTED_PROTOCOL_VERSION))
+		self.assertTrue(protocol.transport.closed)
+
+	def test_errors(self):
+		"""RTR cache server tests"""
+
+		# nothing to serve yet
+		protocol = self.connect()
+		self.assertEqual(self.query(reset_query(), protocol)[0][:3], (1, 10, NO_DATA_AVAILABLE))
+		self.assertTrue(protocol.transport.closed)
+		self.update(self.generator.vrps(5, 2), [], True)
+
+		# an Error Report from the router isn't answered and the connection stays up
+		protocol = self.connect()
+		error = self.server.router.error_report(2, text='no data')
+		self.assertEqual(self.query(error, protocol), [])
+		self.assertFalse(protocol.transport.closed)
+		self.assertEqual(len(self.prefixes(self.query(reset_query(), protocol))), 7)
+
+		# PDUs a router doesn't send and lengths that are wrong
+		for data, error_code in [
+				(_pdu_header.pack(1, 3, 7, 8), UNSUPPORTED_PDU_TYPE),
+				(_pdu_header.pack(1, 2, 0, 12) + bytes(4), CORRUPT_DATA),
+				(_pdu_header.pack(1, 2, 0, 4), CORRUPT_DATA),
+			]:
+			protocol = self.connect()
+			self.assertEqual(self.query(data, protocol)[0][:3], (1, 10, error_code))
+			self.assertTrue(protocol.transport.closed)
+
+class TestMockCache(unittest.TestCase):
+	"""RTR cache server tests"""
+
+	def test_replay(self):
+		"""RTR cache server tests"""
+
+		# synthetic VRPs on top of a replay are the serial after
+		# the dump's - a Serial Query from it gets just them
+		router = rfc8210router()
+		vrps = VRPGenerator(1).vrps(10, 2)
+		dump = router.cache_response(9) + router.prefix_pdus(vrps) + router.end_of_data(9, 42)
+		cache = MockCache(5, 1, replay=dump)
+		self.assertEqual((cache.session_id, cache.serial, len(cache.routingtable)), (9, 43, 18))
+
+		protocol = cache.protocol(cache)
+		protocol.connection_made(Transport())
+		protocol.data_received(reset_query())
+		self.assertEqual(protocol.transport.data, dump)
+		protocol.transport.data = b''
+		protocol.data_received(serial_query(9, 42))
+		response = pdus(protocol.transport.data)
+		self.assertEqual([(pdu_type, field) for version, pdu_type, field, body in response],
+				[(3, 9)] + [(4, 'A')] * 5 + [(6, 'A'), (7, 9)])
+		self.assertEqual(sorted(body for version, pdu_type, field, body in response[1:-1]),
+				sorted(set(cache.routingtable) - set(vrps)))
+
+		# without any it's the dump's serial
+		cache = MockCache(replay=dump)
+		self.assertEqual((cache.session_id, cache.serial, len(cache.routingtable)), (9, 42, 12))
+
+if __name__ == '__main__':
+	unittest.main()
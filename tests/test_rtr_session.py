@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""RTR asyncio session tests"""
+
+import asyncio
+import unittest
+
+from rtr_client.rtr_protocol import rfc8210router
+from rtr_client.rtr_session import RTRSession
+from rtr_client.rtr_mock import MockCache
+
+class TestWarmStart(unittest.TestCase):
+	"""RTR asyncio session tests"""
+
+	def test_same_serial(self):
+		"""RTR asyncio session tests"""
+
+		# the table is restored after the session is made (as rtr_client does it) - a cache that's still
+		# at that serial sends an empty update, which isn't a delta
+		async def run():
+			cache = MockCache(80, 20)
+			await cache.start('127.0.0.1', 0)
+			port = cache.addresses()[0][1]
+			router = rfc8210router()
+			session = RTRSession('127.0.0.1', port, router=router)
+			deltas = []
+			session.add_callback('delta', lambda session, delta: deltas.append(delta))
+
+			for vrp in cache.routingtable:
+				router.routingtable().announce(vrp)
+			router.set_session_id(cache.session_id)
+			router.set_cache_serial_number(cache.serial)
+			router.set_latest_serial_number(cache.serial)
+
+			task = session.start()
+			try:
+				serial = await asyncio.wait_for(session.wait_for_serial(), 10)
+			finally:
+				session.close()
+				await task
+				cache.close()
+			return serial, deltas
+
+		serial, deltas = asyncio.run(run())
+		self.assertEqual(serial, 1)
+		self.assertEqual(deltas, [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""RTR routing table versions tests"""
+
+import unittest
+
+from rtr_client.rtr_versions import TablePublisher
+from rtr_client.rtr_routes import RoutingTable
+from rtr_client.rtr_vrp import VRP
+from rtr_client.rtr_mock import VRPGenerator
+
+class TestFold(unittest.TestCase):
+	"""RTR routing table versions tests"""
+
+	def test_fold(self):
+		"""RTR routing table versions tests"""
+
+		# a version a reader holds doesn't change when the overlay is folded into a new base
+		generator = VRPGenerator()
+		vrps = generator.vrps(200, 50)
+		routingtable = RoutingTable()
+		for vrp in vrps:
+			routingtable.announce(vrp)
+		publisher = TablePublisher(routingtable, 7, 1)
+		publisher.max_overlay = 20
+		held = publisher.current()
+
+		# more specifics and new ASNs for prefixes the base has, as well as VRPs it doesn't
+		added = generator.vrps(10, 5) + [
+				VRP(vrp.version, vrp.prefix, vrp.prefixlen, vrp.maxlen, vrp.asn + 1) for vrp in vrps[:10]]
+		removed = vrps[5:15] + vrps[-5:]
+		publisher.commit(added, removed)
+		publisher.end_of_data(7, 2)
+		current = publisher.current()
+		self.assertEqual(current.overlay_size(), 0)
+
+		expected = (set(vrps) | set(added)) - set(removed)
+		self.assertEqual(sorted(current), sorted(expected))
+		self.assertEqual(len(current), len(expected))
+		self.assertEqual(sorted(held), sorted(vrps))
+		for vrp in added + removed:
+			self.assertEqual(vrp in current, vrp in expected)
+			self.assertEqual(vrp in held, vrp in vrps)
+			self.assertEqual(sorted(current.by_asn(vrp.asn)),
+					sorted(v for v in expected if v.asn == vrp.asn))
+			self.assertEqual(sorted(held.by_asn(vrp.asn)), sorted(v for v in vrps if v.asn == vrp.asn))
+
+		# the router's own table was copied, not shared
+		routingtable.withdraw(vrps[0])
+		self.assertIn(vrps[0], held)
+		self.assertIn(vrps[0], current)
+
+if __name__ == '__main__':
+	unittest.main()